@@ -1,6 +1,22 @@
-"""Contains the main function launching the program."""
+"""Contains the main function launching the program.
 
-from frontend.interface import UserInterface as ui
+Without arguments the interactive menu is started, otherwise a command
+    of the non-interactive command line is run. See frontend.cli.
+Setting OFF_PROFILE to a directory profiles every menu action and Brain
+    operation in it, see class ActionProfiler.
+"""
+
+import sys
+from backend.brain import Brain
+from backend.profiler import ActionProfiler
+from frontend.interface import UserInterface as ui, MENU_ACTIONS
+from frontend import cli
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli.main(sys.argv[1:]))
+    profiler = ActionProfiler.from_env()
+    if profiler is not None:
+        profiler.instrument(Brain)
+        profiler.instrument(ui, MENU_ACTIONS)
     ui = ui()
@@ -1,27 +1,54 @@
 """Contains the class APISocket."""
 
-import requests as r
+import time
+from backend.http_client import HttpClient
+from backend.ingest_telemetry import IngestTelemetry
 from config import api_downloads as api
 
 
 class APISocket:
     """This class acts as a socket with the openfoodfacts API.
 
-    Class leverages requests library in order to query APIs over HTTP.
-        See requests documentation for additional information. In the
+    Class leverages requests library in order to query APIs over HTTP,
+        through an HttpClient which rate limits, times out and retries
+        requests. See requests documentation for additional information. In the
         present case requests are made to the OpenFoodFacts API.
         requests and url are defined in the requests file inside the
         config folder. Refer to OpenFoodFacts API documentation for
         further information :
         https://documenter.getpostman.com/view/8470508/SVtN3Wzy
+
+    Args:
+        base_url: str, Where requests to OpenFoodFacts are sent instead.
+            Defaults to API_URL in the api downloads config file.
+        http: The HttpClient to send requests with, a new one if None.
+
+    Attributes:
+        telemetry: The IngestTelemetry requests, retries and rejected
+            products are counted in.
     """
 
-    def __init__(self):
+    def __init__(self, base_url=None, http=None):
         """Inits an instance of APISocket."""
 
+        self.base_url = (base_url or api.API_URL).rstrip("/")
         self.raw_categories = []
         self.raw_products = []
         self.cleaned_products = []
+        self.telemetry = IngestTelemetry()
+        self.http = http or HttpClient(
+            on_retry=lambda reason: self.telemetry.retry(reason))
+
+    def url(self, off_url):
+        """Returns where to request an OpenFoodFacts url.
+
+        Urls kept in the db always point to OpenFoodFacts, only requests
+            go to base_url.
+        """
+
+        if off_url.startswith(api.OFF_URL):
+            return self.base_url + off_url[len(api.OFF_URL):]
+        return off_url
 
     def request_categories(self):
         """Fetches relevant categories from the openfoodfacts API.
@@ -34,10 +61,52 @@ class APISocket:
         """
 
         print("Requesting categories from the OpenFoodFacts API")
-        self.raw_categories = (r.get(f"{api.off_urls['categories']}")).json()
+        self.raw_categories = self.http.get(
+            self.url(api.off_urls['categories'])).json()
         print("Data received")
         return self.raw_categories
 
+    def request_taxonomy(self):
+        """Fetches the taxonomy of categories, with their parents.
+
+        Returns:
+            dict: The entry of each category by id.
+        """
+
+        print("Requesting the taxonomy of categories")
+        return self.http.get(self.url(api.off_urls['taxonomy'])).json()
+
+    def download_products(self, category_url):
+        """Downloads the products of a category, from any thread.
+
+        Nothing is stored or counted, see use_download().
+
+        Args:
+            category_url: The url of the specified category.
+
+        Returns:
+            tuple: The list of products retrieved from the API, the
+                seconds the request took and the bytes downloaded.
+        """
+
+        start = time.perf_counter()
+        response = self.http.get(
+            f"{self.url(category_url)}.json()&page_size="
+            f"{api.PAGE_SIZE}&fields={api.PROD_FIELDS}")
+        raw_data = response.json()
+        return (raw_data["products"], time.perf_counter() - start,
+                len(response.content))
+
+    def use_download(self, download):
+        """Counts a download and keeps its products as the raw products.
+
+        Args:
+            download: tuple, As returned by download_products().
+        """
+
+        self.raw_products, seconds, size = download
+        self.telemetry.request(seconds, size)
+
     def request_products(self, category_url):
         """Fetches products from a specific category.
 
@@ -48,15 +117,14 @@ class APISocket:
             raw_data: The list of products retrieved from the API.
         """
 
-        raw_data = (r.get(f"{category_url}.json()&page_size="
-                          f"{api.PAGE_SIZE}&fields={api.PROD_FIELDS}")).json()
-        self.raw_products = raw_data["products"]
+        self.use_download(self.download_products(category_url))
 
     def cleaning(self):
         """Cleans all products form off using clean_product."""
 
-        for elt in self.raw_products:
-            self.clean_product(elt)
+        with self.telemetry.stage('clean'):
+            for elt in self.raw_products:
+                self.clean_product(elt)
 
     def clean_product(self, elt):
         """Cleans a specified product.
@@ -82,10 +150,16 @@ class APISocket:
                     if self.cleaned_products:
                         if self.not_in_clean(elt):
                             self.cleaned_products.append(elt)
+                        else:
+                            self.telemetry.reject('duplicate')
                     else:
                         self.cleaned_products.append(elt)
+                else:
+                    self.telemetry.reject('empty_field')
             except KeyError:
-                pass
+                self.telemetry.reject('missing_field')
+        else:
+            self.telemetry.reject('missing_field')
 
     def not_in_clean(self, elt):
         """Checks if a product is already in the cleaned_product list.
@@ -103,14 +177,19 @@ class APISocket:
                 return False
         return True
 
-    def request_cleaned_products(self, category_url):
+    def request_cleaned_products(self, category_url, download=None):
         """Requests products from OFF and cleans them.
 
         Args:
             category_url: The url of the categroy from which products
                 will be requested.
+            download: tuple, The products downloaded already, with
+                download_products(), if any.
         """
 
         self.cleaned_products = []
-        self.request_products(category_url)
+        if download is None:
+            self.request_products(category_url)
+        else:
+            self.use_download(download)
         self.cleaning()
@@ -0,0 +1,176 @@
+"""Contains the class SubstituteBatch."""
+
+import csv
+import json
+import multiprocessing
+from collections import namedtuple
+from itertools import islice
+from backend.category_index import CategoryIndex
+from backend.nutrition_grade import to_letter
+from backend.ranking import SubstituteRanker
+from config import misc
+
+CatalogItem = namedtuple('CatalogItem', 'id french_name nutrition_grades')
+
+# Catalog of the current worker process, set by init_worker.
+WORKER = {}
+
+
+def init_worker(records, brands, stores, weights, top_k):
+    """Builds the catalog of a worker process.
+
+    Args:
+        records: list, The id, name, grade and category ids of each
+            product.
+        brands: dict, The brand ids of each product id.
+        stores: dict, The store ids of each product id.
+        weights: dict, The weights of the ranker.
+        top_k: int, The number of substitutes to keep per product.
+    """
+
+    index = CategoryIndex()
+    categories = {}
+    items = {}
+    for product_id, name, grade, category_ids in records:
+        item = items[product_id] = CatalogItem(product_id, name, grade)
+        index.add(item, category_ids)
+        categories[product_id] = category_ids
+    WORKER.update(index=index,
+                  items=items,
+                  ranker=SubstituteRanker(weights, top_k),
+                  links={'categories': categories,
+                         'brands': brands,
+                         'stores': stores})
+
+
+def compute_category(task):
+    """Computes the substitutes of the products of a category.
+
+    A product is handled with the category of smallest id it belongs
+        to, so each product is handled once. Products sharing the same
+        categories and grade share one shortlist, long enough to still
+        hold limit candidates once each product has left itself out.
+
+    Args:
+        task: tuple, The id of the category and the ids of the products
+            handled with it.
+
+    Returns:
+        list: For each product, the product and its best substitutes.
+    """
+
+    _, product_ids = task
+    index = WORKER['index']
+    ranker = WORKER['ranker']
+    links = WORKER['links']
+    limit = ranker.top_k * misc.SUBST_SHORTLIST_FACTOR
+    groups = {}
+    for product_id in product_ids:
+        product = WORKER['items'][product_id]
+        signature = index.signature(product)
+        if signature is not None:
+            groups.setdefault(signature, []).append(product)
+    results = []
+    for signature, products in groups.items():
+        shortlist = index.shortlist(signature, limit + len(products))
+        for product in products:
+            candidates = islice((candidate for candidate in shortlist
+                                 if candidate.id != product.id
+                                 and candidate.french_name
+                                 != product.french_name), limit)
+            results.append((product, ranker.rank(product, list(candidates),
+                                                 links)))
+    return results
+
+
+class SubstituteBatch:
+    """Computes the best substitutes of every product of the catalog.
+
+    The catalog of a Brain is copied into each process of a pool. Every
+        process builds its own category index, then categories are
+        handed out to them, largest first. Results are streamed to a
+        JSONL or CSV file as soon as a category is done.
+
+    Args:
+        brain: The Brain holding the catalog.
+        processes: int, The number of worker processes. Defaults to the
+            number of cpus.
+
+    Attributes:
+        records: list, The id, name, grade and category ids of each
+            product.
+        brands: dict, The brand ids of each product id.
+        stores: dict, The store ids of each product id.
+        owned: dict, The ids of the products handled with each
+            category, the one of smallest id they belong to.
+    """
+
+    def __init__(self, brain, processes=None):
+        self.processes = processes
+        self.weights = brain.ranker.weights
+        self.top_k = brain.ranker.top_k
+        self.records = []
+        self.owned = {}
+        for product in brain.products.values():
+            category_ids = tuple(brain.category_index.categories_of(product))
+            if not category_ids:
+                continue
+            self.records.append((product.id, product.french_name,
+                                 product.nutrition_grades, category_ids))
+            self.owned.setdefault(min(category_ids), []).append(product.id)
+        self.brands = brain.group_links(brain.source.get_brand_links(),
+                                        'brand_id')
+        self.stores = brain.group_links(brain.source.get_store_links(),
+                                        'store_id')
+
+    def results(self):
+        """Yields products and their substitutes as categories are done."""
+
+        tasks = sorted(self.owned.items(), key=lambda task: -len(task[1]))
+        with multiprocessing.Pool(
+                self.processes, initializer=init_worker,
+                initargs=(self.records, self.brands, self.stores,
+                          self.weights, self.top_k)) as pool:
+            for results in pool.imap_unordered(compute_category, tasks):
+                yield from results
+
+    def run(self, path, file_format="jsonl"):
+        """Computes all substitutes and writes them to a file.
+
+        Args:
+            path: str, The file to write.
+            file_format: str, Either "jsonl", with one line per product,
+                or "csv", with one row per substitute.
+
+        Returns:
+            int: The number of products processed.
+        """
+
+        count = 0
+        with open(path, "w", encoding="utf-8", newline="") as out_file:
+            writer = csv.writer(out_file)
+            if file_format == "csv":
+                writer.writerow(['product_id', 'product_name', 'rank',
+                                 'substitute_id', 'substitute_name',
+                                 'nutrition_grades'])
+            for product, substitutes in self.results():
+                if file_format == "csv":
+                    for rank, subst in enumerate(substitutes, 1):
+                        writer.writerow([product.id, product.french_name,
+                                         rank, subst.id, subst.french_name,
+                                         to_letter(subst.nutrition_grades)])
+                else:
+                    out_file.write(json.dumps({
+                        'id': product.id,
+                        'french_name': product.french_name,
+                        'nutrition_grades': to_letter(
+                            product.nutrition_grades),
+                        'substitutes': [
+                            {'id': subst.id,
+                             'french_name': subst.french_name,
+                             'nutrition_grades': to_letter(
+                                 subst.nutrition_grades)}
+                            for subst in substitutes]},
+                        ensure_ascii=False) + "\n")
+                count += 1
+        return count
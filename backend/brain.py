@@ -1,13 +1,25 @@
 """Contains class Brain which handles non-user facing operations."""
 
-from tabulate import tabulate
-from colorama import Style, Fore
+import sys
+import time
 from backend.category import Category
 from backend.product import Product
 from backend.brand import Brand
 from backend.store import Store
 from backend.substitute import Substitute
 from backend.favorite import Favorite
+from backend.relation import RelationLoader
+from backend.search_index import SearchIndex
+from backend.canonicalizer import Canonicalizer
+from backend.category_crawl import CategoryCrawl
+from backend.snapshot import CatalogSnapshot, LAYOUT, FAVORITE_TABLES
+from backend.ranking import SubstituteRanker
+from backend.category_index import CategoryIndex
+from backend.substitute_cache import SubstituteCache
+from backend.prefetcher import PagePrefetcher
+from backend.ingest_telemetry import IngestTelemetry
+from backend.page_renderer import PageRenderer, PRODUCT_COLUMNS, \
+    FAVORITE_COLUMNS, product_cells, favorite_cells
 from backend.api_socket import APISocket
 from backend.db_socket import DBSocket
 from config import database_connection as db_info
@@ -30,18 +42,49 @@ class Brain:
         - latest_saved_id: The id of the latest favorites in db.
         - Stores list: a list of stores
         - Brands list: a list of brands
+        - relations: The RelationLoader fetching stores, brands and
+            replaced products in batches.
+        - search_index: The SearchIndex over product names and brands.
+        - store_names: The Canonicalizer merging near-duplicate stores.
+        - brand_names: The Canonicalizer merging near-duplicate brands.
+        - source: Where data is read from, either dbs or an up to date
+            CatalogSnapshot.
+        - ranker: The SubstituteRanker ordering substitutes.
+        - products: All products of the catalog by id. A product
+            belonging to several categories is shared by all of them.
+        - category_index: The CategoryIndex finding substitute
+            candidates across all categories of a product.
+        - my_stores: The ids of the stores substitutes must be found
+            in. Substitutes are not filtered if it is empty.
+        - substitute_cache: The SubstituteCache bounding how many
+            products keep their substitutes in memory.
+        - favorite_pages: The PageRenderer of the saved substitutes.
+        - result_pages: The PageRenderer of the search results.
+        - prefetcher: The PagePrefetcher loading the pages around the
+            one being browsed.
+        - ingest_report: The summary of the last ingest from off, see
+            class IngestTelemetry.
     """
 
-    def __init__(self):
+    def __init__(self, interactive=True, autoload=True, dbs=None,
+                 apis=None):
         """Inits an instance of the program backend.
 
         Sockets are open with both the api and the database.
         If the database is not empty, fills program memory with data
             form the db.
+
+        Args:
+            interactive: False to never wait for the user.
+            autoload: False to leave program memory empty, so callers
+                only load what they need with fill_from_db().
+            dbs: The DBSocket to use instead of connecting to the db of
+                the config folder.
+            apis: The APISocket to use instead of a new one.
         """
 
-        self.dbs = DBSocket(db_info.mariadb['sql_file'])
-        self.apis = APISocket()
+        self.dbs = dbs or DBSocket(db_info.mariadb['sql_file'], interactive)
+        self.apis = apis or APISocket()
         self.categories_list = []
         self.saved_sub_buf = []
         self.last_saved_id = 0
@@ -49,7 +92,25 @@ class Brain:
         self.stores_list = []
         self.brands_list = []
         self.buffer_added = False
-        if not self.dbs.db_is_empty:
+        self.relations = RelationLoader()
+        self.relations.register('stores', self.load_stores)
+        self.relations.register('brands', self.load_brands)
+        self.relations.register('substitute_to', self.load_prod_from_favs)
+        self.search_index = SearchIndex()
+        self.store_names = Canonicalizer()
+        self.brand_names = Canonicalizer()
+        self.source = self.dbs
+        self.ranker = SubstituteRanker()
+        self.products = {}
+        self.category_index = CategoryIndex()
+        self.my_stores = set()
+        self.substitute_cache = SubstituteCache()
+        self.favorite_pages = PageRenderer(FAVORITE_COLUMNS)
+        self.result_pages = PageRenderer(PRODUCT_COLUMNS)
+        self.prefetcher = PagePrefetcher(self)
+        self.ingest_report = None
+        if autoload and not self.dbs.db_is_empty:
+            print("Database is not empty. Filling it.")
             self.fill_from_db()
 
     def add_substitute_to_saved_list(self, fav):
@@ -87,48 +148,12 @@ class Brain:
             page: int, Index of the page to print.
         """
 
-        # We add the page buffer if it is not empty.
-        # this is to prevent not printing substitutes if buffer is not full.
-        table = [['n°', 'Name', 'Brands', 'Nutriscore', 'Substitute to']]
-        i = 1
-        for elt in self.subst_reg[page]:
-            self.fetch_prod_from_fav(elt)
-            brands_to_print = ""
-            name_to_print = elt.french_name
-            if len(elt.french_name) > misc.NAME_SIZE:
-                name_to_print = f"{elt.french_name[:misc.NAME_SIZE]}" \
-                                f"{Style.DIM}...{Style.RESET_ALL}"
-            if len(elt.brands_list) == 1:
-                brands_to_print += f"{elt.brands_list[0].name}"
-            else:
-                brands_to_print += f"{elt.brands_list[0].name} " \
-                                   f"{Style.DIM}" \
-                                   f"+ {len(elt.brands_list) - 1} more..." \
-                                   f"{Style.RESET_ALL}"
-            sb_to_prt = ""
-            # Just assigning a shorter name.
-            subs = elt.substitute_to
-            if len(subs) == 1:
-                if len(subs[0].french_name) > misc.NAME_SIZE:
-                    sb_to_prt += f"{subs[0].french_name[:misc.NAME_SIZE]}" \
-                                 f"{Style.DIM}...{Style.RESET_ALL}"
-                else:
-                    sb_to_prt += f"{subs[0].french_name}"
-            else:
-                if len(subs[0].french_name) > misc.NAME_SIZE:
-                    sb_to_prt += f"{subs[0].french_name[:misc.NAME_SIZE]} " \
-                                 f"{Style.DIM}" \
-                                 f"+ {len(subs) - 1} more..." \
-                                 f"{Style.RESET_ALL}"
-                else:
-                    sb_to_prt += f"{subs[0].french_name} " \
-                                 f"{Style.DIM}" \
-                                 f"+ {len(subs) - 1} more..." \
-                                 f"{Style.RESET_ALL}"
-            table.append([i, name_to_print, brands_to_print,
-                          elt.nutrition_grades, sb_to_prt])
-            i += 1
-        print(tabulate(table, headers="firstrow", tablefmt="pretty"))
+        # The page changes when a product is added to what a favorite
+        # replaces.
+        favorites = self.subst_reg[page]
+        print(self.favorite_pages.render(
+            page, favorites, favorite_cells,
+            tuple(len(fav.substitute_to) for fav in favorites)))
 
     def buffer_check(self):
         """Appends a buffer to the registry.
@@ -141,18 +166,20 @@ class Brain:
             self.subst_reg.append(self.saved_sub_buf)
             self.buffer_added = True
 
-    def fill_saved_product_from_db_v2(self):
-        """Fills saved product in memory with data from db."""
+    def fill_saved_product_from_db_v2(self, source=None):
+        """Fills saved product in memory with data from db.
+
+        Args:
+            source: Where to read from, defaults to the source of Brain.
+        """
 
-        rows = self.dbs.get_saved_products()
+        source = source or self.source
+        rows = source.get_saved_products()
         for row in rows:
-            favorite = Favorite(row)
-            self.fetch_brands_from_fav(favorite)
-            self.fetch_stores_from_fav(favorite)
-            self.fetch_prod_from_fav(favorite)
-            self.add_substitute_to_saved_list(favorite)
+            self.add_substitute_to_saved_list(Favorite(row))
+        self.relations.attach_registry(self.subst_reg, self.saved_sub_buf)
         if self.saved_sub_buf or self.subst_reg:
-            result = self.dbs.get_max_id_from_fav()
+            result = source.get_max_id_from_fav()
             for line in result:
                 self.last_saved_id = line['MAX( id )']
 
@@ -161,22 +188,27 @@ class Brain:
         self.add_substitute_to_saved_list(fav)
 
     def fill_categories_from_off_v2(self):
-        """Fills the category table in the database"""
+        """Fills the category table in the database.
 
-        # get request openfoodfacts for categories.json
-        # raw_data = self.apis.request_categories()
+        Categories are the ones of CAT_ENDPOINT, or are picked from the
+            categories of off when CRAWL_CATEGORIES is set in the api
+            downloads config file. See class CategoryCrawl.
+        """
 
+        if api.CRAWL_CATEGORIES:
+            found = CategoryCrawl(self.apis).categories()
+        else:
+            found = [{'name': elt.replace("-", " ").capitalize(),
+                      'url': api.BASE_CAT_URL + elt}
+                     for elt in api.CAT_ENDPOINT]
         print("Inserting data into DB")
-        dict_category = {}
-        for elt in api.CAT_ENDPOINT:
+        for dict_category in found:
             dict_category["id"] = len(self.categories_list) + 1
-            dict_category['name'] = elt.replace("-", " ").capitalize()
-            dict_category["url"] = api.BASE_CAT_URL + elt
             category = Category(dict_category)
             self.dbs.cat_insertion_v2(category)
             self.categories_list.append(category)
 
-    def fill_categories_from_db(self):
+    def fill_categories_from_db(self, source=None):
         """Fills the categories from database.
 
         The method makes use of method get_categories() from class
@@ -185,53 +217,145 @@ class Brain:
             category it gathers.
         Refer to get_categories() documentation inside DBSocket and
             class Category documentation for additional information.
+
+        Args:
+            source: Where to read from, defaults to the source of Brain.
         """
 
-        print("Database is not empty. Filling it.")
-        rows = self.dbs.get_categories()
+        source = source or self.source
+        rows = source.get_categories()
         for row in rows:
             self.categories_list.append(Category(row))
-            self.fill_products_from_db()
 
-    def fill_products_from_db(self):
-        """Fills product in memory with data from the database."""
+    def fill_products_from_db(self, source=None):
+        """Fills product in memory with data from the database.
 
+        Args:
+            source: Where to read from, defaults to the source of Brain.
+        """
+
+        source = source or self.source
         for category in self.categories_list:
-            products = self.dbs.get_products_from_cat(category)
+            products = source.get_products_from_cat(category)
             for product_raw in products:
-                product = Product(product_raw)
+                product = self.products.get(product_raw['id'])
+                if product is None:
+                    product = Product(product_raw)
+                    self.products[product.id] = product
                 category.add_product(product)
                 product.categories_list.append(category)
+            self.relations.attach_registry(category.product_registry,
+                                           category.product_page_buffer)
+
+    def fill_brands_from_db(self, source=None):
+        """Fills brands in memory with data from the db.
 
-    def fill_brands_from_db(self):
-        """Fills brands in memory with data from the db."""
+        Args:
+            source: Where to read from, defaults to the source of Brain.
+        """
 
-        rows = self.dbs.get_brands()
+        source = source or self.source
+        rows = source.get_brands()
         for row in rows:
-            self.brands_list.append(Brand(row))
+            brand = Brand(row)
+            self.brands_list.append(brand)
+            self.brand_names.add(brand)
 
-    def fill_stores_from_db(self):
-        """Fills stores in memory with data from the db."""
-        rows = self.dbs.get_stores()
+    def fill_stores_from_db(self, source=None):
+        """Fills stores in memory with data from the db.
+
+        Args:
+            source: Where to read from, defaults to the source of Brain.
+        """
+
+        source = source or self.source
+        rows = source.get_stores()
         for row in rows:
-            self.stores_list.append(Store(row))
+            store = Store(row)
+            self.stores_list.append(store)
+            self.store_names.add(store)
+
+    def ingest_key(self, name, brand_names):
+        """Returns what tells apart products found in several categories.
 
-    def fill_products_from_off_v3(self):
-        """Fills product in database and memory with data from off."""
+        Brands are named as the known brand they would be merged into,
+            so the key of a product is the same whether it comes from
+            off or from the db. Looking them up records no merge.
 
-        i = 1
+        Args:
+            name: str, The french name of the product.
+            brand_names: iterable, The names of its brands.
+        """
+
+        brands = []
+        for brand_name in brand_names:
+            brand_name = brand_name.strip().lower()
+            known = self.brand_names.lookup(brand_name)
+            brands.append(brand_name if known is None else known.name)
+        return name, tuple(sorted(set(brands)))
+
+    def ingested_keys(self):
+        """Returns the products in memory by ingest_key()."""
+
+        brand_names = {}
+        for row in self.dbs.get_brand_links():
+            brand_names.setdefault(row['product_id'], []).append(
+                self.brands_list[row['brand_id'] - 1].name)
+        return {self.ingest_key(product.french_name,
+                                brand_names.get(product.id, ())): product
+                for product in self.products.values()}
+
+    def fill_products_from_off_v3(self, done=()):
+        """Fills product in database and memory with data from off.
+
+        Categories are downloaded a few at a time while the products of
+            the previous ones are saved, see class CategoryCrawl. Each
+            category is committed with its checkpoint once its products
+            are saved, see update_db().
+        Progress is printed after each category, and a summary of the
+            ingest is kept in ingest_report. See class IngestTelemetry.
+
+        Args:
+            done: The ids of the categories saved already, skipped.
+        """
+
+        i = max(self.products, default=0) + 1
         store_i = 1
         brand_i = 1
-        for category in self.categories_list:
-            print(f"Downloading {category.french_name}...")
-            self.apis.request_cleaned_products(category.url)
-            print("data received")
+        ingested = self.ingested_keys() if done else {}
+        todo = [category for category in self.categories_list
+                if category.id not in done]
+        telemetry = IngestTelemetry(len(todo), sys.stdout)
+        self.apis.telemetry = telemetry
+        downloads = CategoryCrawl(self.apis).downloads(todo)
+        for category, download in downloads:
+            telemetry.begin_category(category.french_name)
+            self.apis.request_cleaned_products(category.url, download)
+            start = time.perf_counter()
             for elt in self.apis.cleaned_products:
+                # Products found in several categories are linked to all,
+                # once: cleaning keeps spellings of brands the key merges.
+                key = self.ingest_key(elt["product_name_fr"],
+                                      elt["brands"].split(','))
+                known = ingested.get(key)
+                if known is not None:
+                    if category in known.categories_list:
+                        telemetry.reject('duplicate')
+                        continue
+                    category.add_product(known)
+                    self.dbs.cat_prod_insertion(category, known)
+                    known.categories_list.append(category)
+                    self.category_index.add(known)
+                    telemetry.product(linked=True)
+                    continue
                 elt["french_name"] = elt["product_name_fr"]
                 elt["id"] = i
                 product = Product(elt)
                 if self.dbs.product_insertion_v2(product):
                     i += 1
+                    telemetry.product()
+                    ingested[key] = product
+                    self.products[product.id] = product
                     category.add_product(product)
                     self.dbs.cat_prod_insertion(category, product)
                     product.categories_list.append(category)
@@ -251,136 +375,259 @@ class Brain:
                             'url': ""
                         }
                         self.brand_saving(Brand(dict_brand), product)
-        self.dbs.connection.commit()
+                    self.search_index.add_product(product)
+                    for brand in product.brands_list:
+                        self.search_index.add_brand(product, brand.name)
+                    self.category_index.add(product)
+                    for store in product.stores_list:
+                        self.category_index.add_store(product.id, store.id)
+                else:
+                    telemetry.reject('insert_error')
+            telemetry.add_time('insert', time.perf_counter() - start)
+            with telemetry.stage('flush'):
+                self.dbs.save_checkpoint(f"category:{category.id}",
+                                         telemetry.current['products'])
+            telemetry.end_category()
+        print()
+        self.ingest_report = telemetry.summary()
+        report = self.merge_report()
+        print(f"Merged {len(report['stores'])} store names and "
+              f"{len(report['brands'])} brand names.")
 
     def store_saving(self, store, product):
         """Adds stores pulled from the api in memory and in db.
 
+        Stores whose name is a near-duplicate of a known store are
+            merged into it. See class Canonicalizer.
+
         Args:
             store: The store to handle.
             product: Product that can be found in the store.
         """
 
-        i = 0
-        store_exists = False
-        for elt in self.stores_list:
-            if store.name == elt.name:
-                product.stores_list.append(self.stores_list[i])
-                self.stores_list[i].add_product(product)
-                self.dbs.prod_stores_insertion(product, self.stores_list[i])
-                store_exists = True
-            i += 1
-        if not store_exists:
+        known = self.store_names.find(store.name)
+        if known is None:
             store.id = len(self.stores_list) + 1
-            product.stores_list.append(store)
-            store.add_product(product)
             self.dbs.store_insertion(store)
-            self.dbs.prod_stores_insertion(product, store)
             self.stores_list.append(store)
-        product.stores_loaded = True
+            self.store_names.add(store)
+            known = store
+        if known not in product.stores_list:
+            product.stores_list.append(known)
+            known.add_product(product)
+            self.dbs.prod_stores_insertion(product, known)
 
     def brand_saving(self, brand, product):
         """Adds brands pulled from the api in memory and in db.
 
+        Brands whose name is a near-duplicate of a known brand are
+            merged into it. See class Canonicalizer.
+
         Args:
             brand: The brand to handle.
             product: Product that can be found in the brand.
         """
 
-        i = 0
-        brand_exists = False
-        for elt in self.brands_list:
-            if brand.name == elt.name:
-                product.brands_list.append(self.brands_list[i])
-                self.brands_list[i].add_product(product)
-                self.dbs.prod_brands_insertion(product, self.brands_list[i])
-                brand_exists = True
-            i += 1
-        if not brand_exists:
+        known = self.brand_names.find(brand.name)
+        if known is None:
             brand.id = len(self.brands_list) + 1
-            product.brands_list.append(brand)
-            brand.add_product(product)
             self.dbs.brand_insertion(brand)
-            self.dbs.prod_brands_insertion(product, brand)
             self.brands_list.append(brand)
-        product.brands_loaded = True
+            self.brand_names.add(brand)
+            known = brand
+        if known not in product.brands_list:
+            product.brands_list.append(known)
+            known.add_product(product)
+            self.dbs.prod_brands_insertion(product, known)
+
+    def merge_report(self):
+        """Returns the store and brand names merged during ingest.
+
+        Returns:
+            dict: For stores and brands, the merged names by canonical
+                name.
+        """
+
+        return {'stores': self.store_names.report(),
+                'brands': self.brand_names.report()}
+
+    def build_search_index(self, source=None):
+        """Indexes the names and brands of all products in memory.
+
+        The index is only made visible once complete.
+
+        Args:
+            source: Where to read from, defaults to the source of Brain.
+        """
+
+        source = source or self.source
+        search_index = SearchIndex()
+        for product in self.products.values():
+            search_index.add_product(product)
+        for row in source.get_brand_links():
+            product = search_index.products.get(row['product_id'])
+            if product is not None:
+                search_index.add_brand(
+                    product, self.brands_list[row['brand_id'] - 1].name)
+        self.search_index = search_index
+
+    def build_category_index(self, source=None):
+        """Indexes the categories of all products in memory.
+
+        The index is only made visible once complete.
+
+        Args:
+            source: Where to read from, defaults to the source of Brain.
+        """
+
+        source = source or self.source
+        category_index = CategoryIndex()
+        for product in self.products.values():
+            category_index.add(product)
+        for row in source.get_store_links():
+            category_index.add_store(row['product_id'], row['store_id'])
+        self.category_index = category_index
+
+    def find_stores(self, text):
+        """Returns the stores whose name contains a text.
+
+        Args:
+            text: str, The text to look for.
+        """
+
+        key = Canonicalizer.key(text)
+        return [store for store in self.stores_list
+                if key in Canonicalizer.key(store.name)]
+
+    def toggle_my_store(self, store):
+        """Adds a store to my_stores, or removes it if already there.
+
+        Args:
+            store: The store to toggle.
+
+        Returns:
+            True if the store is now part of my_stores.
+        """
+
+        if store.id in self.my_stores:
+            self.my_stores.discard(store.id)
+            return False
+        self.my_stores.add(store.id)
+        return True
+
+    def compute_all_substitutes(self, path, file_format="jsonl",
+                                processes=None):
+        """Computes the best substitutes of every product to a file.
 
-    def fetch_prod_from_fav(self, fav):
-        """Fetch products in fatabase for a given favorite.
+        See class SubstituteBatch for additional information.
 
         Args:
-            fav: The chosen favorite.
+            path: str, The file to write.
+            file_format: str, Either "jsonl" or "csv".
+            processes: int, The number of worker processes.
+
+        Returns:
+            int: The number of products processed.
         """
 
-        if not fav.subst_loaded:
-            db_prods = self.dbs.get_prod_from_fav(fav.id)
-            for prod in db_prods:
-                fav.substitute_to.append(Product(prod))
-            fav.subst_loaded = True
+        # Multiprocessing is slow to import and seldom needed.
+        from backend.batch import SubstituteBatch
+
+        return SubstituteBatch(self, processes).run(path, file_format)
 
-    def fetch_prod_from_fav_page(self, page):
-        """Run fetch_prod_from_fav on a whole page of favorites.
+    def search_products(self, query):
+        """Searches products by name or brand.
 
         Args:
-            page: The page to process.
+            query: str, The text typed by the user.
+
+        Returns:
+            list: The best matching products.
         """
 
-        for fav in self.subst_reg[page]:
-            self.fetch_prod_from_fav(fav)
+        results = self.search_index.search(query)
+        # Brands of the results are loaded together for printing.
+        self.relations.attach(results)
+        return results
 
-    def fetch_stores_from_fav(self, fav):
-        """Fetches stores in database linked to a given favorite.
+    def print_products(self, products):
+        """Prints a list of products as a table.
 
         Args:
-            fav: The chosen favorite.
+            products: list, The products to print.
         """
 
-        if not fav.stores_loaded:
-            db_stores = self.dbs.get_stores_from_prod(fav.original_id)
-            for store in db_stores:
-                fav.stores_list.append(self.stores_list[store['id'] - 1])
-            fav.stores_loaded = True
+        print(self.result_pages.render(None, products, product_cells))
 
-    def fetch_stores_from_product(self, product):
-        """Fetches stores in database linked to a given product.
+    @staticmethod
+    def group_by_key(relation, objects):
+        """Groups objects by the id used to load a relation.
 
         Args:
-            product: The chosen product.
+            relation: The relation being loaded.
+            objects: list, The objects to group.
+
+        Returns:
+            dict: lists of objects indexed by id.
         """
 
-        if not product.stores_loaded:
-            db_stores = self.dbs.get_stores_from_prod(product.id)
-            for store in db_stores:
-                product.stores_list.append(self.stores_list[store['id'] - 1])
-                self.stores_list[store['id'] - 1].add_product(product)
-            product.stores_loaded = True
+        groups = {}
+        for obj in objects:
+            groups.setdefault(getattr(obj, relation.key), []).append(obj)
+        return groups
 
-    def fetch_brands_from_fav(self, fav):
-        """Fetches brands in db linked to a given favorite.
+    def load_stores(self, relation, objects, rows=None):
+        """Loads the stores of several products with one query.
 
         Args:
-            fav: Favorite object, the chosen favorite.
+            relation: The stores relation of the products.
+            objects: list, The products to process.
+            rows: list, The links already fetched, if any. Links to
+                other products are ignored.
         """
 
-        if not fav.brands_loaded:
-            db_brands = self.dbs.get_brands_from_prod(fav.original_id)
-            for brand in db_brands:
-                fav.brands_list.append(self.brands_list[brand['id'] - 1])
-            fav.brands_loaded = True
+        groups = self.group_by_key(relation, objects)
+        if rows is None:
+            rows = self.source.get_stores_from_prods(list(groups))
+        for row in rows:
+            store = self.stores_list[row['store_id'] - 1]
+            for obj in groups.get(row['product_id'], ()):
+                obj.stores_list.append(store)
+                if relation.backref:
+                    store.add_product(obj)
 
-    def fetch_brands_from_product(self, product):
-        """Fetches brands for a given product
+    def load_brands(self, relation, objects, rows=None):
+        """Loads the brands of several products with one query.
 
         Args:
-            product: The given product.
+            relation: The brands relation of the products.
+            objects: list, The products to process.
+            rows: list, The links already fetched, if any. Links to
+                other products are ignored.
         """
 
-        if not product.brands_loaded:
-            db_brands = self.dbs.get_brands_from_prod(product.id)
-            for brand in db_brands:
-                product.brands_list.append(self.brands_list[brand['id'] - 1])
-                self.brands_list[brand['id'] - 1].add_product(product)
-            product.brands_loaded = True
+        groups = self.group_by_key(relation, objects)
+        if rows is None:
+            rows = self.source.get_brands_from_prods(list(groups))
+        for row in rows:
+            brand = self.brands_list[row['brand_id'] - 1]
+            for obj in groups.get(row['product_id'], ()):
+                obj.brands_list.append(brand)
+                if relation.backref:
+                    brand.add_product(obj)
+
+    def load_prod_from_favs(self, relation, objects):
+        """Loads the products replaced by several favorites at once.
+
+        Args:
+            relation: The substitute_to relation of the favorites.
+            objects: list, The favorites to process.
+        """
+
+        groups = self.group_by_key(relation, objects)
+        for row in self.source.get_prods_from_favs(list(groups)):
+            for fav in groups[row['favorite_id']]:
+                fav.substitute_to.append(Product(row))
 
     def fetch_brands_from_product_page(self, page, category):
         """Fetches brands for all products in a page from a category.
@@ -391,21 +638,10 @@ class Brain:
         """
 
         category.buffer_check()
-        for product in category.product_registry[page]:
-            self.fetch_brands_from_product(product)
-
-    def fetch_stores_from_subst(self, subst):
-        """Fetches stores for a given substitute.
-
-        Args:
-            subst: The given substitute.
-        """
-        if not subst.stores_loaded:
-            db_stores = self.dbs.get_stores_from_prod(subst.original_id)
-            for store in db_stores:
-                subst.stores_list.append(self.stores_list[store['id'] - 1])
-                self.stores_list[store['id'] - 1].add_product(subst)
-            subst.stores_loaded = True
+        self.prefetcher.apply(category.product_registry[page])
+        self.relations.prefetch(category.product_registry[page],
+                                'brands_list')
+        self.prefetcher.schedule(category.product_registry, page)
 
     def fetch_brands_from_subst_page(self, page, product):
         """Fetches brands for all substitutes in a page.
@@ -416,60 +652,105 @@ class Brain:
         """
 
         product.buffer_check()
-        for subst in product.substitute_registry[page]:
-            if not subst.brands_loaded:
-                db_brands = self.dbs.get_brands_from_prod(subst.original_id)
-                for brand in db_brands:
-                    subst.brands_list.append(self.brands_list[brand['id'] - 1])
-                    self.brands_list[brand['id'] - 1].add_product(subst)
-                subst.brands_loaded = True
-
-    def get_substitutes_to_product(self, product):
-        """Fetches substitutes to a product from db.
-
-        The substitutes are added to the product substitutes list.
+        self.prefetcher.apply(product.substitute_registry[page])
+        self.relations.prefetch(product.substitute_registry[page],
+                                'brands_list')
+        self.prefetcher.schedule(product.substitute_registry, page)
+
+    def get_substitutes_to_product(self, product, store_ids=None):
+        """Finds substitutes to a product among all its categories.
+
+        The category index shortlists the candidates sharing the most
+            categories with the product and found in the chosen stores.
+            The ranker then orders them and only the best ones are put
+            in the product substitutes list, best first. Brands and
+            stores of the shortlist are fetched in one query each and
+            come along with substitutes.
+        Results are kept for the most recently opened products, see
+            class SubstituteCache.
 
         Args:
             product: product object, the product for which substitutes
                 are fetched.
+            store_ids: iterable, The stores substitutes must be found
+                in. Defaults to my_stores.
         """
 
-        # check if there is already data loaded in memory!
-        results = self.dbs.get_substitutes_v2(product)
-        for result in results:
-            subst = Substitute(result, result['id'])
-            cat = self.categories_list[product.categories_list[0].id - 1]
-            og_prod = self.find_item_in_registry(subst.original_id,
-                                                 misc.PAGE_SIZE,
-                                                 cat.product_registry,
-                                                 cat.product_page_buffer)
-            if og_prod.brands_loaded:
-                subst.brands_list = og_prod.brands_list
-                subst.brands_loaded = True
-            if og_prod.stores_loaded:
-                subst.stores_list = og_prod.stores_list
-                subst.stores_loaded = True
+        if store_ids is None:
+            store_ids = self.my_stores
+        if self.substitute_cache.hit(product, store_ids):
+            return
+        product.clear_substitutes()
+        ranked, links = self.rank_substitutes(product, store_ids)
+        for elt in ranked:
+            subst = Substitute({'id': elt.id,
+                                'french_name': elt.french_name,
+                                'url': elt.url,
+                                'nutrition_grades': elt.nutrition_grades},
+                               elt.id)
+            subst.categories_list = list(elt.categories_list)
+            subst.brands_list = [self.brands_list[brand_id - 1] for brand_id
+                                 in links['brands'].get(elt.id, [])]
+            subst.stores_list = [self.stores_list[store_id - 1] for store_id
+                                 in links['stores'].get(elt.id, [])]
             product.add_substitute(subst)
+        self.relations.attach_registry(product.substitute_registry,
+                                       product.substitute_page_buffer)
+        self.substitute_cache.add(product, store_ids)
 
-    @staticmethod
-    def find_item_in_registry(item_id, page_size, registry, buffer):
-        """Finds an item in a registry.
+    def rank_substitutes(self, product, store_ids=(), links=None):
+        """Ranks the best substitutes to a product.
+
+        Nothing in memory is changed, so several threads may rank
+            substitutes at once as long as links are given.
 
         Args:
-            item_id: int, The index of the item.
-            page_size: int, the size of a page and of a filled-buffer.
-            registry: list of list, The registry
-            buffer: list, The buffer
+            product: The product to replace.
+            store_ids: iterable, The stores substitutes must be found
+                in. Substitutes are not filtered if empty.
+            links: dict, For brands and stores, the linked ids of every
+                product, see group_links(). Fetched from the source for
+                the candidates only if None.
+
+        Returns:
+            tuple: The best substitutes, best first, and the links used
+                to rank them.
+        """
 
-        Returns: The found item.
+        shortlist = self.category_index.candidates(
+            product, self.ranker.top_k * misc.SUBST_SHORTLIST_FACTOR,
+            store_ids)
+        if links is None:
+            product_ids = [product.id] + [elt.id for elt in shortlist]
+            links = {
+                'brands': self.group_links(
+                    self.source.get_brands_from_prods(product_ids),
+                    'brand_id'),
+                'stores': self.group_links(
+                    self.source.get_stores_from_prods(product_ids),
+                    'store_id'),
+            }
+        links = dict(links, categories={
+            elt.id: self.category_index.categories_of(elt)
+            for elt in [product] + shortlist})
+        return self.ranker.rank(product, shortlist, links), links
 
+    @staticmethod
+    def group_links(rows, column):
+        """Groups rows of a link table by product.
+
+        Args:
+            rows: list, The rows holding a product_id.
+            column: str, The column holding the linked id.
+
+        Returns:
+            dict: The list of linked ids by product id.
         """
 
-        page = (item_id - registry[0][0].id) // page_size
-        i = (item_id - registry[0][0].id) % page_size
-        if (item_id - registry[0][0].id) > len(registry) * page_size:
-            return buffer[i - 1]
-        return registry[page][i]
+        links = {}
+        for row in rows:
+            links.setdefault(row['product_id'], []).append(row[column])
+        return links
 
     def save_substitute_v2(self, substitute, product):
         """Saves a substitute to program memory and db.
@@ -489,15 +770,12 @@ class Brain:
 
         is_present, can_be_saved, elt = self.saving_is_possible_v2(substitute,
                                                                    product)
-        breakpoint()
         if can_be_saved:
             if is_present:
                 elt.substitute_to.append(product)
-                elt.subst_loaded = True
                 # modify substitute
                 self.dbs.prod_fav_insertion(product.id, elt.id)
                 return True
-            elt.subst_loaded = True
             fav = Favorite(elt)
             fav.substitute_to.append(product)
             fav.id = self.last_saved_id + 1
@@ -561,9 +839,6 @@ class Brain:
         fav.substitute_to = []
         self.delete_item_in_registry(fav, self.subst_reg,
                                      self.saved_sub_buf)
-        input(f"{Fore.MAGENTA}Removed {fav.french_name} from favorites."
-              f" {Style.RESET_ALL}Press enter to continue.")
-        breakpoint()
         del fav
 
     def del_one_in_fav(self, fav, user_choice):
@@ -572,14 +847,14 @@ class Brain:
         Args:
             fav: The given favorite.
             user_choice: The chosen substitute to.
+
+        Returns:
+            The product the favorite no longer replaces.
         """
 
         self.dbs.prod_fav_del(fav.substitute_to[user_choice - 1],
                               fav)
         deld = fav.substitute_to.pop(user_choice - 1)
-        input(f"{Fore.MAGENTA}Removed {fav.french_name} as a substitute to"
-              f" {deld.french_name}."
-              f" {Style.RESET_ALL}Press enter to continue.")
         if len(fav.substitute_to) == 0:
             self.dbs.delete_saved_substitute(fav)
             fav.substitute_to = []
@@ -587,6 +862,7 @@ class Brain:
                                          self.subst_reg,
                                          self.saved_sub_buf)
             del fav
+        return deld
 
     @staticmethod
     def delete_item_in_registry(item, registry, buffer):
@@ -601,12 +877,25 @@ class Brain:
             buffer.remove(item)
         except ValueError:
             for buf in registry:
-                buf.remove(item)
+                if item in buf:
+                    buf.remove(item)
+                    return
 
     def clear_db(self):
-        """Clears the whole database by using clear_table() method."""
+        """Clears the whole database by using clear_table() method.
 
-        self.dbs.clear_table("categories", "products", "favorites")
+        Brands and stores are cleared too, so the ids given to new ones
+            in memory match the ones given by the db.
+        """
+
+        self.dbs.clear_table("categories", "products", "favorites",
+                             "brands", "stores")
+        self.clear_memory()
+
+    def clear_memory(self):
+        """Drops the catalog and the saved substitutes from memory."""
+
+        self.prefetcher.cancel()
         del self.subst_reg
         del self.saved_sub_buf
         del self.categories_list
@@ -614,6 +903,15 @@ class Brain:
         self.saved_sub_buf = []
         self.subst_reg = []
         self.last_saved_id = 0
+        self.search_index = SearchIndex()
+        self.source = self.dbs
+        self.products = {}
+        self.brands_list = []
+        self.stores_list = []
+        self.brand_names = Canonicalizer()
+        self.store_names = Canonicalizer()
+        self.category_index = CategoryIndex()
+        self.substitute_cache.clear()
 
     def clear_saved_substitutes(self):
         """Removes all substitutes from db and program memory."""
@@ -625,11 +923,85 @@ class Brain:
         self.subst_reg = []
         self.last_saved_id = 0
 
-    def update_db(self):
-        """Clears then reload the database."""
+    def update_db(self, restart=False, shadow=False):
+        """Clears then reload the database.
+
+        The refresh is checkpointed in db once categories are saved,
+            then after each category of products, so a refresh stopped
+            halfway, by a crash or a lost network, is resumed by the next
+            call: the catalog committed so far is reloaded and only the
+            categories left are downloaded.
 
-        self.clear_db()
-        self.fill_from_off()
+        Args:
+            restart: True to start over even if a refresh is unfinished.
+            shadow: True to refresh in shadow tables instead, see
+                update_db_in_shadow().
+        """
+
+        if shadow:
+            self.update_db_in_shadow()
+            return
+        checkpoints = self.dbs.get_checkpoints()
+        if restart or 'categories' not in checkpoints:
+            self.dbs.clear_checkpoints()
+            self.clear_db()
+            self.fill_categories_from_off_v2()
+            self.dbs.save_checkpoint('categories')
+            done = set()
+        else:
+            done = {int(step.split(":")[1]) for step in checkpoints
+                    if step.startswith("category:")}
+            print(f"Resuming the update after {len(done)} categories.")
+            self.reload_catalog()
+        self.fill_products_from_off_v3(done)
+        self.dbs.clear_checkpoints()
+        self.save_snapshot()
+
+    def update_db_in_shadow(self):
+        """Reloads the database without emptying it first.
+
+        The catalog is downloaded into shadow tables, with their indexes,
+            by a Brain of its own. Favorites are copied and linked to the
+            new products, then the shadow tables replace the tables of
+            the db at once. Until then, the db and the memory of this
+            Brain keep the old catalog, so readers are not slowed down
+            and never see it partly loaded.
+        A refresh in shadow tables starts over if it fails, and
+            favorites saved while it runs are lost.
+        """
+
+        shadow = self.dbs.open_shadow()
+        try:
+            fresh = Brain(interactive=False, autoload=False, dbs=shadow,
+                          apis=self.apis)
+            fresh.fill_from_off()
+            kept = self.dbs.keep_favorites(shadow)
+            self.dbs.swap(shadow)
+        except BaseException:
+            self.dbs.drop_shadow(shadow)
+            raise
+        print(f"Swapped in the new catalog, kept {kept} favorites.")
+        self.ingest_report = fresh.ingest_report
+        self.reload_catalog()
+        self.save_snapshot()
+
+    def reload_catalog(self):
+        """Replaces memory with the catalog committed to the db.
+
+        Ids of rows rolled back with the step that was interrupted are
+            given again, so the ids of the db keep matching the ones
+            given in memory.
+        """
+
+        self.clear_memory()
+        self.dbs.reset_ids("products", "brands", "stores")
+        self.fill_brands_from_db(self.dbs)
+        self.fill_stores_from_db(self.dbs)
+        self.fill_categories_from_db(self.dbs)
+        self.fill_products_from_db(self.dbs)
+        self.build_category_index(self.dbs)
+        self.fill_saved_product_from_db_v2(self.dbs)
+        self.build_search_index(self.dbs)
 
     def fill_from_off(self):
         """Fills the program memory with data from openfoodfacts API."""
@@ -637,11 +1009,77 @@ class Brain:
         self.fill_categories_from_off_v2()
         self.fill_products_from_off_v3()
 
-    def fill_from_db(self):
-        """Fills the program memory with data from the db."""
+    def open_snapshot(self, dbs=None):
+        """Opens the catalog snapshot if it is up to date with the db.
+
+        If only favorites changed since the snapshot was taken, they are
+            reloaded from the db and the snapshot is saved again.
+
+        Args:
+            dbs: The DBSocket to use, defaults to the one of Brain.
+
+        Returns:
+            The snapshot, None if it is missing or stale.
+        """
+
+        dbs = dbs or self.dbs
+        snapshot = CatalogSnapshot.load(misc.SNAPSHOT_FILE)
+        stamp = dbs.get_stamp()
+        if snapshot is None or snapshot.stamp['catalog'] != stamp['catalog']:
+            return None
+        if snapshot.stamp != stamp:
+            snapshot.replace(stamp, dbs.dump_tables(*FAVORITE_TABLES))
+            snapshot.save(misc.SNAPSHOT_FILE)
+        return snapshot
+
+    def save_snapshot(self, dbs=None):
+        """Saves a snapshot of the db for the next startups.
+
+        Args:
+            dbs: The DBSocket to use, defaults to the one of Brain.
+        """
+
+        dbs = dbs or self.dbs
+        stamp = dbs.get_stamp()
+        snapshot = CatalogSnapshot.from_rows(stamp, dbs.dump_tables(*LAYOUT))
+        snapshot.save(misc.SNAPSHOT_FILE)
+
+    def fill_from_db(self, favorites=True, search=True, dbs=None,
+                     progress=None):
+        """Fills the program memory with data from the db.
+
+        Data is read from the catalog snapshot when it is up to date,
+            otherwise from the db, and a new snapshot is saved.
+        Memory is filled in parts: the 'catalog' of categories,
+            products, brands and stores first, then the category
+            'index', the 'favorites' and the 'search' index.
+
+        Args:
+            favorites: False to skip loading the saved substitutes.
+            search: False to skip building the search index.
+            dbs: The DBSocket to load with, so loading can run in
+                another thread. Defaults to the one of Brain.
+            progress: callable, Called with the name of each part once
+                it is loaded.
+        """
 
-        self.fill_brands_from_db()
-        self.fill_stores_from_db()
-        self.fill_categories_from_db()
-        self.fill_products_from_db()
-        self.fill_saved_product_from_db_v2()
+        dbs = dbs or self.dbs
+        progress = progress or (lambda part: None)
+        snapshot = self.open_snapshot(dbs)
+        self.source = snapshot or self.dbs
+        source = snapshot or dbs
+        self.fill_brands_from_db(source)
+        self.fill_stores_from_db(source)
+        self.fill_categories_from_db(source)
+        self.fill_products_from_db(source)
+        progress('catalog')
+        self.build_category_index(source)
+        progress('index')
+        if favorites:
+            self.fill_saved_product_from_db_v2(source)
+            progress('favorites')
+        if search:
+            self.build_search_index(source)
+            progress('search')
+        if snapshot is None:
+            self.save_snapshot(dbs)
@@ -0,0 +1,164 @@
+"""Contains the class Canonicalizer."""
+
+import unicodedata
+
+MIN_SIMILARITY = 0.6
+MAX_CANDIDATES = 50
+
+
+class Canonicalizer:
+    """Merges near-duplicate names of entities such as stores.
+
+    Names are first reduced to a key free of case, accents, punctuation
+        and spacing, so "Carrefour-Market" and "carrefour  market" share
+        the same key. Names whose key is new are compared to the known
+        keys sharing trigrams with them and merged if they are within a
+        small edit distance. Only a few candidates are checked per name
+        so ingest stays roughly linear.
+
+    Attributes:
+        entities: dict, The known entities indexed by key.
+        trigrams: dict, The keys containing each trigram.
+        merges: dict, For each canonical name, the other names merged
+            into it.
+    """
+
+    def __init__(self):
+        self.entities = {}
+        self.trigrams = {}
+        self.merges = {}
+
+    @staticmethod
+    def key(name):
+        """Returns the key used to compare names.
+
+        Args:
+            name: str, The name to process.
+        """
+
+        name = unicodedata.normalize("NFKD", name).lower()
+        return "".join(char for char in name
+                       if char.isalnum() and not unicodedata.combining(char))
+
+    @staticmethod
+    def trigrams_of(key):
+        """Returns the set of trigrams of a key."""
+
+        padded = f"  {key} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def max_distance(key):
+        """Returns the edit distance tolerated for a key.
+
+        Short names are only merged when their keys are equal.
+        """
+
+        if len(key) < 5:
+            return 0
+        if len(key) < 10:
+            return 1
+        return 2
+
+    @staticmethod
+    def distance(first, second, limit):
+        """Computes the edit distance between two keys.
+
+        Args:
+            first: str, The first key.
+            second: str, The second key.
+            limit: int, The distance above which computing stops.
+
+        Returns:
+            int: The distance, or limit + 1 if it is above the limit.
+        """
+
+        if abs(len(first) - len(second)) > limit:
+            return limit + 1
+        previous = list(range(len(second) + 1))
+        for i, char in enumerate(first, 1):
+            current = [i]
+            for j, other in enumerate(second, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1,
+                                   previous[j - 1] + (char != other)))
+            if min(current) > limit:
+                return limit + 1
+            previous = current
+        return previous[-1]
+
+    def match(self, key):
+        """Returns the known entity matching a key, None if there is none.
+
+        Args:
+            key: str, The key of the name to look for.
+        """
+
+        entity = self.entities.get(key)
+        limit = self.max_distance(key)
+        if entity is None and limit:
+            key_trigrams = self.trigrams_of(key)
+            shared = {}
+            for trigram in key_trigrams:
+                for other in self.trigrams.get(trigram, ()):
+                    shared[other] = shared.get(other, 0) + 1
+            candidates = sorted(shared, key=shared.get, reverse=True)
+            for other in candidates[:MAX_CANDIDATES]:
+                if shared[other] / len(key_trigrams) < MIN_SIMILARITY:
+                    break
+                if self.distance(key, other, limit) <= limit:
+                    return self.entities[other]
+        return entity
+
+    def lookup(self, name):
+        """Finds the entity a name would be merged into, recording
+        nothing.
+
+        Args:
+            name: str, The name to look for.
+
+        Returns:
+            The known entity matching the name, None if there is none.
+        """
+
+        return self.match(self.key(name))
+
+    def find(self, name):
+        """Finds the entity a name is merged into, and records the merge.
+
+        Args:
+            name: str, The name to look for.
+
+        Returns:
+            The known entity matching the name, None if there is none.
+        """
+
+        key = self.key(name)
+        entity = self.match(key)
+        if entity is not None:
+            # Next time the variant is found directly.
+            self.entities.setdefault(key, entity)
+            if entity.name != name:
+                self.merges.setdefault(entity.name, set()).add(name)
+        return entity
+
+    def add(self, entity):
+        """Registers a new entity under the key of its name.
+
+        Args:
+            entity: The entity to register.
+        """
+
+        key = self.key(entity.name)
+        self.entities[key] = entity
+        for trigram in self.trigrams_of(key):
+            self.trigrams.setdefault(trigram, set()).add(key)
+
+    def report(self):
+        """Returns the merges made so far.
+
+        Returns:
+            dict: The sorted merged names by canonical name.
+        """
+
+        return {name: sorted(variants)
+                for name, variants in sorted(self.merges.items())}
@@ -1,7 +1,7 @@
 """Contains the class Category."""
 
-from tabulate import tabulate
-from colorama import Style
+from backend.page_renderer import PageRenderer, PRODUCT_COLUMNS, \
+    product_cells
 from config import misc
 
 
@@ -19,8 +19,11 @@ class Category:
             until it reaches a specified page_size.
         buffer_added: A swith to check if the current buffer has been
             appended to the registry in order to print all products.
+        page_renderer: The PageRenderer shared by all categories.
     """
 
+    page_renderer = PageRenderer(PRODUCT_COLUMNS)
+
     def __init__(self, dict_category):
         """Inits a category.
 
@@ -74,27 +77,9 @@ class Category:
             page: The page to print
         """
 
-        # We add the page buffer if it is not empty.
-        # this is to prevent not printing products if buffer is not full.
-        table = [['n°', 'Name', 'Brands', 'Nutriscore']]
-        i = 1
-        for elt in self.product_registry[page]:
-            brands_to_print = ""
-            name_to_print = elt.french_name
-            if len(elt.french_name) > misc.NAME_SIZE:
-                name_to_print = f"{elt.french_name[:misc.NAME_SIZE]}" \
-                                f"{Style.DIM}...{Style.RESET_ALL}"
-            if len(elt.brands_list) == 1:
-                brands_to_print += f"{elt.brands_list[0].name}"
-            else:
-                brands_to_print += f"{elt.brands_list[0].name} " \
-                                   f"{Style.DIM}" \
-                                   f"+ {len(elt.brands_list) - 1} more..." \
-                                   f"{Style.RESET_ALL}"
-            table.append([i, name_to_print,
-                          brands_to_print, elt.nutrition_grades])
-            i += 1
-        print(tabulate(table, headers="firstrow", tablefmt="pretty"))
+        print(self.page_renderer.render((self.id, page),
+                                        self.product_registry[page],
+                                        product_cells))
 
     def buffer_check(self):
         """Appends a buffer to the registry.
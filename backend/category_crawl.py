@@ -0,0 +1,168 @@
+"""Contains the class CategoryCrawl."""
+
+import collections
+import re
+from config import api_downloads as api
+
+
+class CategoryCrawl:
+    """Picks the categories to ingest and schedules their downloads.
+
+    Categories are picked from the categories listing of OpenFoodFacts,
+        by the number of products they list, their depth in the
+        category tree and patterns on their url slug, as set in the
+        CRAWL config. The largest are picked first, until the budget of
+        products is spent.
+    Downloads run in a few threads sharing the HttpClient of the
+        APISocket, so they keep to its rate limit, and are handed over
+        in order as they complete.
+
+    Args:
+        apis: The APISocket to download with.
+        settings: dict, Like CRAWL in the api downloads config file.
+        workers: int, The downloads run at the same time.
+    """
+
+    def __init__(self, apis, settings=None, workers=api.DOWNLOAD_WORKERS):
+        self.apis = apis
+        self.settings = dict(api.CRAWL, **(settings or {}))
+        self.workers = workers
+
+    @staticmethod
+    def slug(tag):
+        """Returns the url slug of a category of the listing."""
+
+        return tag['url'].rstrip("/").rsplit("/", 1)[-1]
+
+    @staticmethod
+    def depths(taxonomy):
+        """Returns the depth of each category of the taxonomy.
+
+        Top categories, without parents, are at depth 0, the others one
+            level below their highest parent.
+
+        Args:
+            taxonomy: dict, The entry of each category, with its
+                'parents'.
+        """
+
+        depths = {}
+        for key in taxonomy:
+            path = [key]
+            while path:
+                current = path[-1]
+                parents = [parent for parent in
+                           taxonomy.get(current, {}).get('parents', ())
+                           if parent in taxonomy and parent not in path]
+                missing = [parent for parent in parents
+                           if parent not in depths]
+                if missing:
+                    path.append(missing[0])
+                    continue
+                depths[current] = min((depths[parent] + 1
+                                       for parent in parents), default=0)
+                path.pop()
+        return depths
+
+    def select(self, listing, taxonomy=None):
+        """Picks categories of the listing, largest first.
+
+        Args:
+            listing: dict, The categories listing, its categories under
+                the 'tags' key.
+            taxonomy: dict, The taxonomy of categories, needed to limit
+                the depth.
+
+        Returns:
+            list: The tags of the categories picked.
+        """
+
+        settings = self.settings
+        include = [re.compile(pattern) for pattern in settings['include']]
+        exclude = [re.compile(pattern) for pattern in settings['exclude']]
+        max_depth = settings['max_depth']
+        depths = self.depths(taxonomy or {})
+        picked = []
+        budget = settings['max_products']
+        for tag in sorted(listing['tags'],
+                          key=lambda tag: -tag.get('products', 0)):
+            slug = self.slug(tag)
+            if tag.get('products', 0) < settings['min_products']:
+                break
+            if include and not any(p.search(slug) for p in include):
+                continue
+            if any(p.search(slug) for p in exclude):
+                continue
+            if max_depth is not None \
+                    and depths.get(tag['id'], 0) > max_depth:
+                continue
+            expected = min(tag['products'], api.PAGE_SIZE)
+            if budget is not None and expected > budget:
+                continue
+            picked.append(tag)
+            if budget is not None:
+                budget -= expected
+            if len(picked) == settings['max_categories']:
+                break
+        return picked
+
+    def categories(self):
+        """Requests the categories and picks the ones to ingest.
+
+        Returns:
+            list: The name and url of each category, largest first.
+        """
+
+        listing = self.apis.request_categories()
+        taxonomy = None
+        if self.settings['max_depth'] is not None:
+            taxonomy = self.apis.request_taxonomy()
+        picked = self.select(listing, taxonomy)
+        print(f"Picked {len(picked)} categories of {len(listing['tags'])}.")
+        return [{'name': tag['name'],
+                 'url': api.BASE_CAT_URL + self.slug(tag)}
+                for tag in picked]
+
+    def downloads(self, categories):
+        """Downloads the products of categories, several at a time.
+
+        A few more downloads than workers are kept ahead of the one
+            handed over, so workers are never idle and memory stays
+            bounded. Downloads not started are cancelled if the caller
+            stops early.
+
+        Args:
+            categories: list, The categories to download, in order.
+
+        Yields:
+            tuple: Each category, in order, with its download as
+                returned by APISocket.download_products().
+
+        Raises:
+            requests.RequestException: A download failed, see
+                HttpClient.get().
+        """
+
+        # Threads are only needed while ingesting.
+        from concurrent.futures import ThreadPoolExecutor
+
+        todo = iter(categories)
+        pending = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="download") as executor:
+            try:
+                for category in todo:
+                    pending.append((category, executor.submit(
+                        self.apis.download_products, category.url)))
+                    if len(pending) == 2 * self.workers:
+                        break
+                while pending:
+                    category, future = pending.popleft()
+                    following = next(todo, None)
+                    if following is not None:
+                        pending.append((following, executor.submit(
+                            self.apis.download_products, following.url)))
+                    yield category, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
@@ -0,0 +1,245 @@
+"""Contains the class CategoryIndex."""
+
+from backend.nutrition_grade import UNGRADED
+
+
+def positions_of(bitmap):
+    """Yields the positions of the bits set in a bitmap.
+
+    Args:
+        bitmap: int, The bitmap to read.
+    """
+
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for i, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield i * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+class CategoryIndex:
+    """Category membership of the products as bitsets.
+
+    Each product gets a position. Each category keeps a bitmap of the
+        positions of its products, and each product a bitset of its
+        category ids. The candidates to replace a product are found by
+        or-ing the bitmaps of its categories and and-ing the result
+        with the bitmap of the grades at least as good as its own, which
+        costs the same whatever the number of categories.
+    Each store also keeps a bitmap of the positions of its products,
+        so candidates can be restricted to the products available in a
+        few stores with one more and.
+
+    Attributes:
+        positions: dict, The position of each product by id.
+        products: list, The products by position.
+        memberships: list, The bitset of category ids of each product.
+        members: dict, The bitmap of each category, by category id,
+            stored as a bytearray while it is being filled.
+        grades: dict, The bitmap of each nutrition grade ordinal, stored
+            the same way.
+        grade_of: bytearray, The grade ordinal of each product by
+            position, UNGRADED if it has none.
+        stores: dict, The bitmap of each store, by store id, stored the
+            same way.
+        bitmaps: dict, Bitmaps converted to int, dropped when changed.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.products = []
+        self.memberships = []
+        self.members = {}
+        self.grades = {}
+        self.grade_of = bytearray()
+        self.stores = {}
+        self.bitmaps = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    @staticmethod
+    def set_bit(bitmap, position):
+        """Sets a bit in a bytearray bitmap, growing it if needed."""
+
+        if len(bitmap) <= position >> 3:
+            bitmap.extend(bytes((position >> 3) + 1 - len(bitmap)))
+        bitmap[position >> 3] |= 1 << (position & 7)
+
+    def add(self, product, category_ids=None):
+        """Indexes a product and the categories it belongs to.
+
+        A product already indexed gets its new categories added.
+
+        Args:
+            product: The product to index.
+            category_ids: iterable, The ids of the categories of the
+                product. Read from its categories_list if None.
+        """
+
+        if category_ids is None:
+            category_ids = [category.id for category
+                            in product.categories_list]
+        position = self.positions.get(product.id)
+        if position is None:
+            position = len(self.products)
+            self.positions[product.id] = position
+            self.products.append(product)
+            self.memberships.append(0)
+            grade = product.nutrition_grades
+            self.grade_of.append(UNGRADED if grade is None else grade)
+            if grade is not None:
+                self.set_bit(self.grades.setdefault(grade, bytearray()),
+                             position)
+                self.bitmaps.pop(('grade', grade), None)
+        for category_id in category_ids:
+            if not self.memberships[position] >> category_id & 1:
+                self.memberships[position] |= 1 << category_id
+                self.set_bit(self.members.setdefault(category_id,
+                                                     bytearray()),
+                             position)
+                self.bitmaps.pop(('category', category_id), None)
+
+    def add_store(self, product_id, store_id):
+        """Records that a product can be found in a store.
+
+        Args:
+            product_id: int, The id of an indexed product.
+            store_id: int, The id of the store.
+        """
+
+        position = self.positions.get(product_id)
+        if position is not None:
+            self.set_bit(self.stores.setdefault(store_id, bytearray()),
+                         position)
+            self.bitmaps.pop(('store', store_id), None)
+
+    def bitmap(self, kind, key):
+        """Returns a bitmap as an int.
+
+        Args:
+            kind: str, Either 'category', 'grade' or 'store'.
+            key: The category id, the grade ordinal or the store id.
+        """
+
+        name = (kind, key)
+        if name not in self.bitmaps:
+            source = {'category': self.members,
+                      'grade': self.grades,
+                      'store': self.stores}[kind]
+            self.bitmaps[name] = int.from_bytes(source.get(key, b""),
+                                                "little")
+        return self.bitmaps[name]
+
+    def categories_of(self, product):
+        """Returns the ids of the categories a product belongs to."""
+
+        position = self.positions.get(product.id)
+        if position is None:
+            return []
+        return list(positions_of(self.memberships[position]))
+
+    def signature(self, product):
+        """Returns the category bitset and grade of a product.
+
+        Products with the same signature have the same candidates.
+
+        Returns:
+            tuple: The signature, None if the product is not indexed or
+                has no grade.
+        """
+
+        position = self.positions.get(product.id)
+        if position is None or self.grade_of[position] == UNGRADED:
+            return None
+        return self.memberships[position], self.grade_of[position]
+
+    def availability(self, store_ids):
+        """Returns the bitmap of the products found in any of the stores.
+
+        Args:
+            store_ids: iterable, The ids of the stores.
+        """
+
+        available = 0
+        for store_id in store_ids:
+            available |= self.bitmap('store', store_id)
+        return available
+
+    def shortlist(self, signature, limit, skip=None, within=None):
+        """Ranks the candidates matching a signature.
+
+        Candidates belong to at least one of the categories and have a
+            grade at least as good. They are ranked by the number of
+            categories they share with the signature, then by grade.
+
+        Args:
+            signature: tuple, The category bitset and the grade ordinal.
+            limit: int, The maximum number of candidates.
+            skip: callable, Tells from a candidate position if it must
+                be left out.
+            within: int, A bitmap candidates must belong to, if any.
+
+        Returns:
+            list: The candidates, best first.
+        """
+
+        categories, grade = signature
+        # shared[j] holds the positions found in more than j of the
+        # categories, counted with bitwise operations only.
+        shared = []
+        for category_id in positions_of(categories):
+            members = self.bitmap('category', category_id)
+            shared.append(0)
+            for j in range(len(shared) - 1, 0, -1):
+                shared[j] |= shared[j - 1] & members
+            shared[0] |= members
+        if within is not None:
+            shared = [found & within for found in shared]
+        # Buckets are read from the most categories shared and the best
+        # grade, so positions are only listed until the limit is met.
+        ranked = []
+        more = 0
+        for found in reversed(shared):
+            exact = found & ~more
+            more = found
+            for better in range(grade + 1):
+                bucket = exact & self.bitmap('grade', better)
+                for candidate in positions_of(bucket):
+                    if skip is not None and skip(candidate):
+                        continue
+                    ranked.append(candidate)
+                    if len(ranked) == limit:
+                        return [self.products[candidate]
+                                for candidate in ranked]
+        return [self.products[candidate] for candidate in ranked]
+
+    def candidates(self, product, limit, store_ids=None):
+        """Finds the best candidates to replace a product.
+
+        The product itself and products of the same name are left out.
+            See shortlist() for additional information.
+
+        Args:
+            product: The product to replace.
+            limit: int, The maximum number of candidates.
+            store_ids: iterable, If given, only products found in one of
+                these stores are candidates.
+
+        Returns:
+            list: The candidates, best first.
+        """
+
+        signature = self.signature(product)
+        if signature is None:
+            return []
+        position = self.positions[product.id]
+        within = None
+        if store_ids:
+            within = self.availability(store_ids)
+        return self.shortlist(
+            signature, limit,
+            lambda candidate: candidate == position
+            or self.products[candidate].french_name == product.french_name,
+            within)
@@ -0,0 +1,61 @@
+"""Contains the class ConnectionPool."""
+
+import contextlib
+import queue
+import threading
+import pymysql
+from backend.db_socket import DBSocket
+from config import misc
+
+
+class ConnectionPool:
+    """Shares a few db connections between threads.
+
+    A thread borrows a DBSocket for the time of a few queries then gives
+        it back. Connections are opened on demand, up to the size of the
+        pool, and threads wait for one to be given back beyond that. A
+        connection which raised a db error is closed instead of being
+        given back, in case it is broken.
+
+    Args:
+        size: int, The maximum number of connections.
+        factory: callable, Opens a DBSocket.
+
+    Attributes:
+        idle: LifoQueue, The connections not borrowed. The most recently
+            used one is borrowed first, so the others may time out
+            without hurting.
+        slots: BoundedSemaphore, Counts the connections left to borrow.
+    """
+
+    def __init__(self, size=misc.DB_POOL_SIZE, factory=DBSocket.reader):
+        self.factory = factory
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Lends a DBSocket for the duration of a with block."""
+
+        with self.slots:
+            try:
+                socket = self.idle.get_nowait()
+            except queue.Empty:
+                socket = self.factory()
+            try:
+                yield socket
+            except pymysql.err.MySQLError:
+                socket.connection.close()
+                raise
+            finally:
+                if socket.connection.open:
+                    self.idle.put(socket)
+
+    def close(self):
+        """Closes the idle connections."""
+
+        while True:
+            try:
+                self.idle.get_nowait().connection.close()
+            except queue.Empty:
+                return
@@ -1,9 +1,22 @@
 """Contains the class DBSocket"""
 
+import atexit
+import time
 import pymysql
+from backend.query_stats import QueryStats, EXPLAINABLE
 from config import sql_queries as sql
 from config import database_connection as db_info
 from config import colorama_cfg as color
+from config import misc
+
+# Tables replaced at once by a refresh in shadow tables.
+SHADOWED_TABLES = ('categories', 'products', 'category_products', 'brands',
+                   'stores', 'product_brands', 'product_stores', 'favorites',
+                   'product_favorites')
+# Suffixes of the databases holding the shadow tables during a refresh,
+# and the old tables while they are swapped.
+SHADOW_SUFFIX = "_shadow"
+OLD_SUFFIX = "_old"
 
 
 class DBSocket:
@@ -27,10 +40,13 @@ class DBSocket:
         cursor: A pymysql cursor object. This is the object used to
             interact with the database.
         db_is_empty: Boolean True if db is empty False otherwise.
+        stats: The QueryStats of the queries of every DBSocket.
 
     """
 
-    def __init__(self, script):
+    stats = QueryStats()
+
+    def __init__(self, script, interactive=True):
         """Inits an instance of DBSocket.
 
         A check is made to verify prior existence to a database and if
@@ -41,23 +57,109 @@ class DBSocket:
 
         Args:
             script: SQL script containing the database architecture.
+            interactive: False to never wait for the user.
         """
 
         create_db = bool()
-        self.connection, create_db = self.check_db()
+        self.connection, create_db = self.check_db(interactive)
         self.cursor = self.connection.cursor()
         if create_db:
             self.setup_db(script)
             self.db_is_empty = True
         else:
+            self.migrate_grades()
+            self.migrate_favorites()
+            self.migrate_checkpoints()
             self.check_if_db_is_empty()
 
     @staticmethod
-    def check_db():
+    def connect(with_db=True, **options):
+        """Opens a connection with the server of the config folder.
+
+        Args:
+            with_db: False to connect without selecting the database,
+                when it does not exist yet.
+            **options: Other arguments of pymysql.connect().
+
+        Returns:
+            connection: a pymysql connection object.
+        """
+
+        if with_db:
+            options['db'] = db_info.mariadb['db']
+        return pymysql.connect(
+            host=db_info.mariadb['host'],
+            user=db_info.mariadb['user'],
+            password=db_info.mariadb['password'],
+            charset=db_info.mariadb['charset'],
+            cursorclass=db_info.mariadb['cursorclass'],
+            **options)
+
+    @classmethod
+    def reader(cls):
+        """Returns a socket on its own connection to an existing db.
+
+        Nothing is checked or created. The connection commits each
+            query so it always reads the latest state of the db.
+        """
+
+        socket = cls.__new__(cls)
+        socket.connection = cls.connect(autocommit=True)
+        socket.cursor = socket.connection.cursor()
+        socket.db_is_empty = False
+        return socket
+
+    def execute(self, name, params=None, query=None):
+        """Runs a query of the sql queries config file and times it.
+
+        The query is counted in stats, and logged with how the db runs
+            it if it is slow.
+
+        Args:
+            name: str, The name of the query in the config file.
+            params: The parameters of the query, if any.
+            query: str, The query to run when it is built from the one
+                of the config file, with format() for instance.
+
+        Returns:
+            int: The rows the query returned or changed.
+        """
+
+        query = query or getattr(sql, name)
+        start = time.perf_counter()
+        rows = self.cursor.execute(query, params)
+        seconds = time.perf_counter() - start
+        self.stats.record(name, seconds, rows)
+        if self.stats.is_slow(seconds):
+            self.stats.log_slow(name, query, params, seconds,
+                                self.explain(query, params))
+        return rows
+
+    def explain(self, query, params=None):
+        """Returns how the db runs a query, None if it cannot tell.
+
+        The query is explained on its own cursor so the rows of the
+            query itself are kept.
+        """
+
+        if not query.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("EXPLAIN " + query, params)
+                return cursor.fetchall()
+        except pymysql.err.MySQLError:
+            return None
+
+    @staticmethod
+    def check_db(interactive=True):
         """Checks whether a database exists if not, creates it.
 
         Connection information can be found in config folder.
 
+        Args:
+            interactive: False to never wait for the user.
+
         Returns:
             connection: a pymysql connection object.
 
@@ -69,26 +171,17 @@ class DBSocket:
 
         print("Checking for pre existing database....")
         try:
-            connection = pymysql.connect(
-                host=db_info.mariadb['host'],
-                user=db_info.mariadb['user'],
-                password=db_info.mariadb['password'],
-                db=db_info.mariadb['db'],
-                charset=db_info.mariadb['charset'],
-                cursorclass=db_info.mariadb['cursorclass'])
+            connection = DBSocket.connect()
             print("Database detected and connection successful.")
             create_db = False
-            input("Press enter key...")
+            if interactive:
+                input("Press enter key...")
         except pymysql.err.OperationalError:
             print("No database detected.")
-            connection = pymysql.connect(
-                host=db_info.mariadb['host'],
-                user=db_info.mariadb['user'],
-                password=db_info.mariadb['password'],
-                charset=db_info.mariadb['charset'],
-                cursorclass=db_info.mariadb['cursorclass'])
+            connection = DBSocket.connect(with_db=False)
             create_db = True
-            input("Press enter key...")
+            if interactive:
+                input("Press enter key...")
         return connection, create_db
 
     def check_if_db_is_empty(self):
@@ -99,6 +192,97 @@ class DBSocket:
         else:
             self.db_is_empty = False
 
+    def migrate_grades(self):
+        """Stores grades as ordinals in a database created before they were.
+
+        Older databases keep grades in a char(1) column, as letters or,
+            once ordinals were written to it, as digits. Both are turned
+            into ordinals, anything else into NULL, then the column
+            becomes a tinyint like in the SQL script. The index on the
+            grades of products is added if missing, so grades are
+            filtered by range as in a new database. Databases up to
+            date are left as they are.
+
+        Returns:
+            list: The tables migrated.
+        """
+
+        migrated = []
+        for table in ("products", "favorites"):
+            self.execute('GRADES_TYPE', (table,))
+            row = self.cursor.fetchone()
+            if row is None or row['DATA_TYPE'].lower() == "tinyint":
+                continue
+            print(f"{color.plus_prfx} Storing the grades of {table} "
+                  f"as ordinals")
+            self.execute('GRADES_TO_ORDINALS',
+                         query=sql.GRADES_TO_ORDINALS.format(table))
+            self.execute('GRADES_TO_TINYINT',
+                         query=sql.GRADES_TO_TINYINT.format(table))
+            migrated.append(table)
+        if not self.execute('GRADES_INDEX'):
+            print(f"{color.plus_prfx} Indexing the grades of products")
+            self.execute('ADD_GRADES_INDEX')
+        self.connection.commit()
+        return migrated
+
+    def migrate_checkpoints(self):
+        """Creates the checkpoints table in a database created before it.
+
+        A refresh reads its checkpoints first, see Brain.update_db().
+        """
+
+        self.execute('CREATE_CHECKPOINTS')
+        self.connection.commit()
+
+    def has_constraint(self, table, constraint):
+        """Tells whether a table of the db has a constraint.
+
+        Args:
+            table: str, The name of the table.
+            constraint: str, The name of the constraint.
+        """
+
+        return bool(self.execute('HAS_CONSTRAINT', (table, constraint)))
+
+    def migrate_favorites(self):
+        """Adds the unique keys of favorites to a database created before
+        them.
+
+        Saving a favorite relies on them to find the favorite of a
+            product saved already, and to link it to a product once, see
+            save_favorite(). Favorites saved several times are merged
+            into the first one and links saved several times are kept
+            once, then the keys are added.
+
+        Returns:
+            list: The tables migrated.
+        """
+
+        migrated = []
+        if not self.has_constraint("favorites", "uq_favorites_original_id"):
+            print(f"{color.plus_prfx} Merging favorites saved twice")
+            for name in ('KEEP_FIRST_FAVS', 'RELINK_FAV_DUPS',
+                         'DEL_FAV_DUPS', 'DROP_KEPT_FAVS', 'ADD_UQ_FAVS'):
+                self.execute(name)
+            migrated.append("favorites")
+        if not self.has_constraint("product_favorites", "uq_pf_link"):
+            print(f"{color.plus_prfx} Merging favorite links saved twice")
+            self.connection.begin()
+            try:
+                for name in ('KEEP_PROD_FAV_LINKS', 'EMPTY_PROD_FAVS',
+                             'RESTORE_PROD_FAV_LINKS'):
+                    self.execute(name)
+                self.connection.commit()
+            except pymysql.err.MySQLError:
+                self.connection.rollback()
+                raise
+            self.execute('DROP_KEPT_LINKS')
+            self.execute('ADD_UQ_PROD_FAVS')
+            migrated.append("product_favorites")
+        self.connection.commit()
+        return migrated
+
     def setup_db(self, script):
         """Sets the database up by running an SQL script.
 
@@ -107,7 +291,17 @@ class DBSocket:
         """
 
         print("Creating a new database \"p5_openfoodfacts\"")
-        # Execute sql script
+        for statement in self.read_script(script):
+            self.execute('setup_db', query=statement)
+
+    @staticmethod
+    def read_script(script):
+        """Yields the statements of an SQL script.
+
+        Args:
+            script: The path of the SQL script.
+        """
+
         statement = ""
         with open(script, 'r', encoding="utf-8") as sql_script:
             for line in sql_script:
@@ -116,9 +310,9 @@ class DBSocket:
                 if not line.strip().endswith(
                         ';'):  # keep appending lines that don't end in ';'
                     statement = statement + line
-                else:  # line ending in ';' > exec statement and reset for next
+                else:  # line ending in ';' > yield statement and reset
                     statement = statement + line
-                    self.cursor.execute(statement)
+                    yield statement
                     statement = ""
 
     def cat_insertion_v2(self, category):
@@ -128,9 +322,7 @@ class DBSocket:
             category: The category to insert.
         """
 
-        self.cursor.execute(sql.INS_CAT,
-                            (category.french_name,
-                             category.url))
+        self.execute('INS_CAT', (category.french_name, category.url))
         self.connection.commit()
 
     def product_insertion_v2(self, product):
@@ -153,8 +345,8 @@ class DBSocket:
         """
 
         try:
-            self.cursor.execute(
-                sql.INS_PROD,
+            self.execute(
+                'INS_PROD',
                 (product.french_name, product.url, product.nutrition_grades))
             return True
         except pymysql.err.DataError:
@@ -170,7 +362,7 @@ class DBSocket:
             product: The product to insert.
         """
 
-        self.cursor.execute(sql.INS_CAT_PROD, (category.id, product.id))
+        self.execute('INS_CAT_PROD', (category.id, product.id))
 
     def prod_stores_insertion(self, product, store):
         """Insert a link between a store and a product in db.
@@ -180,7 +372,7 @@ class DBSocket:
             product: The product to insert.
         """
 
-        self.cursor.execute(sql.INS_PROD_STORES, (product.id, store.id))
+        self.execute('INS_PROD_STORES', (product.id, store.id))
 
     def prod_fav_insertion(self, product_id, favorite_id):
         """Insert a link between a favorite and a product in db.
@@ -191,7 +383,7 @@ class DBSocket:
         """
 
         try:
-            self.cursor.execute(sql.INS_PROD_FAV, (product_id, favorite_id))
+            self.execute('INS_PROD_FAV', (product_id, favorite_id))
         except pymysql.err.IntegrityError as error:
             print("Fatal error. Check query using cursor._last_executed.")
             print(error)
@@ -200,7 +392,7 @@ class DBSocket:
     def prod_fav_del(self, product, fav):
         """Deletes an entry in the products_favorite table."""
 
-        self.cursor.execute(sql.DEL_PROD_FAV, (product.id, fav.id))
+        self.execute('DEL_PROD_FAV', (product.id, fav.id))
         self.connection.commit()
 
     def prod_brands_insertion(self, product, brand):
@@ -210,32 +402,32 @@ class DBSocket:
             brand: The brand to insert.
             product: The product to insert.
         """
-        self.cursor.execute(sql.INS_PROD_BRANDS, (product.id, brand.id))
+        self.execute('INS_PROD_BRANDS', (product.id, brand.id))
 
     def store_insertion(self, store):
         """Adds a store to the database."""
 
         try:
-            self.cursor.execute(sql.INS_STORE, (store.name, store.url))
+            self.execute('INS_STORE', (store.name, store.url))
             return True
         except pymysql.err.DataError:
-            self.cursor.execute(sql.INS_STORE, ("n/a", "n/a"))
+            self.execute('INS_STORE', ("n/a", "n/a"))
             return False
 
     def brand_insertion(self, brand):
         """Adds a brand to the database."""
 
         try:
-            self.cursor.execute(sql.INS_BRAND, (brand.name, brand.url))
+            self.execute('INS_BRAND', (brand.name, brand.url))
             return True
         except pymysql.err.DataError:
-            self.cursor.execute(sql.INS_BRAND, ("n/a", "n/a"))
+            self.execute('INS_BRAND', ("n/a", "n/a"))
             return False
 
     def get_max_id_from_fav(self):
         """Returns the maximum id from the favorites table"""
 
-        self.cursor.execute(sql.QUERY_MAX)
+        self.execute('QUERY_MAX')
         return self.cursor.fetchall()
 
     def clear_table(self, *table):
@@ -248,15 +440,208 @@ class DBSocket:
         i = 0
         while i < len(table):
             print(f"{color.minus_prfx} Deleting {table[i]}")
-            self.cursor.execute(sql.EMPTY_TABLE.format(table[i]))
-            self.cursor.execute(sql.RST_INDEX.format(table[i]))
+            self.execute('EMPTY_TABLE',
+                         query=sql.EMPTY_TABLE.format(table[i]))
+            self.execute('RST_INDEX', query=sql.RST_INDEX.format(table[i]))
             i += 1
         self.connection.commit()
 
+    def reset_ids(self, *tables):
+        """Sets the next id of tables right after their last row.
+
+        Ids taken by rows rolled back are otherwise skipped, and would
+            not match the ids given in memory.
+
+        Args:
+            *tables: The tables to reset.
+        """
+
+        for table in tables:
+            self.execute('RST_INDEX', query=sql.RST_INDEX.format(table))
+
+    def get_checkpoints(self):
+        """Returns the checkpoints of the refresh in progress.
+
+        Returns:
+            dict: The row of each step done, by step.
+        """
+
+        self.execute('GET_CHECKPOINTS')
+        return {row['step']: row for row in self.cursor.fetchall()}
+
+    def save_checkpoint(self, step, products=0):
+        """Marks a step of the refresh as done and commits.
+
+        Everything inserted since the last commit is committed with the
+            checkpoint, so a step is either done and saved, or neither.
+
+        Args:
+            step: str, The name of the step.
+            products: int, The products the step saved.
+        """
+
+        self.execute('INS_CHECKPOINT', (step, products))
+        self.connection.commit()
+
+    def clear_checkpoints(self):
+        """Forgets the checkpoints, once a refresh is over."""
+
+        self.execute('DEL_CHECKPOINTS')
+        self.connection.commit()
+
+    def open_shadow(self, script=db_info.mariadb['sql_file']):
+        """Creates empty shadow tables and returns a socket to them.
+
+        Shadow tables are made by the SQL script in a database of their
+            own, next to the db, so they keep the indexes and foreign
+            keys of the db under the same names. Queries of the socket
+            returned go to them, while the db is still read as usual.
+
+        Args:
+            script: The SQL script containing the database architecture.
+
+        Returns:
+            DBSocket: The socket to the shadow tables.
+        """
+
+        shadow = db_info.mariadb['db'] + SHADOW_SUFFIX
+        self.execute('DROP_DB', query=sql.DROP_DB.format(shadow))
+        self.execute('CREATE_DB', query=sql.CREATE_DB.format(shadow))
+        socket = self.__class__.__new__(self.__class__)
+        socket.connection = self.connect(with_db=False, db=shadow)
+        socket.cursor = socket.connection.cursor()
+        socket.db_is_empty = True
+        for statement in self.read_script(script):
+            if not statement.lstrip().upper().startswith(
+                    ("CREATE DATABASE", "USE ")):
+                socket.execute('setup_db', query=statement)
+        return socket
+
+    def keep_favorites(self, shadow):
+        """Copies the favorites into the shadow tables.
+
+        Favorites and their links keep pointing to the same products,
+            found again by url among the new ones. Those whose product
+            is gone are dropped.
+
+        Args:
+            shadow: The DBSocket of open_shadow().
+
+        Returns:
+            int: The favorites kept.
+        """
+
+        name = db_info.mariadb['db'] + SHADOW_SUFFIX
+        kept = self.execute(
+            'KEEP_FAVORITES', query=sql.KEEP_FAVORITES.format(name))
+        self.execute('KEEP_PROD_FAVS', query=sql.KEEP_PROD_FAVS.format(name))
+        self.connection.commit()
+        return kept
+
+    def swap(self, shadow):
+        """Replaces the tables of the db with the shadow tables.
+
+        Tables are renamed in a single statement, which is atomic, so
+            readers see either the old tables or the new ones. The old
+            ones are dropped afterwards.
+        Foreign keys follow the table they reference when it is renamed,
+            across databases too. Every table they link is in
+            SHADOWED_TABLES, so the shadow tables keep referencing each
+            other once in the db. Foreign keys still referencing another
+            database after the swap, from a table left out, are pointed
+            back to the db by repoint_foreign_keys() before the old
+            tables are dropped.
+
+        Args:
+            shadow: The DBSocket of open_shadow(), closed once done.
+        """
+
+        live = db_info.mariadb['db']
+        name = live + SHADOW_SUFFIX
+        old = live + OLD_SUFFIX
+        shadow.connection.close()
+        self.execute('DROP_DB', query=sql.DROP_DB.format(old))
+        self.execute('CREATE_DB', query=sql.CREATE_DB.format(old))
+        renames = ", ".join(f"{live}.{table} TO {old}.{table}, "
+                            f"{name}.{table} TO {live}.{table}"
+                            for table in SHADOWED_TABLES)
+        self.execute('RENAME_TABLES',
+                     query=sql.RENAME_TABLES.format(renames))
+        self.repoint_foreign_keys()
+        self.execute('DROP_DB', query=sql.DROP_DB.format(old))
+        self.execute('DROP_DB', query=sql.DROP_DB.format(name))
+
+    def repoint_foreign_keys(self):
+        """Points foreign keys referencing another database to the db.
+
+        Returns:
+            int: The foreign keys pointed back.
+        """
+
+        live = db_info.mariadb['db']
+        self.execute('QUERY_STRAY_FKS', (live, live))
+        stray = self.cursor.fetchall()
+        for key in stray:
+            print(f"{color.minus_prfx} Pointing {key['table_name']}."
+                  f"{key['constraint_name']} back to {live}")
+            self.execute('DROP_FK', query=sql.DROP_FK.format(
+                live, key['table_name'], key['constraint_name']))
+            self.execute('ADD_FK', query=sql.ADD_FK.format(
+                live, key['table_name'], key['constraint_name'],
+                key['column_name'], key['referenced_table'],
+                key['referenced_column'], key['delete_rule']))
+        return len(stray)
+
+    def drop_shadow(self, shadow):
+        """Drops the shadow tables of a refresh that failed.
+
+        Args:
+            shadow: The DBSocket of open_shadow(), closed once done.
+        """
+
+        name = db_info.mariadb['db'] + SHADOW_SUFFIX
+        if shadow.connection.open:
+            shadow.connection.close()
+        self.execute('DROP_DB', query=sql.DROP_DB.format(name))
+
+    def get_stamp(self):
+        """Returns a stamp of the current state of the db.
+
+        The stamp changes whenever the catalog or the favorites change.
+            It is split in two so snapshots can tell which part of them
+            is stale.
+
+        Returns:
+            dict: The catalog and favorites parts of the stamp.
+        """
+
+        self.execute('DB_STAMP')
+        row = {key: int(value) for key, value in self.cursor.fetchone().items()}
+        favorites = {key: row.pop(key) for key in
+                     ('favorites', 'favorites_crc', 'product_favorites',
+                      'product_favorites_crc')}
+        return {'catalog': row, 'favorites': favorites}
+
+    def dump_tables(self, *tables):
+        """Returns every row of several tables.
+
+        Args:
+            *tables: The tables to dump.
+
+        Returns:
+            dict: The rows of each table.
+        """
+
+        rows = {}
+        for table in tables:
+            self.execute('DUMP_TABLE', query=sql.DUMP_TABLE.format(table))
+            rows[table] = self.cursor.fetchall()
+        return rows
+
     def get_categories(self):
         """Returns all categories from the program database."""
 
-        self.cursor.execute(sql.GET_CAT)
+        self.execute('GET_CAT')
         return self.cursor.fetchall()
 
     def get_brands_from_prod(self, product_id):
@@ -269,7 +654,7 @@ class DBSocket:
             self.cursor.fetchall(): list containing products.
         """
 
-        self.cursor.execute(sql.QUERY_BRAND_FROM_PROD, product_id)
+        self.execute('QUERY_BRAND_FROM_PROD', product_id)
         return self.cursor.fetchall()
 
     def get_stores_from_prod(self, product_id):
@@ -282,7 +667,63 @@ class DBSocket:
             self.cursor.fetchall(): list containing products.
         """
 
-        self.cursor.execute(sql.QUERY_STORE_FROM_PROD, product_id)
+        self.execute('QUERY_STORE_FROM_PROD', product_id)
+        return self.cursor.fetchall()
+
+    @staticmethod
+    def placeholders(count):
+        """Returns the placeholders of an IN clause.
+
+        Args:
+            count: int, The number of values in the clause.
+        """
+
+        return ", ".join(["%s"] * count)
+
+    def get_brands_from_prods(self, product_ids):
+        """Returns the links between several products and their brands.
+
+        Args:
+            product_ids: list, The ids of the products.
+
+        Returns:
+            self.cursor.fetchall(): list of product_id, brand_id rows.
+        """
+
+        self.execute('QUERY_BRANDS_FROM_PRODS', product_ids,
+                     sql.QUERY_BRANDS_FROM_PRODS.format(
+                         self.placeholders(len(product_ids))))
+        return self.cursor.fetchall()
+
+    def get_stores_from_prods(self, product_ids):
+        """Returns the links between several products and their stores.
+
+        Args:
+            product_ids: list, The ids of the products.
+
+        Returns:
+            self.cursor.fetchall(): list of product_id, store_id rows.
+        """
+
+        self.execute('QUERY_STORES_FROM_PRODS', product_ids,
+                     sql.QUERY_STORES_FROM_PRODS.format(
+                         self.placeholders(len(product_ids))))
+        return self.cursor.fetchall()
+
+    def get_prods_from_favs(self, favorite_ids):
+        """Returns the products linked to several favorites.
+
+        Args:
+            favorite_ids: list, The ids of the favorites.
+
+        Returns:
+            self.cursor.fetchall(): list of products along with the id
+                of the favorite they are linked to.
+        """
+
+        self.execute('QUERY_PRODS_FROM_FAVS', favorite_ids,
+                     sql.QUERY_PRODS_FROM_FAVS.format(
+                         self.placeholders(len(favorite_ids))))
         return self.cursor.fetchall()
 
     def get_products_from_cat(self, category):
@@ -295,53 +736,49 @@ class DBSocket:
             self.cursor.fetchall(): list containing products.
         """
 
-        self.cursor.execute(sql.QUERY_PROD_FROM_CAT, category.french_name)
+        self.execute('QUERY_PROD_FROM_CAT', category.french_name)
         return self.cursor.fetchall()
 
     def get_prod_from_fav(self, favorite_id):
         """Returns products linked to a favorite."""
 
-        self.cursor.execute(sql.QUERY_PROD_FROM_FAV, favorite_id)
+        self.execute('QUERY_PROD_FROM_FAV', favorite_id)
         return self.cursor.fetchall()
 
     def get_saved_products_v2(self):
         """Returns all products previously saved by user in database."""
 
-        self.cursor.execute(sql.GET_SAVED)
+        self.execute('GET_SAVED')
         return self.cursor.fetchall()
 
     def get_brands(self):
         """Returns all products previously saved by user in database."""
 
-        self.cursor.execute(sql.QUERY_BRAND)
+        self.execute('QUERY_BRAND')
         return self.cursor.fetchall()
 
-    def get_stores(self):
-        """Returns all products previously saved by user in database."""
+    def get_brand_links(self):
+        """Returns every link between a product and a brand."""
 
-        self.cursor.execute(sql.QUERY_STORE)
+        self.execute('QUERY_BRAND_LINKS')
         return self.cursor.fetchall()
 
-    def get_saved_products(self):
-        """Returns all products previously saved by user in database."""
+    def get_store_links(self):
+        """Returns every link between a product and a store."""
 
-        self.cursor.execute(sql.GET_SAVED)
+        self.execute('QUERY_STORE_LINKS')
         return self.cursor.fetchall()
 
-    def get_substitutes_v2(self, product):
-        """Returns all substitutes of a specified product.
-
-        Args:
-            product: the product which user wants substitutes from.
+    def get_stores(self):
+        """Returns all products previously saved by user in database."""
 
-        Returns:
-            self.cursor.fetchall(): list containing products.
+        self.execute('QUERY_STORE')
+        return self.cursor.fetchall()
 
-        """
+    def get_saved_products(self):
+        """Returns all products previously saved by user in database."""
 
-        self.cursor.execute(sql.FIND_SUBST,
-                            (product.categories_list[0].id,
-                             product.nutrition_grades, product.french_name))
+        self.execute('GET_SAVED')
         return self.cursor.fetchall()
 
     def delete_saved_substitute(self, subst):
@@ -352,7 +789,8 @@ class DBSocket:
         """
 
         # Match in the database is made using the original id.
-        self.cursor.execute(sql.DEL_SAVED.format(subst.original_id))
+        self.execute('DEL_SAVED',
+                     query=sql.DEL_SAVED.format(subst.original_id))
         self.connection.commit()
 
     def save_to_db_v2(self, subst):
@@ -362,11 +800,80 @@ class DBSocket:
             subst: The subst to save to the database.
         """
         try:
-            self.cursor.execute(sql.INS_SAVED.format(subst.original_id,
-                                                     subst.french_name,
-                                                     subst.url,
-                                                     subst.nutrition_grades,
-                                                     ))
+            self.execute('INS_SAVED',
+                         query=sql.INS_SAVED.format(subst.original_id,
+                                                    subst.french_name,
+                                                    subst.url,
+                                                    subst.nutrition_grades,
+                                                    ))
         except:
             print("Insertion error. Check cursor._last_executed.")
         self.connection.commit()
+
+    def save_favorite(self, substitute, product):
+        """Saves a substitute as replacing a product, in one transaction.
+
+        A substitute already saved keeps its favorite and only gets
+            linked to the product. Nothing is saved if the ids of the
+            products name other products in the db, as they do once a
+            new catalog is swapped in, see swap().
+
+        Args:
+            substitute: The product to save as a favorite.
+            product: The product it replaces.
+
+        Returns:
+            tuple: The id of the favorite, and False if it already
+                replaced the product. None if the products are not the
+                ones of the db.
+
+        Raises:
+            pymysql.err.MySQLError: Nothing was saved.
+        """
+
+        self.connection.begin()
+        try:
+            self.execute('QUERY_PRODUCT_URLS', (substitute.id, product.id),
+                         sql.QUERY_PRODUCT_URLS.format(self.placeholders(2)))
+            urls = {row['id']: row['url'] for row in self.cursor.fetchall()}
+            if urls.get(substitute.id) != substitute.url \
+                    or urls.get(product.id) != product.url:
+                self.connection.rollback()
+                return None
+            self.execute('INS_FAV', (substitute.id,
+                                     substitute.french_name,
+                                     substitute.url,
+                                     substitute.nutrition_grades))
+            favorite_id = self.cursor.lastrowid
+            self.execute('INS_PROD_FAV_ONCE', (product.id, favorite_id))
+            linked = self.cursor.rowcount > 0
+            self.connection.commit()
+        except pymysql.err.MySQLError:
+            self.connection.rollback()
+            raise
+        return favorite_id, linked
+
+    def delete_favorite(self, original_id):
+        """Deletes a favorite and its links to the products it replaces.
+
+        Args:
+            original_id: int, The id of the favorite in the products
+                table.
+
+        Returns:
+            bool: False if there was no such favorite.
+        """
+
+        self.execute('DEL_FAV', (original_id,))
+        self.connection.commit()
+        return self.cursor.rowcount > 0
+
+
+def dump_stats():
+    """Writes the query stats to the file of the misc config, if any."""
+
+    if misc.QUERY_STATS_FILE and DBSocket.stats.queries:
+        DBSocket.stats.dump(misc.QUERY_STATS_FILE)
+
+
+atexit.register(dump_stats)
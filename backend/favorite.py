@@ -1,6 +1,7 @@
 """Contains the Class Favorite."""
 
 from backend.substitute import Substitute
+from backend.relation import Relation, is_loaded
 
 
 class Favorite(Substitute):
@@ -12,11 +13,18 @@ class Favorite(Substitute):
         id: The id of the product. This is the same as in the db.
         name: The product name.
         url: The openfoodfacts url of the product.
-        nutrition_grade: The nutrition grade (either A, B, C, D, or E).
+        nutrition_grades: The ordinal of the nutrition grade, 0 for A
+            up to 4 for E.
         category_off_id: The id of the category of the product.
         stores: The stores in which the product may be found.
+        substitute_to: Products replaced by the favorite. Loaded from
+            the db on first access.
     """
 
+    stores_list = Relation('stores', key='original_id')
+    brands_list = Relation('brands', key='original_id')
+    substitute_to = Relation('substitute_to')
+
     def __init__(self, source):
         """Inits a product.
 
@@ -27,22 +35,21 @@ class Favorite(Substitute):
         """
         if isinstance(source, dict):
             super().__init__(source, source['original_id'])
-            self.substitute_to = []
-            self.subst_loaded = False
+            # Products replaced by the favorite are fetched when needed.
+            del self.substitute_to
             self.original_id = source['original_id']
         else:
             self.id = source.id
             self.french_name = source.french_name
             self.url = source.url
             self.nutrition_grades = source.nutrition_grades
-            self.stores_list = source.stores_list
-            self.brands_list = source.brands_list
             self.categories_list = source.categories_list
-            self.stores_loaded = source.stores_loaded
-            self.brands_loaded = source.brands_loaded
-            self.substitute_to = source.substitute_to
-            # self.substitute_to = []
-            self.subst_loaded = source.subst_loaded
+            for attr in ('stores_list', 'brands_list'):
+                if is_loaded(source, attr):
+                    setattr(self, attr, getattr(source, attr))
+            self.loader = source.loader
+            self.siblings = None
+            self.substitute_to = list(source.substitute_to)
             self.original_id = source.original_id
 
     def print_product(self):
@@ -50,10 +57,10 @@ class Favorite(Substitute):
 
         print("\n========================")
         print(f"Name : {self.french_name}")
-        print(f"Grade : {self.nutrition_grades}")
+        print(f"Grade : {self.nutriscore}")
         print(f"Url : {self.url}")
         for elt in self.categories_list:
-            print(f"Category : {elt.name}")
+            print(f"Category : {elt.french_name}")
         print("\nStores:")
         print("============")
         for elt in self.stores_list:
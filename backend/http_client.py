@@ -0,0 +1,134 @@
+"""Contains the class HttpClient."""
+
+import email.utils
+import random
+import threading
+import time
+from backend.rate_limiter import AdaptiveRateLimiter
+from config import api_downloads as api
+
+# Statuses telling the server is overloaded or failing for a while.
+RETRIED_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    """Sends GET requests to OpenFoodFacts, politely and patiently.
+
+    Every request waits for the rate limiter, and gives up after a
+        timeout. A request which timed out, lost its connection or got
+        a status of RETRIED_STATUSES is sent again after a backoff
+        doubling at each attempt, with full jitter so that threads do
+        not retry together. The server may ask for a longer wait with a
+        Retry-After header, which the limiter holds every thread for.
+    Connections are kept alive, one session per thread.
+
+    Args:
+        limiter: The AdaptiveRateLimiter to share, a new one if None.
+        timeout: float, The seconds to wait for a connection, then for
+            each read.
+        retries: int, How many times a request is sent again.
+        backoff: float, The seconds to wait before the first retry.
+        backoff_max: float, The longest wait between attempts.
+        on_retry: callable, Called with the reason of each retry, such
+            as 'timeout', 'connection' or '503'.
+
+    Attributes:
+        sessions: local, The requests Session of each thread.
+    """
+
+    def __init__(self, limiter=None, timeout=api.HTTP_TIMEOUT,
+                 retries=api.HTTP_RETRIES, backoff=api.HTTP_BACKOFF,
+                 backoff_max=api.HTTP_BACKOFF_MAX, on_retry=None):
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.on_retry = on_retry or (lambda reason: None)
+        self.sessions = threading.local()
+
+    def session(self):
+        """Returns the requests Session of the calling thread."""
+
+        # requests is slow to import and only needed to download.
+        import requests
+
+        session = getattr(self.sessions, 'session', None)
+        if session is None:
+            session = self.sessions.session = requests.Session()
+        return session
+
+    def delay(self, attempt):
+        """Returns the seconds to wait before an attempt, with jitter.
+
+        Args:
+            attempt: int, The number of the attempt to come, 1 for the
+                first retry.
+        """
+
+        return random.uniform(0, min(self.backoff_max,
+                                     self.backoff * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def retry_after(response):
+        """Returns the seconds a response asks to wait, None if it does
+        not say.
+
+        Retry-After holds either seconds or an HTTP date.
+        """
+
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
+
+    def get(self, url):
+        """Sends a GET request until it succeeds or retries run out.
+
+        Args:
+            url: str, The url to request.
+
+        Returns:
+            The requests Response, with a successful status.
+
+        Raises:
+            requests.RequestException: The last attempt failed, on a
+                timeout, a connection error or an error status.
+        """
+
+        import requests
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = self.session().get(
+                    url, timeout=(self.timeout, self.timeout))
+            except requests.Timeout:
+                if attempt >= self.retries:
+                    raise
+                reason = 'timeout'
+            except (requests.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError):
+                if attempt >= self.retries:
+                    raise
+                reason = 'connection'
+                self.sessions.session = None
+            else:
+                if response.status_code not in RETRIED_STATUSES:
+                    response.raise_for_status()
+                    self.limiter.succeed()
+                    return response
+                self.limiter.throttle(self.retry_after(response))
+                if attempt >= self.retries:
+                    response.raise_for_status()
+                reason = str(response.status_code)
+            attempt += 1
+            self.on_retry(reason)
+            time.sleep(self.delay(attempt))
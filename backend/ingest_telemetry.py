@@ -0,0 +1,172 @@
+"""Contains the class IngestTelemetry."""
+
+import contextlib
+import time
+
+# Upper bounds, in seconds, of the buckets of the request latencies.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class IngestTelemetry:
+    """Measures an ingest from OpenFoodFacts, category by category.
+
+    Time is split between stages: 'fetch' for downloads, 'clean' for
+        cleaning and 'insert' for saving products in db and memory, and
+        'flush' for commits. Requests are counted with their size and
+        latency, and products left out with the reason why.
+    A progress line is printed after each category, and summary()
+        returns everything measured.
+
+    Args:
+        categories: int, The number of categories to ingest.
+        stream: The file progress is printed to, None to print nothing.
+
+    Attributes:
+        stages: dict, The seconds spent in each stage.
+        latencies: list, The number of requests in each bucket of
+            LATENCY_BUCKETS, then the number of slower ones.
+        rejects: dict, The number of products left out by reason.
+        retries: dict, The number of requests sent again by reason.
+        per_category: list, What was measured for each category done.
+        current: dict, What is measured for the category in progress.
+    """
+
+    def __init__(self, categories=0, stream=None):
+        self.categories = categories
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.stages = {'fetch': 0.0, 'clean': 0.0, 'insert': 0.0,
+                       'flush': 0.0}
+        self.latencies = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.requests = 0
+        self.bytes = 0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.rejects = {}
+        self.retries = {}
+        self.per_category = []
+        self.current = None
+
+    def begin_category(self, name):
+        """Starts measuring a category.
+
+        Args:
+            name: str, The name of the category.
+        """
+
+        self.current = {'name': name, 'products': 0, 'linked': 0,
+                        'rejects': 0, 'bytes': 0,
+                        'started': time.perf_counter()}
+
+    def add_time(self, name, seconds):
+        """Adds time to a stage.
+
+        Args:
+            name: str, The name of the stage.
+            seconds: float, The time spent in it.
+        """
+
+        self.stages[name] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Adds the time spent in a with block to a stage."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def request(self, seconds, size):
+        """Counts a request to the API.
+
+        Args:
+            seconds: float, How long the request took.
+            size: int, The bytes downloaded.
+        """
+
+        self.requests += 1
+        self.bytes += size
+        self.total_latency += seconds
+        self.max_latency = max(self.max_latency, seconds)
+        self.add_time('fetch', seconds)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) \
+                and seconds > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.latencies[bucket] += 1
+        if self.current is not None:
+            self.current['bytes'] += size
+
+    def reject(self, reason):
+        """Counts a product left out.
+
+        Args:
+            reason: str, Why it was left out.
+        """
+
+        self.rejects[reason] = self.rejects.get(reason, 0) + 1
+        if self.current is not None:
+            self.current['rejects'] += 1
+
+    def retry(self, reason):
+        """Counts a request sent again.
+
+        Args:
+            reason: str, Why the previous attempt failed.
+        """
+
+        self.retries[reason] = self.retries.get(reason, 0) + 1
+
+    def product(self, linked=False):
+        """Counts a product saved.
+
+        Args:
+            linked: bool, True if the product was already saved from
+                another category and only got linked to this one.
+        """
+
+        self.current['linked' if linked else 'products'] += 1
+
+    def end_category(self):
+        """Ends the category in progress and prints the progress."""
+
+        current = self.current
+        current['seconds'] = time.perf_counter() - current.pop('started')
+        self.per_category.append(current)
+        self.current = None
+        if self.stream is not None:
+            products = sum(done['products'] for done in self.per_category)
+            rate = products / (time.perf_counter() - self.start)
+            rejects = sum(self.rejects.values())
+            print(f"\r[{len(self.per_category)}/{self.categories}] "
+                  f"{current['name'][:20]:<20} {products} products "
+                  f"{rate:.0f}/s {self.bytes / 1e6:.1f} MB "
+                  f"{rejects} rejects", end="", file=self.stream,
+                  flush=True)
+
+    def summary(self):
+        """Returns everything measured, ready to be dumped as JSON."""
+
+        seconds = time.perf_counter() - self.start
+        products = sum(done['products'] for done in self.per_category)
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS]
+        labels.append(f">{LATENCY_BUCKETS[-1]}")
+        return {
+            'seconds': seconds,
+            'categories': len(self.per_category),
+            'products': products,
+            'linked': sum(done['linked'] for done in self.per_category),
+            'items_per_second': products / seconds if seconds else None,
+            'requests': self.requests,
+            'bytes': self.bytes,
+            'latency': {
+                'mean': (self.total_latency / self.requests
+                         if self.requests else None),
+                'max': self.max_latency,
+                'histogram': dict(zip(labels, self.latencies))},
+            'rejects': dict(self.rejects),
+            'retries': dict(self.retries),
+            'stages': dict(self.stages),
+            'per_category': list(self.per_category)}
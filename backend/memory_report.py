@@ -0,0 +1,131 @@
+"""Contains the class MemoryReport."""
+
+import gc
+import sys
+import types
+from backend.product import Product
+from backend.substitute import Substitute
+
+# Objects shared with the rest of the program rather than owned by the
+# catalog, which are never walked into.
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType,
+                types.BuiltinFunctionType, types.MethodType,
+                types.CodeType, types.FrameType)
+# Brain attributes holding sockets and tools rather than catalog data.
+# The source is either the db or the snapshot mapped in memory.
+SKIPPED_ATTRIBUTES = ('dbs', 'apis', 'prefetcher', 'source')
+# Brain attributes owning the models, walked before the indexes and
+# caches referring to them.
+OWNER_ATTRIBUTES = ('products', 'categories_list', 'brands_list',
+                    'stores_list')
+
+
+class MemoryReport:
+    """Measures how much memory the catalog of a Brain takes.
+
+    The objects reachable from each attribute of Brain are walked once,
+        each being counted under the first attribute reaching it. The
+        registries owning the models are walked first, so indexes and
+        caches only count what they add. Sizes are the ones of
+        sys.getsizeof(), so a deep size adds up the objects themselves
+        and not the memory the allocator keeps around them. Files mapped
+        in memory, like the catalog snapshot, are not counted.
+    Products held by several objects are flagged: a Substitute or a
+        Favorite copying a product of the catalog, or equal strings
+        stored more than once.
+
+    Args:
+        brain: The Brain to measure.
+
+    Attributes:
+        seen: set, The ids of the objects walked already.
+        by_attribute: dict, The objects and bytes under each attribute.
+        by_type: dict, The count and bytes of each type of object.
+        strings: dict, The first string object of each value.
+        duplicates: dict, The copies of products by class, and of
+            strings, with the bytes they take.
+    """
+
+    def __init__(self, brain):
+        self.brain = brain
+        self.seen = {id(brain)}
+        self.by_attribute = {}
+        self.by_type = {}
+        self.strings = {}
+        self.duplicates = {'strings': {'count': 0, 'bytes': 0}}
+
+    def build(self):
+        """Walks the catalog.
+
+        Returns:
+            dict: The report, ready to be dumped as JSON.
+        """
+
+        attrs = vars(self.brain)
+        order = [attr for attr in OWNER_ATTRIBUTES if attr in attrs]
+        order += [attr for attr in attrs if attr not in order]
+        for attr in order:
+            if attr in SKIPPED_ATTRIBUTES:
+                continue
+            self.by_attribute[attr] = self.walk(attrs[attr])
+        total = sum(part['bytes'] for part in self.by_attribute.values())
+        return {
+            'bytes': total,
+            'objects': sum(part['objects']
+                           for part in self.by_attribute.values()),
+            'by_attribute': self.sort(self.by_attribute),
+            'by_type': self.sort(self.by_type),
+            'duplicates': self.duplicates}
+
+    @staticmethod
+    def sort(parts):
+        """Returns parts sorted from the one taking the most bytes."""
+
+        return dict(sorted(parts.items(), key=lambda item: -item[1]['bytes']))
+
+    def walk(self, root):
+        """Counts the objects reachable from root and not walked yet.
+
+        Returns:
+            dict: The number of objects and the bytes they take.
+        """
+
+        objects = 0
+        size = 0
+        stack = [root]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in self.seen or isinstance(obj, SHARED_TYPES):
+                continue
+            self.seen.add(id(obj))
+            obj_size = sys.getsizeof(obj)
+            objects += 1
+            size += obj_size
+            self.count(obj, obj_size)
+            stack.extend(gc.get_referents(obj))
+        return {'objects': objects, 'bytes': size}
+
+    def count(self, obj, size):
+        """Adds an object to the stats of its type and to duplicates."""
+
+        name = type(obj).__name__
+        stats = self.by_type.setdefault(name, {'count': 0, 'bytes': 0})
+        stats['count'] += 1
+        stats['bytes'] += size
+        if isinstance(obj, str):
+            first = self.strings.setdefault(obj, obj)
+            if first is not obj:
+                self.duplicates['strings']['count'] += 1
+                self.duplicates['strings']['bytes'] += size
+        elif isinstance(obj, Product) and self.is_copy(obj):
+            copies = self.duplicates.setdefault(name, {'count': 0,
+                                                       'bytes': 0})
+            copies['count'] += 1
+            copies['bytes'] += size + sys.getsizeof(vars(obj))
+
+    def is_copy(self, obj):
+        """Tells whether an object copies a product of the catalog."""
+
+        if isinstance(obj, Substitute):
+            return self.brain.products.get(obj.original_id) is not None
+        return self.brain.products.get(obj.id) not in (None, obj)
@@ -0,0 +1,39 @@
+"""Conversions between nutrition grade letters and ordinals.
+
+Grades are handled as small ints everywhere, 0 for "a" up to 4 for "e",
+    so better grades compare lower. Letters are only used to read data
+    from OpenFoodFacts and to display grades.
+"""
+
+GRADES = "abcde"
+# Stands for a missing grade where a byte is needed.
+UNGRADED = 255
+
+
+def to_ordinal(grade):
+    """Returns the ordinal of a grade.
+
+    Args:
+        grade: The grade, as a letter, an ordinal or a string of digits
+            as found in an older db.
+
+    Returns:
+        int: The ordinal, None if the grade is missing or unknown.
+    """
+
+    if isinstance(grade, int):
+        return grade if 0 <= grade < len(GRADES) else None
+    grade = (grade or "").strip().lower()
+    if grade.isdigit():
+        return to_ordinal(int(grade))
+    if len(grade) == 1 and grade in GRADES:
+        return GRADES.index(grade)
+    return None
+
+
+def to_letter(ordinal):
+    """Returns the letter of a grade ordinal, "?" if it is missing."""
+
+    if ordinal is None or not 0 <= ordinal < len(GRADES):
+        return "?"
+    return GRADES[ordinal]
@@ -0,0 +1,124 @@
+"""Contains the class PageRenderer."""
+
+from collections import OrderedDict
+from colorama import Style
+from config import misc
+
+PRODUCT_COLUMNS = (('n°', 3), ('Name', misc.NAME_SIZE + 3),
+                   ('Brands', misc.BRANDS_SIZE), ('Nutriscore', 10))
+FAVORITE_COLUMNS = PRODUCT_COLUMNS + (('Substitute to',
+                                       misc.NAME_SIZE + 3),)
+
+
+def fit(cell, width):
+    """Pads or cuts the text of a cell to a width.
+
+    Args:
+        cell: The text of the cell, or a tuple of the text and a note
+            printed dimmed after it.
+        width: int, The number of chars of the cell.
+
+    Returns:
+        str: The cell, which may hold ANSI codes.
+    """
+
+    text, note = cell if isinstance(cell, tuple) else (str(cell), "")
+    if note:
+        # The text is cut first, the note says there is more to see.
+        text = text[:max(width - len(note) - 1, 0)]
+        return f"{text} {Style.DIM}{note}{Style.RESET_ALL}" \
+            + " " * (width - len(text) - 1 - len(note))
+    if len(text) > width:
+        return f"{text[:width - 3]}{Style.DIM}...{Style.RESET_ALL}"
+    return text + " " * (width - len(text))
+
+
+def product_cells(product):
+    """Returns the name, brands and nutriscore cells of a product."""
+
+    brands = product.brands_list
+    if not brands:
+        brand_cell = ""
+    elif len(brands) == 1:
+        brand_cell = brands[0].name
+    else:
+        brand_cell = (brands[0].name, f"+ {len(brands) - 1} more...")
+    return [product.french_name, brand_cell, product.nutriscore]
+
+
+def favorite_cells(favorite):
+    """Returns the cells of a favorite, ending with what it replaces."""
+
+    replaced = favorite.substitute_to
+    if not replaced:
+        replaced_cell = ""
+    elif len(replaced) == 1:
+        replaced_cell = replaced[0].french_name
+    else:
+        replaced_cell = (replaced[0].french_name,
+                         f"+ {len(replaced) - 1} more...")
+    return product_cells(favorite) + [replaced_cell]
+
+
+class PageRenderer:
+    """Renders pages of products as fixed-width tables.
+
+    Columns have a fixed width so a row is rendered without looking at
+        the other ones. Rendered pages are kept and printed again as
+        long as they hold the same items, the least recently used ones
+        being dropped first.
+
+    Args:
+        columns: tuple, The header and width of each column.
+        size: int, The number of pages kept.
+
+    Attributes:
+        border: str, The line above and below the table.
+        header: str, The border and the line of headers.
+        pages: OrderedDict, The signature and text of each page by key.
+    """
+
+    def __init__(self, columns, size=misc.RENDER_CACHE_SIZE):
+        self.columns = columns
+        self.size = size
+        self.border = "+" + "+".join("-" * (width + 2)
+                                     for _, width in columns) + "+"
+        self.header = "\n".join((self.border, self.line(
+            [title for title, _ in columns]), self.border))
+        self.pages = OrderedDict()
+
+    def line(self, cells):
+        """Returns a row of the table."""
+
+        return "| " + " | ".join(fit(cell, width) for cell, (_, width)
+                                 in zip(cells, self.columns)) + " |"
+
+    def render(self, key, items, cells, version=None):
+        """Returns a page as a table.
+
+        Args:
+            key: The key of the page, unique among the pages rendered.
+            items: list, The items of the page.
+            cells: callable, Returns the cells of an item after its
+                number.
+            version: Anything else the text of the page depends on.
+
+        Returns:
+            str: The table.
+        """
+
+        signature = (tuple(items), version)
+        cached = self.pages.get(key)
+        if cached is not None and cached[0] == signature:
+            self.pages.move_to_end(key)
+            return cached[1]
+        lines = [self.header]
+        for i, item in enumerate(items, 1):
+            lines.append(self.line([i] + cells(item)))
+        lines.append(self.border)
+        text = "\n".join(lines)
+        self.pages[key] = (signature, text)
+        self.pages.move_to_end(key)
+        if len(self.pages) > self.size:
+            self.pages.popitem(last=False)
+        return text
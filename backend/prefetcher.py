@@ -0,0 +1,142 @@
+"""Contains the class PagePrefetcher."""
+
+from backend.db_socket import DBSocket
+from backend.relation import is_loaded
+from backend.snapshot import CatalogSnapshot
+
+RELATIONS = (('brands_list', 'get_brands_from_prods'),
+             ('stores_list', 'get_stores_from_prods'))
+
+
+class PagePrefetcher:
+    """Fetches the brands and stores of adjacent pages in background.
+
+    While the user reads a page, a worker thread fetches the links of
+        the products of the pages before and after it. The worker only
+        reads rows, with its own connection to the db, or from the
+        snapshot when Brain reads from one. The rows are linked to the
+        products by the main thread when the page is shown, so objects
+        in memory are never changed by two threads at once.
+
+    Args:
+        brain: The Brain whose pages are prefetched.
+
+    Attributes:
+        executor: The ThreadPoolExecutor running the worker, created on
+            first use.
+        reader: The DBSocket of the worker, opened on first use.
+        pending: dict, The page and the future of its rows, by id of
+            the page.
+    """
+
+    def __init__(self, brain):
+        self.brain = brain
+        self.executor = None
+        self.reader = None
+        self.pending = {}
+
+    def schedule(self, registry, page):
+        """Starts fetching the pages around a page.
+
+        Pages whose products are all loaded already are skipped.
+
+        Args:
+            registry: list of list, The pages being browsed.
+            page: int, The page shown to the user.
+        """
+
+        if len(registry) < 2:
+            return
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="prefetch")
+        source = self.brain.source
+        count = len(registry)
+        for near in {(page - 1) % count, (page + 1) % count}:
+            items = registry[near]
+            if id(items) in self.pending:
+                continue
+            missing = {}
+            for attr, _ in RELATIONS:
+                missing[attr] = sorted({
+                    getattr(obj, getattr(type(obj), attr).key)
+                    for obj in items if not is_loaded(obj, attr)})
+            if any(missing.values()):
+                self.pending[id(items)] = (items, self.executor.submit(
+                    self.fetch, source, missing))
+
+    def fetch(self, source, missing):
+        """Fetches the links of some products. Runs in the worker.
+
+        Args:
+            source: The source Brain reads from.
+            missing: dict, The ids of the products missing each
+                relation.
+
+        Returns:
+            dict: The fetched links of each relation.
+        """
+
+        if not isinstance(source, CatalogSnapshot):
+            if self.reader is None:
+                self.reader = DBSocket.reader()
+            source = self.reader
+        return {attr: getattr(source, query)(missing[attr])
+                for attr, query in RELATIONS if missing[attr]}
+
+    def apply(self, items):
+        """Links the rows prefetched for a page to its products.
+
+        Rows still being fetched are waited for, since the page would
+            fetch them anyway. A failed prefetch is ignored and the page
+            loads its relations as usual.
+
+        Args:
+            items: list, The products of the page about to be shown.
+        """
+
+        entry = self.pending.pop(id(items), None)
+        if entry is None or entry[0] is not items:
+            return
+        try:
+            rows = entry[1].result()
+        except Exception:
+            return
+        fetchers = {'brands_list': self.brain.load_brands,
+                    'stores_list': self.brain.load_stores}
+        for attr, attr_rows in rows.items():
+            objects = [obj for obj in items if not is_loaded(obj, attr)]
+            if objects:
+                relation = getattr(type(objects[0]), attr)
+                for obj in objects:
+                    setattr(obj, attr, [])
+                fetchers[attr](relation, objects, attr_rows)
+
+    def cancel(self):
+        """Drops every prefetch, when the user leaves the screen.
+
+        Fetches not started yet are cancelled, the rows of the running
+            one are discarded.
+        """
+
+        for _, future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+
+    def close(self):
+        """Stops the worker and closes its connection."""
+
+        self.cancel()
+        if self.executor is not None:
+            self.executor.submit(self.close_reader)
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def close_reader(self):
+        """Closes the connection of the worker. Runs in the worker."""
+
+        if self.reader is not None:
+            self.reader.connection.close()
+            self.reader = None
@@ -1,7 +1,9 @@
 """Contains class Product."""
 
-from tabulate import tabulate
-from colorama import Style
+from backend.relation import Relation
+from backend.nutrition_grade import to_letter, to_ordinal
+from backend.page_renderer import PageRenderer, PRODUCT_COLUMNS, \
+    product_cells
 from config import misc
 
 
@@ -12,11 +14,25 @@ class Product:
         id: The id of the product. This is the same as in the db.
         name: The product name.
         url: The openfoodfacts url of the product.
-        nutrition_grade: The nutrition grade (either A, B, C, D, or E).
+        nutrition_grades: The ordinal of the nutrition grade, 0 for A
+            up to 4 for E.
         category_off_id: The id of the category of the product.
-        stores: The stores in which the product may be found.
+        stores_list: The stores in which the product may be found.
+            Loaded from the db on first access.
+        brands_list: The brands of the product. Loaded from the db on
+            first access.
+        loader: The RelationLoader loading stores and brands, if any.
+        siblings: The objects whose relations are loaded together with
+            the ones of this product.
+        page_renderer: The PageRenderer of the substitute pages, shared
+            by all products.
     """
 
+    page_renderer = PageRenderer(PRODUCT_COLUMNS)
+
+    stores_list = Relation('stores', backref=True)
+    brands_list = Relation('brands', backref=True)
+
     def __init__(self, dict_product):
         """Inits a product.
 
@@ -28,22 +44,26 @@ class Product:
         self.id = dict_product['id']
         self.french_name = dict_product['french_name']
         self.url = dict_product['url']
-        self.nutrition_grades = dict_product['nutrition_grades']
-        self.stores_list = []
-        self.brands_list = []
+        self.nutrition_grades = to_ordinal(dict_product['nutrition_grades'])
         self.substitute_registry = []
         self.substitute_page_buffer = []
         self.categories_list = []
-        self.stores_loaded = False
-        self.brands_loaded = False
         self.buffer_added = False
+        self.loader = None
+        self.siblings = None
+
+    @property
+    def nutriscore(self):
+        """The letter of the nutrition grade, for display."""
+
+        return to_letter(self.nutrition_grades)
 
     def print_product(self):
         """prints the attributes of a product."""
 
         print("\n========================")
         print(f"Name : {self.french_name}")
-        print(f"Grade : {self.nutrition_grades}")
+        print(f"Grade : {self.nutriscore}")
         print(f"Url : {self.url}")
         for elt in self.categories_list:
             print(f"Category : {elt.french_name}")
@@ -80,25 +100,16 @@ class Product:
         # this is to prevent not printing substitutes if buffer is not full.
         if page == len(self.substitute_registry):
             self.buffer_check()
-        table = [['n°', 'Name', 'Brands', 'Nutriscore']]
-        i = 1
-        for elt in self.substitute_registry[page]:
-            brands_to_print = ""
-            name_to_print = elt.french_name
-            if len(elt.french_name) > misc.NAME_SIZE:
-                name_to_print = f"{elt.french_name[:misc.NAME_SIZE]}" \
-                                f"{Style.DIM}...{Style.RESET_ALL}"
-            if len(elt.brands_list) == 1:
-                brands_to_print += f"{elt.brands_list[0].name}"
-            else:
-                brands_to_print += f"{elt.brands_list[0].name} " \
-                                   f"{Style.DIM}" \
-                                   f"+ {len(elt.brands_list) - 1} more..." \
-                                   f"{Style.RESET_ALL}"
-            table.append([i, name_to_print,
-                          brands_to_print, elt.nutrition_grades])
-            i += 1
-        print(tabulate(table, headers="firstrow", tablefmt="pretty"))
+        print(self.page_renderer.render((self.id, page),
+                                        self.substitute_registry[page],
+                                        product_cells))
+
+    def clear_substitutes(self):
+        """Empties the registry of substitutes."""
+
+        self.substitute_registry = []
+        self.substitute_page_buffer = []
+        self.buffer_added = False
 
     def buffer_check(self):
         """Appends a buffer to the registry.
@@ -0,0 +1,131 @@
+"""Contains the class ActionProfiler."""
+
+import cProfile
+import functools
+import inspect
+import itertools
+import os
+import threading
+import time
+import tracemalloc
+
+# Environment variables turning profiling on without changing any code.
+DIR_VARIABLE = "OFF_PROFILE"
+MEMORY_VARIABLE = "OFF_PROFILE_MEMORY"
+TOP_ALLOCATIONS = 25
+
+
+class ActionProfiler:
+    """Profiles the actions of the program, one file per action.
+
+    Methods of a class are instrumented to run in cProfile, and
+        optionally tracemalloc. Only the outermost action running is
+        profiled, as a profiler cannot run inside another one, so a
+        menu action and the Brain operations it calls make one profile.
+    Profiles are named after the session, their order and the action,
+        like 20240131-101500-0003-UserInterface.search_products.prof,
+        and can be read with pstats or snakeviz. Memory reports go to a
+        .mem.txt file next to them.
+
+    Args:
+        directory: str, Where profiles are written, created if needed.
+        memory: bool, True to trace memory allocations as well.
+
+    Attributes:
+        session: str, The time profiling started, shared by the files.
+        busy: Lock, Held while an action is profiled.
+    """
+
+    def __init__(self, directory, memory=False):
+        self.directory = directory
+        self.memory = memory
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.count = itertools.count(1)
+        self.busy = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Returns the profiler asked for by the environment, if any.
+
+        Profiling is on when OFF_PROFILE names a directory. Memory is
+            traced as well when OFF_PROFILE_MEMORY is set to 1.
+        """
+
+        directory = os.environ.get(DIR_VARIABLE)
+        if not directory:
+            return None
+        return cls(directory, os.environ.get(MEMORY_VARIABLE) == "1")
+
+    def instrument(self, cls, names=None):
+        """Profiles the methods of a class.
+
+        Args:
+            cls: The class to instrument.
+            names: iterable, The names of the methods. Defaults to every
+                public method, static and class methods excepted.
+        """
+
+        if names is None:
+            names = [name for name, attr in vars(cls).items()
+                     if not name.startswith("_")
+                     and inspect.isfunction(attr)]
+        for name in names:
+            setattr(cls, name, self.wrap(f"{cls.__name__}.{name}",
+                                         getattr(cls, name)))
+
+    def wrap(self, action, func):
+        """Returns func, profiled as an action when called."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.profile(action, func, *args, **kwargs)
+        return wrapper
+
+    def profile(self, action, func, *args, **kwargs):
+        """Calls a function and writes its profile.
+
+        The function is run as is when another action is being
+            profiled, in this thread or another one.
+
+        Args:
+            action: str, The name of the action, used in file names.
+            func: callable, The function to call.
+        """
+
+        if not self.busy.acquire(blocking=False):
+            return func(*args, **kwargs)
+        path = os.path.join(self.directory, f"{self.session}-"
+                                            f"{next(self.count):04d}-{action}")
+        profile = cProfile.Profile()
+        tracing = self.memory and not tracemalloc.is_tracing()
+        try:
+            if tracing:
+                tracemalloc.start()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                profile.dump_stats(path + ".prof")
+                if tracing:
+                    self.write_memory(path + ".mem.txt")
+                    tracemalloc.stop()
+        finally:
+            self.busy.release()
+
+    @staticmethod
+    def write_memory(path):
+        """Writes the peak memory and the top allocations of an action.
+
+        Args:
+            path: str, The path of the report.
+        """
+
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().statistics('lineno')
+        with open(path, "w", encoding="utf-8") as report:
+            report.write(f"current: {current} bytes\n"
+                         f"peak: {peak} bytes\n\n")
+            for stat in stats[:TOP_ALLOCATIONS]:
+                report.write(f"{stat}\n")
@@ -0,0 +1,113 @@
+"""Contains the class QueryStats."""
+
+import datetime
+import json
+import threading
+from config import misc
+
+# Statements MariaDB can explain.
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class QueryStats:
+    """Counts the queries run by every DBSocket and how long they took.
+
+    Queries are named after their constant in the sql_queries config
+        file. A query slower than the threshold is appended to the slow
+        query log as a JSON line, with its parameters and how the db
+        runs it. Sockets of several threads share the same stats.
+
+    Args:
+        slow_seconds: float, The duration from which a query is slow,
+            None to log no query.
+        slow_log: str, The path of the slow query log.
+
+    Attributes:
+        queries: dict, For each query name, its count, total and max
+            seconds and the rows it returned or changed.
+        lock: Lock, Guards queries.
+    """
+
+    def __init__(self, slow_seconds=misc.SLOW_QUERY_SECONDS,
+                 slow_log=misc.SLOW_QUERY_LOG):
+        self.slow_seconds = slow_seconds
+        self.slow_log = slow_log
+        self.queries = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, rows):
+        """Adds a query to the stats.
+
+        Args:
+            name: str, The name of the query.
+            seconds: float, How long it took.
+            rows: int, The rows it returned or changed.
+        """
+
+        with self.lock:
+            stats = self.queries.get(name)
+            if stats is None:
+                stats = self.queries[name] = {'count': 0, 'seconds': 0.0,
+                                              'max_seconds': 0.0, 'rows': 0}
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['rows'] += max(rows, 0)
+
+    def is_slow(self, seconds):
+        """Tells whether a query took long enough to be logged."""
+
+        return self.slow_seconds is not None and seconds >= self.slow_seconds
+
+    def log_slow(self, name, query, params, seconds, plan):
+        """Appends a slow query to the slow query log.
+
+        Args:
+            name: str, The name of the query.
+            query: str, The query as sent to the db.
+            params: The parameters of the query.
+            seconds: float, How long it took.
+            plan: list, The rows of EXPLAIN, None if it failed.
+        """
+
+        entry = {'time': datetime.datetime.now().isoformat(
+                     timespec='seconds'),
+                 'name': name,
+                 'seconds': round(seconds, 6),
+                 'query': " ".join(query.split()),
+                 'params': params,
+                 'explain': plan}
+        line = json.dumps(entry, default=str, ensure_ascii=False)
+        with self.lock, open(self.slow_log, "a", encoding="utf-8") as log:
+            log.write(line + "\n")
+
+    def report(self):
+        """Returns the stats of every query, slowest in total first.
+
+        Returns:
+            dict: The stats of each query, with its mean seconds.
+        """
+
+        with self.lock:
+            queries = {name: dict(stats)
+                       for name, stats in self.queries.items()}
+        for stats in queries.values():
+            stats['mean_seconds'] = stats['seconds'] / stats['count']
+        return dict(sorted(queries.items(),
+                           key=lambda item: -item[1]['seconds']))
+
+    def dump(self, path):
+        """Writes the report to a file as JSON.
+
+        Args:
+            path: str, The path of the file.
+        """
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=2)
+
+    def reset(self):
+        """Forgets every query counted so far."""
+
+        with self.lock:
+            self.queries = {}
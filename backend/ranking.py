@@ -0,0 +1,70 @@
+"""Contains the class SubstituteRanker."""
+
+import heapq
+from backend.nutrition_grade import GRADES
+from config import misc
+
+
+class SubstituteRanker:
+    """Ranks substitute candidates to a product on several criteria.
+
+    A candidate scores for how much better its nutrition grade is, and
+        for the share of the categories, brands and stores of the
+        product it has too. Each criterion is worth between 0 and its
+        weight. Only the best candidates are kept.
+
+    Args:
+        weights: dict, Weights overriding the ones of the misc config
+            file, by criterion.
+        top_k: int, The number of candidates to keep.
+
+    Attributes:
+        weights: dict, The weight of each criterion.
+        top_k: int, The number of candidates to keep.
+    """
+
+    def __init__(self, weights=None, top_k=misc.SUBST_TOP_K):
+        self.weights = dict(misc.SUBST_WEIGHTS)
+        self.weights.update(weights or {})
+        self.top_k = top_k
+
+    @staticmethod
+    def grade_gain(grade, candidate_grade):
+        """Returns how much better a grade is, between 0 and 1.
+
+        Args:
+            grade: int, The grade ordinal of the product to replace.
+            candidate_grade: int, The grade ordinal of the candidate.
+        """
+
+        if grade is None or candidate_grade is None:
+            return 0
+        return max(grade - candidate_grade, 0) / (len(GRADES) - 1)
+
+    def rank(self, product, candidates, links):
+        """Returns the best candidates to replace a product.
+
+        Args:
+            product: The product to replace.
+            candidates: list, The candidate products.
+            links: dict, For categories, brands and stores, the list of
+                linked ids by product id, including the product itself.
+
+        Returns:
+            list: The top_k best candidates, best first.
+        """
+
+        reference = {criterion: set(linked.get(product.id, ()))
+                     for criterion, linked in links.items()}
+
+        def score(candidate):
+            total = self.weights['grade'] * self.grade_gain(
+                product.nutrition_grades, candidate.nutrition_grades)
+            for criterion, ids in reference.items():
+                if ids:
+                    shared = ids.intersection(
+                        links[criterion].get(candidate.id, ()))
+                    total += self.weights[criterion] * len(shared) / len(ids)
+            return total
+
+        return heapq.nlargest(self.top_k, candidates, key=score)
@@ -0,0 +1,95 @@
+"""Contains the class AdaptiveRateLimiter."""
+
+import threading
+import time
+from config import api_downloads as api
+
+
+class AdaptiveRateLimiter:
+    """A token bucket whose rate follows what the server accepts.
+
+    Each request takes a token, and tokens come back at the current
+        rate, with bursts of up to one second of requests. The rate
+        grows by a fixed step after each request served, and is divided
+        when the server says it is overloaded, with a 429 or a 5xx, so
+        it stays close to the highest rate the server allows. A
+        Retry-After from the server holds every request until it is
+        over. The limiter is shared by the threads downloading.
+
+    Args:
+        rate: float, The requests per second to start with.
+        min_rate: float, The lowest rate.
+        max_rate: float, The highest rate.
+        increase: float, Added to the rate after a request served.
+        decrease: float, The rate is multiplied by it when throttled.
+
+    Attributes:
+        tokens: float, The requests allowed right now.
+        paused_until: float, The monotonic time requests wait for, after
+            a Retry-After.
+        lock: Lock, Guards the bucket.
+    """
+
+    def __init__(self, rate=api.RATE_LIMIT, min_rate=api.RATE_LIMIT_MIN,
+                 max_rate=api.RATE_LIMIT_MAX, increase=api.RATE_INCREASE,
+                 decrease=api.RATE_DECREASE):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        """Adds the tokens earned since the last update."""
+
+        capacity = max(self.rate, 1.0)
+        self.tokens = min(capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Waits for a token and takes it.
+
+        Returns:
+            float: The seconds waited.
+        """
+
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now,
+                           (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def succeed(self):
+        """Raises the rate after a request served."""
+
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttle(self, retry_after=None):
+        """Lowers the rate after the server refused a request.
+
+        Args:
+            retry_after: float, The seconds the server asked to wait,
+                None if it did not say.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until,
+                                        now + retry_after)
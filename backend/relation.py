@@ -0,0 +1,144 @@
+"""Contains the classes Relation and RelationLoader."""
+
+
+def is_loaded(instance, attr):
+    """Tells if a relation has already been loaded on an instance.
+
+    Args:
+        instance: The object owning the relation.
+        attr: str, The name of the relation attribute.
+
+    Returns:
+        True if the relation is in memory, False otherwise.
+    """
+
+    return attr in vars(instance)
+
+
+class Relation:
+    """Descriptor representing a list of objects linked in the db.
+
+    The list is loaded on first access by the RelationLoader attached to
+        the instance. The loader fetches the relation of all the
+        siblings of the instance at once, so a whole page only costs one
+        query per relation.
+    Once loaded, the list is kept in the instance dict under the same
+        name. Assigning a list to the attribute marks it as loaded,
+        deleting it marks it as not loaded.
+
+    Args:
+        name: str, The name of the fetcher registered in the loader.
+        key: str, The attribute holding the id used to query the db.
+        backref: bool, True if the instance must be added to the
+            registry of the objects it gets linked to.
+    """
+
+    def __init__(self, name, key='id', backref=False):
+        self.name = name
+        self.key = key
+        self.backref = backref
+        self.attr = name
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if not is_loaded(instance, self.attr):
+            loader = getattr(instance, 'loader', None)
+            if loader is None:
+                # Objects built from the api hold their own links.
+                vars(instance)[self.attr] = []
+            else:
+                loader.load(self, instance)
+        return vars(instance)[self.attr]
+
+    def __set__(self, instance, value):
+        vars(instance)[self.attr] = value
+
+    def __delete__(self, instance):
+        vars(instance).pop(self.attr, None)
+
+
+class RelationLoader:
+    """Loads relations of sibling objects in batches.
+
+    Objects attached together, usually the items of a page, are
+        siblings. When a relation is accessed on one of them, it is
+        loaded for every sibling which does not have it yet with a
+        single call to the fetcher registered for this relation.
+
+    Attributes:
+        fetchers: dict, The fetcher of each relation indexed by name.
+            A fetcher takes the relation and a list of objects whose
+            relation has been reset to an empty list, and fills it.
+    """
+
+    def __init__(self):
+        self.fetchers = {}
+
+    def register(self, name, fetcher):
+        """Registers the fetcher of a relation.
+
+        Args:
+            name: str, The name of the relation.
+            fetcher: callable, The function loading the relation.
+        """
+
+        self.fetchers[name] = fetcher
+
+    def attach(self, siblings):
+        """Attaches the loader to a group of sibling objects.
+
+        The list itself is kept as the group, so items added to it later
+            on are loaded along with the others.
+
+        Args:
+            siblings: list, The objects to load together.
+        """
+
+        for obj in siblings:
+            obj.loader = self
+            obj.siblings = siblings
+
+    def attach_registry(self, registry, buffer):
+        """Attaches the loader to every page of a registry.
+
+        Args:
+            registry: list of list, The pages of the registry.
+            buffer: list, The page buffer of the registry.
+        """
+
+        for page in registry:
+            self.attach(page)
+        self.attach(buffer)
+
+    def load(self, relation, instance):
+        """Loads a relation for an instance and its pending siblings.
+
+        Args:
+            relation: Relation, The relation to load.
+            instance: The object the relation was accessed on.
+        """
+
+        siblings = getattr(instance, 'siblings', None) or []
+        pending = [instance]
+        for obj in siblings:
+            if obj is not instance and not is_loaded(obj, relation.attr):
+                pending.append(obj)
+        for obj in pending:
+            vars(obj)[relation.attr] = []
+        self.fetchers[relation.name](relation, pending)
+
+    @staticmethod
+    def prefetch(objects, attr):
+        """Makes sure a relation is loaded for a list of objects.
+
+        Args:
+            objects: list, The objects to process.
+            attr: str, The name of the relation attribute.
+        """
+
+        for obj in objects:
+            getattr(obj, attr)
@@ -0,0 +1,228 @@
+"""Contains the class SearchIndex."""
+
+import heapq
+import unicodedata
+from bisect import bisect_left
+from config import misc
+
+NAME_WEIGHT = 1.0
+BRAND_WEIGHT = 0.7
+PREFIX_QUALITY = 0.8
+FUZZY_QUALITY = 0.6
+FUZZY_THRESHOLD = 0.4
+MIN_PREFIX_SIZE = 2
+MAX_EXPANSIONS = 64
+
+
+class SearchIndex:
+    """In-memory inverted index over product names and brands.
+
+    Names and brands are normalized then split into tokens. Each token
+        points to the products it appears in. A query token matches
+        indexed tokens exactly, as a prefix, or through trigram
+        similarity to tolerate typos.
+
+    Attributes:
+        products: dict, The indexed products by id.
+        postings: dict, For each token, the weight of the field it was
+            found in, by product id.
+        trigrams: dict, The tokens containing each trigram.
+        vocabulary: list, The sorted tokens used for prefix matching.
+        vocabulary_sorted: False if tokens were added since the last
+            time the vocabulary was sorted.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.postings = {}
+        self.trigrams = {}
+        self.vocabulary = []
+        self.vocabulary_sorted = True
+
+    @staticmethod
+    def normalize(text):
+        """Splits a text into lowercase tokens without accents.
+
+        Args:
+            text: str, The text to process.
+
+        Returns:
+            list: The tokens of the text.
+        """
+
+        text = unicodedata.normalize("NFKD", text or "").lower()
+        chars = [char if char.isalnum() else " " for char in text
+                 if not unicodedata.combining(char)]
+        return [token for token in "".join(chars).split() if len(token) > 1]
+
+    @staticmethod
+    def trigrams_of(token):
+        """Returns the set of trigrams of a token."""
+
+        padded = f"  {token} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def __len__(self):
+        return len(self.products)
+
+    def add_product(self, product):
+        """Indexes the name of a product.
+
+        Products are indexed only once even if they belong to several
+            categories.
+
+        Args:
+            product: The product to index.
+        """
+
+        if product.id not in self.products:
+            self.products[product.id] = product
+            self.add_text(product.id, product.french_name, NAME_WEIGHT)
+
+    def add_brand(self, product, brand_name):
+        """Indexes the name of a brand of a product.
+
+        Args:
+            product: The indexed product.
+            brand_name: str, The name of the brand.
+        """
+
+        self.add_text(product.id, brand_name, BRAND_WEIGHT)
+
+    def add_text(self, product_id, text, weight):
+        """Adds the tokens of a text to the postings of a product.
+
+        Args:
+            product_id: int, The id of the product.
+            text: str, The text to index.
+            weight: float, The weight of the field the text comes from.
+        """
+
+        for token in self.normalize(text):
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self.vocabulary.append(token)
+                self.vocabulary_sorted = False
+                for trigram in self.trigrams_of(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            if posting.get(product_id, 0) < weight:
+                posting[product_id] = weight
+
+    def sort_vocabulary(self):
+        """Sorts the tokens added since the last search.
+
+        Once sorted, searching does not change the index anymore, so it
+            can be searched from several threads.
+        """
+
+        if not self.vocabulary_sorted:
+            self.vocabulary.sort()
+            self.vocabulary_sorted = True
+
+    def expand(self, term):
+        """Finds the indexed tokens matching a query token.
+
+        Args:
+            term: str, A normalized query token.
+
+        Returns:
+            dict: The quality of the match by matching token.
+        """
+
+        matches = {}
+        if term in self.postings:
+            matches[term] = 1.0
+        if len(term) >= MIN_PREFIX_SIZE:
+            self.sort_vocabulary()
+            i = bisect_left(self.vocabulary, term)
+            while i < len(self.vocabulary) \
+                    and len(matches) < MAX_EXPANSIONS \
+                    and self.vocabulary[i].startswith(term):
+                token = self.vocabulary[i]
+                matches.setdefault(token,
+                                   PREFIX_QUALITY * len(term) / len(token))
+                i += 1
+        if not matches:
+            matches = self.fuzzy_matches(term)
+        return matches
+
+    def fuzzy_matches(self, term):
+        """Finds tokens sharing enough trigrams with a query token.
+
+        Args:
+            term: str, A normalized query token.
+
+        Returns:
+            dict: The quality of the match by matching token.
+        """
+
+        term_trigrams = self.trigrams_of(term)
+        shared = {}
+        for trigram in term_trigrams:
+            for token in self.trigrams.get(trigram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        matches = {}
+        for token, count in shared.items():
+            similarity = count / (len(term_trigrams)
+                                  + len(self.trigrams_of(token)) - count)
+            if similarity >= FUZZY_THRESHOLD:
+                matches[token] = FUZZY_QUALITY * similarity
+        return dict(heapq.nlargest(MAX_EXPANSIONS, matches.items(),
+                                   key=lambda item: item[1]))
+
+    def search(self, query, limit=misc.PAGE_SIZE):
+        """Returns the products best matching a query.
+
+        Products matching the most query tokens come first, then the
+            ones with the best score.
+
+        Args:
+            query: str, The text typed by the user.
+            limit: int, The maximum number of products to return.
+
+        Returns:
+            list: The matching products, best first.
+        """
+
+        term_matches = [self.expand(term) for term in self.normalize(query)]
+        term_ids = []
+        for matches in term_matches:
+            ids = set()
+            for token in matches:
+                ids.update(self.postings[token])
+            term_ids.append(ids)
+        if not term_ids:
+            return []
+        # Products matching every token are enough most of the time.
+        candidates = set.intersection(*term_ids)
+        if len(candidates) < limit:
+            candidates = set.union(*term_ids)
+        ranked = heapq.nlargest(
+            limit, candidates,
+            key=lambda product_id: self.score(product_id, term_matches))
+        return [self.products[product_id] for product_id in ranked]
+
+    def score(self, product_id, term_matches):
+        """Scores a product against the tokens of a query.
+
+        Args:
+            product_id: int, The id of the product.
+            term_matches: list, The matching tokens of each query token.
+
+        Returns:
+            tuple: The number of query tokens found, then the score.
+        """
+
+        hits = 0
+        total = 0
+        for matches in term_matches:
+            best = 0
+            for token, quality in matches.items():
+                weight = self.postings[token].get(product_id)
+                if weight is not None and quality * weight > best:
+                    best = quality * weight
+            if best:
+                hits += 1
+                total += best
+        return hits, total
@@ -0,0 +1,365 @@
+"""Contains the class CatalogSnapshot."""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from backend.nutrition_grade import UNGRADED, to_ordinal
+
+MAGIC = b"OFFSNAP2"
+HEADER = struct.Struct("<8scxxxI")
+COUNT = struct.Struct("<I")
+
+# Columns of each table: "I" for unsigned ints, "s" for strings and
+# "B" for small unsigned ints such as nutrition grade ordinals.
+LAYOUT = {
+    'categories': (('id', 'I'), ('name', 's'), ('url', 's')),
+    'products': (('id', 'I'), ('french_name', 's'), ('url', 's'),
+                 ('nutrition_grades', 'B')),
+    'brands': (('id', 'I'), ('name', 's'), ('url', 's')),
+    'stores': (('id', 'I'), ('name', 's'), ('url', 's')),
+    'category_products': (('category_id', 'I'), ('product_id', 'I')),
+    'product_brands': (('product_id', 'I'), ('brand_id', 'I')),
+    'product_stores': (('product_id', 'I'), ('store_id', 'I')),
+    'favorites': (('id', 'I'), ('original_id', 'I'), ('french_name', 's'),
+                  ('url', 's'), ('nutrition_grades', 'B')),
+    'product_favorites': (('product_id', 'I'), ('favorite_id', 'I')),
+}
+
+FAVORITE_TABLES = ('favorites', 'product_favorites')
+
+
+def padding(size):
+    """Returns the bytes needed to align a size on four bytes."""
+
+    return b"\0" * (-size % 4)
+
+
+class StringColumn:
+    """A column of strings decoded on access from a utf-8 blob.
+
+    Args:
+        offsets: The offset of each string in the blob, plus the end of
+            the last one.
+        blob: The utf-8 encoded strings one after the other.
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+class ByteColumn:
+    """A column of small ints stored as bytes, UNGRADED meaning NULL."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return None if self.data[i] == UNGRADED else self.data[i]
+
+
+class CatalogSnapshot:
+    """Compact binary copy of the catalog tables of the db.
+
+    The snapshot is stamped with the state of the db it was taken from
+        so it can be used instead of the db as long as the stamp
+        matches. Its file is memory-mapped and columns are read in place
+        whenever possible.
+    It answers the same read queries as DBSocket, so Brain can fill its
+        memory from either of them.
+
+    Args:
+        stamp: dict, The state of the db the snapshot was taken from.
+        tables: dict, The columns of each table by column name.
+
+    Attributes:
+        links: dict, Lazily built indexes of the link tables.
+    """
+
+    def __init__(self, stamp, tables):
+        self.stamp = stamp
+        self.tables = tables
+        self.links = {}
+
+    @classmethod
+    def from_rows(cls, stamp, rows):
+        """Builds a snapshot from rows fetched from the db.
+
+        Args:
+            stamp: dict, The state of the db.
+            rows: dict, The rows of each table in LAYOUT.
+        """
+
+        snapshot = cls(stamp, {})
+        snapshot.replace(stamp, rows)
+        return snapshot
+
+    def replace(self, stamp, rows):
+        """Replaces some tables with fresh rows from the db.
+
+        Args:
+            stamp: dict, The new state of the db.
+            rows: dict, The rows of each table to replace.
+        """
+
+        self.stamp = stamp
+        for table, table_rows in rows.items():
+            # Grades of a db created before they were stored as ordinals
+            # are converted on the way.
+            self.tables[table] = {
+                column: [to_ordinal(row[column]) if kind == 'B'
+                         else row[column] for row in table_rows]
+                for column, kind in LAYOUT[table]}
+        self.links = {}
+
+    @classmethod
+    def load(cls, path):
+        """Loads a snapshot from a file.
+
+        Args:
+            path: str, The path of the snapshot file.
+
+        Returns:
+            The snapshot, None if the file is missing or unreadable.
+        """
+
+        try:
+            with open(path, "rb") as snap_file:
+                try:
+                    data = mmap.mmap(snap_file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    data = snap_file.read()
+            return cls.decode(memoryview(data))
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            return None
+
+    @classmethod
+    def decode(cls, view):
+        """Decodes a snapshot from a buffer.
+
+        Args:
+            view: memoryview, The content of a snapshot file.
+
+        Raises:
+            ValueError: The buffer is not a snapshot made on a machine
+                with the same byte order.
+        """
+
+        magic, order, stamp_size = HEADER.unpack_from(view)
+        if magic != MAGIC or order != sys.byteorder[0].encode():
+            raise ValueError("Not a snapshot of this platform.")
+        pos = HEADER.size
+        stamp = json.loads(str(view[pos:pos + stamp_size], "utf-8"))
+        pos += stamp_size + len(padding(stamp_size))
+        tables = {}
+        for table, columns in LAYOUT.items():
+            (size,) = COUNT.unpack_from(view, pos)
+            pos += COUNT.size
+            tables[table] = {}
+            for column, kind in columns:
+                if kind == 'I':
+                    tables[table][column] = view[pos:pos + 4 * size].cast('I')
+                    pos += 4 * size
+                elif kind == 'B':
+                    tables[table][column] = ByteColumn(view[pos:pos + size])
+                    pos += size + len(padding(size))
+                else:
+                    offsets = view[pos:pos + 4 * (size + 1)].cast('I')
+                    pos += 4 * (size + 1)
+                    blob = view[pos:pos + offsets[-1]]
+                    tables[table][column] = StringColumn(offsets, blob)
+                    pos += offsets[-1] + len(padding(offsets[-1]))
+        return cls(stamp, tables)
+
+    def save(self, path):
+        """Writes the snapshot to a file.
+
+        The file is written next to its final path then renamed so a
+            reader never sees a partial snapshot.
+
+        Args:
+            path: str, The path of the snapshot file.
+        """
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as snap_file:
+            stamp = json.dumps(self.stamp).encode("utf-8")
+            snap_file.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(),
+                                        len(stamp)))
+            snap_file.write(stamp + padding(len(stamp)))
+            for table, columns in LAYOUT.items():
+                size = self.size(table)
+                snap_file.write(COUNT.pack(size))
+                for column, kind in columns:
+                    values = self.tables[table][column]
+                    if kind == 'I':
+                        snap_file.write(array('I', values).tobytes())
+                    elif kind == 'B':
+                        data = bytes(UNGRADED if value is None else value
+                                     for value in values)
+                        snap_file.write(data + padding(size))
+                    else:
+                        blobs = [(value or "").encode("utf-8")
+                                 for value in values]
+                        offsets = array('I', [0])
+                        for blob in blobs:
+                            offsets.append(offsets[-1] + len(blob))
+                        snap_file.write(offsets.tobytes())
+                        snap_file.write(b"".join(blobs)
+                                        + padding(offsets[-1]))
+        os.replace(tmp_path, path)
+
+    def size(self, table):
+        """Returns the number of rows of a table."""
+
+        return len(self.tables[table][LAYOUT[table][0][0]])
+
+    def rows(self, table, indexes=None):
+        """Returns rows of a table as dicts, like the db cursor does.
+
+        Args:
+            table: str, The table to read.
+            indexes: iterable, The positions of the rows to read. All
+                rows are read if None.
+        """
+
+        columns = self.tables[table]
+        if indexes is None:
+            indexes = range(self.size(table))
+        return [{column: columns[column][i] for column, _ in LAYOUT[table]}
+                for i in indexes]
+
+    def link_index(self, table, key, value):
+        """Groups the values of a link table by key.
+
+        Args:
+            table: str, The link table.
+            key: str, The column to group by.
+            value: str, The column to collect.
+
+        Returns:
+            dict: The list of values by key.
+        """
+
+        name = (table, key)
+        if name not in self.links:
+            index = {}
+            columns = self.tables[table]
+            for i, key_id in enumerate(columns[key]):
+                index.setdefault(key_id, []).append(columns[value][i])
+            self.links[name] = index
+        return self.links[name]
+
+    def product_positions(self):
+        """Returns the row position of each product by id."""
+
+        name = ('products', 'id')
+        if name not in self.links:
+            self.links[name] = {
+                product_id: i
+                for i, product_id in enumerate(self.tables['products']['id'])}
+        return self.links[name]
+
+    def get_categories(self):
+        """Returns all categories of the snapshot."""
+
+        return self.rows('categories')
+
+    def get_products_from_cat(self, category):
+        """Returns all products from a specified category.
+
+        Args:
+            category: the category user wants the product from.
+        """
+
+        product_ids = self.link_index('category_products', 'category_id',
+                                      'product_id').get(category.id, [])
+        positions = self.product_positions()
+        return self.rows('products', [positions[product_id]
+                                      for product_id in product_ids])
+
+    def get_brands(self):
+        """Returns all brands of the snapshot."""
+
+        return self.rows('brands')
+
+    def get_stores(self):
+        """Returns all stores of the snapshot."""
+
+        return self.rows('stores')
+
+    def get_saved_products(self):
+        """Returns all favorites of the snapshot."""
+
+        return self.rows('favorites')
+
+    def get_max_id_from_fav(self):
+        """Returns the maximum id from the favorites table."""
+
+        return [{'MAX( id )': max(self.tables['favorites']['id'],
+                                  default=None)}]
+
+    def get_brand_links(self):
+        """Returns every link between a product and a brand."""
+
+        return self.rows('product_brands')
+
+    def get_store_links(self):
+        """Returns every link between a product and a store."""
+
+        return self.rows('product_stores')
+
+    def get_brands_from_prods(self, product_ids):
+        """Returns the links between several products and their brands.
+
+        Args:
+            product_ids: list, The ids of the products.
+        """
+
+        index = self.link_index('product_brands', 'product_id', 'brand_id')
+        return [{'product_id': product_id, 'brand_id': brand_id}
+                for product_id in product_ids
+                for brand_id in index.get(product_id, [])]
+
+    def get_stores_from_prods(self, product_ids):
+        """Returns the links between several products and their stores.
+
+        Args:
+            product_ids: list, The ids of the products.
+        """
+
+        index = self.link_index('product_stores', 'product_id', 'store_id')
+        return [{'product_id': product_id, 'store_id': store_id}
+                for product_id in product_ids
+                for store_id in index.get(product_id, [])]
+
+    def get_prods_from_favs(self, favorite_ids):
+        """Returns the products linked to several favorites.
+
+        Args:
+            favorite_ids: list, The ids of the favorites.
+        """
+
+        index = self.link_index('product_favorites', 'favorite_id',
+                                'product_id')
+        positions = self.product_positions()
+        rows = []
+        for favorite_id in favorite_ids:
+            for product_id in index.get(favorite_id, []):
+                row = self.rows('products', [positions[product_id]])[0]
+                row['favorite_id'] = favorite_id
+                rows.append(row)
+        return rows
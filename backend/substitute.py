@@ -1,6 +1,7 @@
 """Contains class Substitute."""
 
 from backend.product import Product
+from backend.relation import Relation
 
 
 class Substitute(Product):
@@ -10,10 +11,12 @@ class Substitute(Product):
 
     Attributes:
         substitute_to: Products that are replaced by this substitute.
-        subst_loaded: True if substitutes are loaded in memory.
         original_id: Id of the product in the products table in db.
     """
 
+    stores_list = Relation('stores', key='original_id', backref=True)
+    brands_list = Relation('brands', key='original_id', backref=True)
+
     def __init__(self, dict_product, original_id):
         """Inits a product.
 
@@ -23,7 +26,6 @@ class Substitute(Product):
             category: The category which the product belongs to
         """
         self.substitute_to = []
-        self.subst_loaded = False
         self.original_id = original_id
         super().__init__(dict_product)
 
@@ -32,10 +34,10 @@ class Substitute(Product):
 
         print("\n========================")
         print(f"Name : {self.french_name}")
-        print(f"Grade : {self.nutrition_grades}")
+        print(f"Grade : {self.nutriscore}")
         print(f"Url : {self.url}")
         for elt in self.categories_list:
-            print(f"Category : {elt.name}")
+            print(f"Category : {elt.french_name}")
         print("\nStores:")
         print("============")
         for elt in self.stores_list:
@@ -0,0 +1,76 @@
+"""Contains the class SubstituteCache."""
+
+from collections import OrderedDict
+from config import misc
+
+
+class SubstituteCache:
+    """Keeps track of the products whose substitutes are in memory.
+
+    Substitutes are stored in the registry of each product. The cache
+        remembers which products have a filled registry and for which
+        stores, so a product opened again is not computed twice. Only
+        the most recently used products keep their substitutes, the
+        registry of the others is emptied.
+
+    Args:
+        size: int, The maximum number of products keeping substitutes.
+
+    Attributes:
+        entries: OrderedDict, The product and the stores its substitutes
+            were computed for, by product id, least recently used first.
+    """
+
+    def __init__(self, size=misc.SUBST_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(store_ids):
+        """Returns the key of a set of stores."""
+
+        return frozenset(store_ids or ())
+
+    def hit(self, product, store_ids):
+        """Tells if the substitutes of a product are already computed.
+
+        Args:
+            product: The product to replace.
+            store_ids: iterable, The stores substitutes are found in.
+
+        Returns:
+            True if the registry of the product can be used as is.
+        """
+
+        entry = self.entries.get(product.id)
+        if entry is None or entry[0] is not product \
+                or entry[1] != self.key(store_ids):
+            return False
+        self.entries.move_to_end(product.id)
+        return True
+
+    def add(self, product, store_ids):
+        """Records that the substitutes of a product were computed.
+
+        The least recently used products are evicted past the size.
+
+        Args:
+            product: The product whose registry was filled.
+            store_ids: iterable, The stores substitutes are found in.
+        """
+
+        self.entries[product.id] = (product, self.key(store_ids))
+        self.entries.move_to_end(product.id)
+        while len(self.entries) > self.size:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            evicted.clear_substitutes()
+
+    def clear(self):
+        """Forgets and empties every cached registry."""
+
+        for product, _ in self.entries.values():
+            product.clear_substitutes()
+        self.entries.clear()
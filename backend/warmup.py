@@ -0,0 +1,113 @@
+"""Contains the class CatalogWarmUp."""
+
+import threading
+from backend.db_socket import DBSocket
+
+PARTS = ('catalog', 'index', 'favorites', 'search')
+
+
+class CatalogWarmUp:
+    """Fills the memory of Brain in background at startup.
+
+    The menu is shown as soon as the program starts while a thread loads
+        the catalog, with its own connection to the db. The parts of the
+        memory are loaded in the order of PARTS, and a menu action only
+        waits for the parts it needs.
+    Objects in memory are only read by the main thread once the part
+        holding them is loaded, so they are never changed by two threads
+        at once.
+
+    Args:
+        brain: The Brain to fill, with its memory still empty.
+
+    Attributes:
+        ready: dict, The Event set once each part is loaded.
+        step: str, The part being loaded, '' once all are.
+        error: The exception which stopped loading, None if none did.
+        thread: The Thread loading the catalog, created by start().
+    """
+
+    def __init__(self, brain):
+        self.brain = brain
+        self.ready = {part: threading.Event() for part in PARTS}
+        self.step = PARTS[0]
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        """Starts loading the catalog, unless the db is empty."""
+
+        if self.brain.dbs.db_is_empty:
+            self.finish()
+            return
+        self.thread = threading.Thread(target=self.run, name="warm-up",
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Loads the catalog. Runs in the thread."""
+
+        reader = None
+        try:
+            reader = DBSocket.reader()
+            self.brain.fill_from_db(dbs=reader, progress=self.loaded)
+        except Exception as error:
+            self.error = error
+        finally:
+            if reader is not None:
+                reader.connection.close()
+            self.finish()
+
+    def loaded(self, part):
+        """Marks a part as loaded.
+
+        Args:
+            part: str, The name of the part.
+        """
+
+        index = PARTS.index(part)
+        self.step = PARTS[index + 1] if index + 1 < len(PARTS) else ''
+        self.ready[part].set()
+
+    def finish(self):
+        """Releases everyone waiting, whether loading succeeded or not."""
+
+        self.step = ''
+        for event in self.ready.values():
+            event.set()
+
+    def is_ready(self, *parts):
+        """Tells whether some parts are loaded.
+
+        Args:
+            *parts: str, The names of the parts, all of them if none.
+        """
+
+        return all(self.ready[part].is_set() for part in parts or PARTS)
+
+    def wait(self, *parts, timeout=None):
+        """Waits for some parts to be loaded.
+
+        Args:
+            *parts: str, The names of the parts, all of them if none.
+            timeout: float, The most seconds to wait for each part, None
+                for no limit.
+
+        Returns:
+            bool: True if the parts are loaded.
+        """
+
+        for part in parts or PARTS:
+            if not self.ready[part].wait(timeout):
+                return False
+        return True
+
+    def status(self):
+        """Describes the progress of loading in a few words."""
+
+        if self.error is not None:
+            return f"Loading failed: {self.error}"
+        if not self.step:
+            return "Catalog loaded."
+        done = sum(event.is_set() for event in self.ready.values())
+        return f"Loading {self.step} ({done}/{len(PARTS)})..."
@@ -0,0 +1,202 @@
+"""Contains the class SyntheticCatalog."""
+
+import math
+import random
+from config import api_downloads as api
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+NOUNS = ("biscuits", "cookies", "galettes", "yaourt", "creme dessert",
+         "jambon", "saucisson", "jus", "nectar", "soda", "cereales",
+         "muesli", "barre", "pate a tartiner", "compote", "chips")
+ADJECTIVES = ("bio", "nature", "allege", "au lait entier", "sans sucres",
+              "croustillant", "fondant", "pur jus", "fermier", "classique",
+              "extra", "tradition")
+FLAVORS = ("chocolat", "vanille", "fraise", "citron", "noisette", "miel",
+           "abricot", "orange", "caramel", "coco", "pomme", "framboise")
+SYLLABLES = ("ba", "lu", "mi", "ko", "ra", "de", "no", "va", "ti", "pe",
+             "sa", "zo", "gu", "fi", "ma", "ne")
+STORES = ("Carrefour", "Auchan", "Leclerc", "Intermarche", "Lidl",
+          "Monoprix", "Casino", "Franprix", "Super U", "Aldi",
+          "Carrefour Market", "Biocoop", "Naturalia", "Picard", "Cora",
+          "Match", "Spar", "Leader Price", "Netto", "Grand Frais")
+GRADES = ("a", "b", "c", "d", "e")
+
+# Shares of a page taken by products already listed in the previous
+# category, and by products the cleaning is expected to reject.
+CROSS_SHARE = 0.1
+REJECT_SHARE = 0.04
+REJECTS = ('no_stores', 'no_brands', 'no_grade', 'duplicate')
+
+
+class SyntheticCatalog:
+    """Generates an OpenFoodFacts-like catalog, always the same one.
+
+    Each category is a single search page of api.PAGE_SIZE products,
+        like the ones requested during ingest. Besides its own products,
+        a page lists some products of the previous category and a few
+        incomplete or duplicate products. Brand and store names come in
+        near-duplicate spellings, as they do on OpenFoodFacts.
+    Every product and page only depends on the seed and its position,
+        so any part of the catalog is generated without the rest.
+
+    Args:
+        size: int, The number of distinct valid products.
+        seed: int, Changes the whole catalog.
+        page_size: int, The number of products of a category.
+
+    Attributes:
+        own: int, The number of products a category adds.
+        slugs: list, The url slugs of the categories.
+        positions: dict, The position of each category by slug.
+        brands: list, The canonical brand names.
+    """
+
+    def __init__(self, size, seed=0, page_size=api.PAGE_SIZE):
+        self.size = size
+        self.seed = seed
+        self.page_size = page_size
+        self.cross = int(page_size * CROSS_SHARE)
+        self.rejects = int(page_size * REJECT_SHARE)
+        self.own = page_size - self.cross - self.rejects
+        self.slugs = [self.slug(i)
+                      for i in range(math.ceil(size / self.own))]
+        self.positions = {slug: i for i, slug in enumerate(self.slugs)}
+        names = random.Random(f"{seed}:brands")
+        self.brands = []
+        for i in range(max(20, size // 100)):
+            name = "".join(names.choice(SYLLABLES)
+                           for _ in range(names.randint(2, 4)))
+            self.brands.append(f"{name.capitalize()} {i}")
+
+    @staticmethod
+    def slug(index):
+        """Returns the url slug of a category."""
+
+        base = api.CAT_ENDPOINT[index % len(api.CAT_ENDPOINT)]
+        round_ = index // len(api.CAT_ENDPOINT)
+        return f"{base}-{round_ + 1}" if round_ else base
+
+    def category_url(self, slug):
+        """Returns the url of a category, as built during ingest."""
+
+        return api.BASE_CAT_URL + slug
+
+    def categories(self):
+        """Returns the categories as served by categories.json.
+
+        Categories list more products than their page holds, as they do
+            on OpenFoodFacts, the first ones more than the others.
+        """
+
+        tags = [{'id': f"fr:{slug}",
+                 'name': slug.replace("-", " ").capitalize(),
+                 'products': self.page_size * (len(self.slugs) - i),
+                 'url': self.category_url(slug)}
+                for i, slug in enumerate(self.slugs)]
+        return {'count': len(tags), 'tags': tags}
+
+    def taxonomy(self):
+        """Returns the taxonomy of categories, with their parents.
+
+        Categories of CAT_ENDPOINT are at the top of the tree, and each
+            numbered one is a child of the one numbered before it.
+        """
+
+        taxonomy = {}
+        for i, slug in enumerate(self.slugs):
+            parent = i - len(api.CAT_ENDPOINT)
+            parents = [f"fr:{self.slugs[parent]}"] if parent >= 0 else []
+            taxonomy[f"fr:{slug}"] = {'name': {'fr': slug},
+                                      'parents': parents}
+        return taxonomy
+
+    def page(self, slug):
+        """Returns the search page of a category.
+
+        Args:
+            slug: str, The url slug of the category.
+
+        Returns:
+            dict: The page, its products under the 'products' key.
+
+        Raises:
+            KeyError: There is no such category.
+        """
+
+        index = self.positions[slug]
+        first = index * self.own
+        keys = list(range(first, min(first + self.own, self.size)))
+        if index:
+            keys += range(first - self.cross, first)
+        valid = [self.product(key) for key in keys]
+        pick = random.Random(f"{self.seed}:page:{index}")
+        products = list(valid)
+        for i in range(self.rejects if valid else 0):
+            products.append(self.reject(REJECTS[i % len(REJECTS)],
+                                        pick.choice(valid)))
+        pick.shuffle(products)
+        return {'count': len(products), 'page': 1,
+                'page_size': self.page_size, 'products': products}
+
+    def pages(self):
+        """Yields the slug and search page of every category."""
+
+        for slug in self.slugs:
+            yield slug, self.page(slug)
+
+    def product(self, key):
+        """Returns a valid product.
+
+        Args:
+            key: int, The position of the product in the catalog.
+        """
+
+        pick = random.Random(f"{self.seed}:product:{key}")
+        name = (f"{pick.choice(NOUNS).capitalize()} "
+                f"{pick.choice(ADJECTIVES)} {pick.choice(FLAVORS)} {key}")
+        brands = [self.spell(pick, pick.choice(self.brands))
+                  for _ in range(pick.choice((1, 1, 1, 2)))]
+        stores = [self.spell(pick, pick.choice(STORES))
+                  for _ in range(pick.randint(1, 4))]
+        grade = pick.choice(GRADES) if pick.random() > 0.02 else "unknown"
+        return {'code': f"{3000000000000 + key}",
+                'product_name_fr': name,
+                'brands': ",".join(brands),
+                'stores': ", ".join(stores),
+                'nutrition_grades': grade,
+                'url': f"https://fr.openfoodfacts.org/produit/"
+                       f"{3000000000000 + key}/"
+                       f"{name.lower().replace(' ', '-')}"}
+
+    @staticmethod
+    def spell(pick, name):
+        """Returns a name, or a near-duplicate spelling of it."""
+
+        draw = pick.random()
+        if draw < 0.04:
+            return name.upper()
+        if draw < 0.07:
+            cut = pick.randrange(1, len(name) - 1)
+            return name[:cut] + name[cut + 1:]
+        if draw < 0.09:
+            return f" {name}s"
+        return name
+
+    @staticmethod
+    def reject(reason, product):
+        """Returns a product the cleaning should reject.
+
+        Args:
+            reason: str, One of REJECTS.
+            product: dict, The valid product to spoil.
+        """
+
+        product = dict(product)
+        if reason == 'no_stores':
+            del product['stores']
+        elif reason == 'no_brands':
+            product['brands'] = ""
+        elif reason == 'no_grade':
+            product['nutrition_grades'] = ""
+        return product
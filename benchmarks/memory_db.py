@@ -0,0 +1,270 @@
+"""Contains the class MemoryDBSocket."""
+
+import zlib
+from backend.db_socket import SHADOWED_TABLES
+from backend.nutrition_grade import to_ordinal
+from backend.snapshot import FAVORITE_TABLES, LAYOUT
+
+
+class MemoryConnection:
+    """Stands in for the pymysql connection of a MemoryDBSocket.
+
+    Every change is applied at once, so there is nothing to commit.
+    """
+
+    open = True
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+class MemoryDBSocket:
+    """Stands in for DBSocket with tables held in memory.
+
+    Queries answer the same rows as the db, so benchmarks measure the
+        program rather than the db server. Link tables are indexed like
+        the db does with its foreign keys. Methods are the ones of
+        DBSocket used by Brain, see their documentation there.
+
+    Attributes:
+        tables: dict, The rows of each table, in insertion order.
+        next_id: dict, The next id of each table with ids.
+        indexes: dict, For some link tables, their rows by value of
+            the column in INDEXED.
+        connection: The MemoryConnection of the socket.
+        db_is_empty: Boolean True if db is empty False otherwise.
+    """
+
+    INDEXED = {'category_products': 'category_id',
+               'product_brands': 'product_id',
+               'product_stores': 'product_id'}
+
+    def __init__(self):
+        self.tables = {table: [] for table in (
+            'categories', 'products', 'category_products', 'favorites',
+            'product_favorites', 'brands', 'stores', 'product_stores',
+            'product_brands', 'refresh_checkpoints')}
+        self.next_id = {table: 1 for table in (
+            'categories', 'products', 'favorites', 'brands', 'stores')}
+        self.indexes = {table: {} for table in self.INDEXED}
+        self.connection = MemoryConnection()
+        self.db_is_empty = True
+
+    def insert(self, table, **row):
+        """Adds a row to a table, with the next id if the table has ids.
+
+        Returns:
+            dict: The row added.
+        """
+
+        if table in self.next_id:
+            row = dict(id=self.next_id[table], **row)
+            self.next_id[table] += 1
+        self.tables[table].append(row)
+        if table in self.indexes:
+            self.indexes[table].setdefault(
+                row[self.INDEXED[table]], []).append(row)
+        return row
+
+    def linked(self, table, keys):
+        """Returns the rows of an indexed link table for several keys."""
+
+        index = self.indexes[table]
+        return [dict(row) for key in keys for row in index.get(key, ())]
+
+    def cat_insertion_v2(self, category):
+        self.insert('categories', name=category.french_name,
+                    url=category.url)
+        self.db_is_empty = False
+
+    def product_insertion_v2(self, product):
+        self.insert('products', french_name=product.french_name,
+                    url=product.url,
+                    nutrition_grades=product.nutrition_grades)
+        return True
+
+    def cat_prod_insertion(self, category, product):
+        self.insert('category_products', category_id=category.id,
+                    product_id=product.id)
+
+    def prod_stores_insertion(self, product, store):
+        self.insert('product_stores', product_id=product.id,
+                    store_id=store.id)
+
+    def prod_brands_insertion(self, product, brand):
+        self.insert('product_brands', product_id=product.id,
+                    brand_id=brand.id)
+
+    def prod_fav_insertion(self, product_id, favorite_id):
+        self.insert('product_favorites', product_id=product_id,
+                    favorite_id=favorite_id)
+
+    def prod_fav_del(self, product, fav):
+        self.tables['product_favorites'] = [
+            row for row in self.tables['product_favorites']
+            if (row['product_id'], row['favorite_id']) != (product.id,
+                                                           fav.id)]
+
+    def store_insertion(self, store):
+        self.insert('stores', name=store.name, url=store.url)
+        return True
+
+    def brand_insertion(self, brand):
+        self.insert('brands', name=brand.name, url=brand.url)
+        return True
+
+    def get_max_id_from_fav(self):
+        favorites = self.tables['favorites']
+        return [{'MAX( id )': favorites[-1]['id'] if favorites else None}]
+
+    # The link tables emptied with a table, like the foreign keys of the
+    # db cascade the deletion of its rows.
+    CASCADES = {'categories': ('category_products',),
+                'products': ('category_products', 'product_favorites',
+                             'product_stores', 'product_brands'),
+                'favorites': ('product_favorites',),
+                'brands': ('product_brands',),
+                'stores': ('product_stores',)}
+
+    def clear_table(self, *table):
+        for name in table:
+            for cleared in (name,) + self.CASCADES.get(name, ()):
+                self.tables[cleared] = []
+                if cleared in self.next_id:
+                    self.next_id[cleared] = 1
+                if cleared in self.indexes:
+                    self.indexes[cleared] = {}
+        self.db_is_empty = not self.tables['categories']
+
+    def reset_ids(self, *tables):
+        for table in tables:
+            rows = self.tables[table]
+            self.next_id[table] = rows[-1]['id'] + 1 if rows else 1
+
+    def get_checkpoints(self):
+        return {row['step']: dict(row)
+                for row in self.tables['refresh_checkpoints']}
+
+    def save_checkpoint(self, step, products=0):
+        self.tables['refresh_checkpoints'] = [
+            row for row in self.tables['refresh_checkpoints']
+            if row['step'] != step]
+        self.insert('refresh_checkpoints', step=step, products=products)
+
+    def clear_checkpoints(self):
+        self.tables['refresh_checkpoints'] = []
+
+    def open_shadow(self):
+        return self.__class__()
+
+    def keep_favorites(self, shadow):
+        fresh = {}
+        for row in shadow.tables['products']:
+            fresh.setdefault(row['url'], row['id'])
+        urls = {row['id']: row['url'] for row in self.tables['products']}
+        for row in self.tables['favorites']:
+            if row['url'] in fresh:
+                shadow.tables['favorites'].append(
+                    dict(row, original_id=fresh[row['url']]))
+        kept = {row['id'] for row in shadow.tables['favorites']}
+        shadow.next_id['favorites'] = max(kept, default=0) + 1
+        for row in self.tables['product_favorites']:
+            product_id = fresh.get(urls.get(row['product_id']))
+            if product_id is not None and row['favorite_id'] in kept:
+                shadow.insert('product_favorites', product_id=product_id,
+                              favorite_id=row['favorite_id'])
+        return len(kept)
+
+    def swap(self, shadow):
+        for table in SHADOWED_TABLES:
+            self.tables[table] = shadow.tables[table]
+            if table in self.next_id:
+                self.next_id[table] = shadow.next_id[table]
+            if table in self.indexes:
+                self.indexes[table] = shadow.indexes[table]
+        self.db_is_empty = not self.tables['categories']
+
+    def drop_shadow(self, shadow):
+        pass
+
+    def get_stamp(self):
+        stamp = {'catalog': {}, 'favorites': {}}
+        for table, columns in LAYOUT.items():
+            crc = 0
+            for row in self.tables[table]:
+                crc ^= zlib.crc32(":".join(
+                    "" if row[column] is None else str(row[column])
+                    for column, _ in columns).encode())
+            part = stamp['favorites' if table in FAVORITE_TABLES
+                         else 'catalog']
+            part[table] = len(self.tables[table])
+            part[f"{table}_crc"] = crc
+        products = self.tables['products']
+        stamp['catalog']['max_product'] = products[-1]['id'] if products else 0
+        return stamp
+
+    def dump_tables(self, *tables):
+        return {table: [dict(row) for row in self.tables[table]]
+                for table in tables}
+
+    def get_categories(self):
+        return [dict(row) for row in self.tables['categories']]
+
+    def get_brands_from_prods(self, product_ids):
+        return self.linked('product_brands', product_ids)
+
+    def get_stores_from_prods(self, product_ids):
+        return self.linked('product_stores', product_ids)
+
+    def get_prods_from_favs(self, favorite_ids):
+        favorite_ids = set(favorite_ids)
+        products = self.tables['products']
+        return [dict(products[row['product_id'] - 1],
+                     favorite_id=row['favorite_id'])
+                for row in self.tables['product_favorites']
+                if row['favorite_id'] in favorite_ids]
+
+    def get_products_from_cat(self, category):
+        ids = {row['id'] for row in self.tables['categories']
+               if row['name'] == category.french_name}
+        products = self.tables['products']
+        return [dict(products[row['product_id'] - 1], **row)
+                for row in self.linked('category_products', ids)]
+
+    def get_brands(self):
+        return [dict(row) for row in self.tables['brands']]
+
+    def get_stores(self):
+        return [dict(row) for row in self.tables['stores']]
+
+    def get_brand_links(self):
+        return [dict(row) for row in self.tables['product_brands']]
+
+    def get_store_links(self):
+        return [dict(row) for row in self.tables['product_stores']]
+
+    def get_saved_products(self):
+        return [dict(row) for row in self.tables['favorites']]
+
+    def delete_saved_substitute(self, subst):
+        ids = {row['id'] for row in self.tables['favorites']
+               if row['original_id'] == subst.original_id}
+        self.tables['favorites'] = [row for row in self.tables['favorites']
+                                    if row['id'] not in ids]
+        self.tables['product_favorites'] = [
+            row for row in self.tables['product_favorites']
+            if row['favorite_id'] not in ids]
+
+    def save_to_db_v2(self, subst):
+        self.insert('favorites', original_id=subst.original_id,
+                    french_name=subst.french_name, url=subst.url,
+                    nutrition_grades=to_ordinal(subst.nutrition_grades))
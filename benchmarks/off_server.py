@@ -0,0 +1,289 @@
+"""Serves a stand-in for the OpenFoodFacts API, for offline load tests.
+
+Usage:
+    python3 -m benchmarks.off_server --size 10k --port 8080 --latency 0.05
+    OFF_API_URL=http://127.0.0.1:8080 python3 app.py ingest
+
+Routes, as requested by APISocket:
+    GET /categories.json
+    GET /data/taxonomies/categories.json
+    GET /categorie/<slug>.json()&page_size=<n>&fields=<fields>
+    GET /_stats, the requests served so far
+
+Pages come from a SyntheticCatalog, or from a fixture directory holding
+    categories.json, taxonomy.json and one <slug>.json search page per
+    category. The
+    server can be made slow, narrow, unreliable or rate limited to test
+    how ingest copes.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from benchmarks.catalog_generator import SCALES, SyntheticCatalog
+
+CHUNK_SIZE = 16384
+
+
+class FixtureCatalog:
+    """Serves the pages saved in a directory.
+
+    Args:
+        directory: str, Holds categories.json, taxonomy.json and
+            <slug>.json files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load(self, name):
+        """Returns the content of a JSON file of the directory."""
+
+        path = os.path.join(self.directory, os.path.basename(name))
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def categories(self):
+        return self.load("categories.json")
+
+    def taxonomy(self):
+        return self.load("taxonomy.json")
+
+    def page(self, slug):
+        try:
+            return self.load(f"{slug}.json")
+        except FileNotFoundError as error:
+            raise KeyError(slug) from error
+
+
+class RateLimiter:
+    """A token bucket allowing a number of requests per second.
+
+    Args:
+        rate: float, The requests allowed per second, with bursts of as
+            many requests.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Takes a token if there is one.
+
+        Returns:
+            float: 0 if the request is allowed, otherwise the seconds
+                before a token is available.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens
+                              + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers a request like OpenFoodFacts would, within the limits of
+    the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        path, params = self.parse_path()
+        status, body, headers = 200, None, {}
+        wait = server.limiter.allow() if server.limiter else 0.0
+        if wait:
+            status, body = 429, {'error': "Too many requests."}
+            headers['Retry-After'] = str(max(1, round(wait)))
+        elif server.errors.random() < server.error_rate:
+            status, body = 503, {'error': "Service unavailable."}
+        elif path == "/_stats":
+            body = server.stats()
+        elif path == "/categories.json":
+            body = server.catalog.categories()
+        elif path == "/data/taxonomies/categories.json":
+            body = server.catalog.taxonomy()
+        elif path.startswith("/categorie/") and ".json" in path:
+            slug = path[len("/categorie/"):path.index(".json")]
+            try:
+                body = self.select(server.catalog.page(slug), params)
+            except KeyError:
+                status, body = 404, {'error': f"No category {slug}."}
+        else:
+            status, body = 404, {'error': f"No route {path}."}
+        server.count(status)
+        if server.latency:
+            time.sleep(server.latency)
+        self.send(status, json.dumps(body).encode("utf-8"), headers)
+
+    def parse_path(self):
+        """Splits the path from its parameters.
+
+        APISocket appends parameters to the path with '&' and no '?',
+            which OpenFoodFacts accepts, so both forms are read.
+
+        Returns:
+            tuple: The path and the dict of parameters.
+        """
+
+        url = urlsplit(self.path)
+        path, *pairs = unquote(url.path).split("&")
+        params = {key: values[0]
+                  for key, values in parse_qs(url.query).items()}
+        for pair in pairs:
+            key, _, value = pair.partition("=")
+            params[key] = value
+        return path, params
+
+    @staticmethod
+    def select(page, params):
+        """Applies the page_size and fields parameters to a page."""
+
+        products = page['products']
+        if params.get('page_size', "").isdigit():
+            products = products[:int(params['page_size'])]
+        if params.get('fields'):
+            fields = params['fields'].split(",")
+            products = [{key: product[key] for key in fields
+                         if key in product} for product in products]
+        return dict(page, products=products, count=len(products))
+
+    def send(self, status, body, headers):
+        """Sends a response, no faster than the bandwidth of the server.
+        """
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        bandwidth = self.server.bandwidth
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+
+    def log_request(self, code='-', size='-'):
+        if self.server.verbose:
+            super().log_request(code, size)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Serves a catalog as OpenFoodFacts would, one thread per
+    connection.
+
+    Args:
+        address: tuple, The host and port to listen on.
+        catalog: The SyntheticCatalog or FixtureCatalog to serve.
+        latency: float, Seconds added to every response.
+        bandwidth: float, Bytes sent per second, None for no limit.
+        error_rate: float, The share of requests failing with a 503.
+        rate_limit: float, Requests allowed per second before answering
+            429, None for no limit.
+        seed: int, Makes failures the same from one run to the next.
+        verbose: bool, True to log every request.
+
+    Attributes:
+        served: dict, The number of responses by status.
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, catalog, latency=0.0, bandwidth=None,
+                 error_rate=0.0, rate_limit=None, seed=0, verbose=False):
+        super().__init__(address, StandInHandler)
+        self.catalog = catalog
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.errors = random.Random(seed)
+        self.verbose = verbose
+        self.served = {}
+        self.lock = threading.Lock()
+
+    def count(self, status):
+        """Counts a response."""
+
+        with self.lock:
+            self.served[status] = self.served.get(status, 0) + 1
+
+    def stats(self):
+        """Returns the number of responses by status."""
+
+        with self.lock:
+            return {str(status): count
+                    for status, count in sorted(self.served.items())}
+
+
+def build_parser():
+    """Returns the parser of the command line."""
+
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.off_server",
+        description="Serves a stand-in for the OpenFoodFacts API.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--size', choices=SCALES, default='10k',
+                        help="scale of the synthetic catalog")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixture', metavar="DIR",
+                        help="serve the JSON files of DIR instead")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds added to every response")
+    parser.add_argument('--bandwidth', type=float,
+                        help="bytes sent per second")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="share of requests failing with a 503")
+    parser.add_argument('--rate-limit', type=float,
+                        help="requests per second before answering 429")
+    parser.add_argument('--verbose', action="store_true",
+                        help="log every request")
+    return parser
+
+
+def main(argv=None):
+    """Serves until interrupted.
+
+    Returns:
+        int: The exit status.
+    """
+
+    args = build_parser().parse_args(argv)
+    if args.fixture:
+        catalog = FixtureCatalog(args.fixture)
+    else:
+        catalog = SyntheticCatalog(SCALES[args.size], args.seed)
+    server = StandInServer((args.host, args.port), catalog, args.latency,
+                           args.bandwidth, args.error_rate, args.rate_limit,
+                           args.seed, args.verbose)
+    print(f"Serving on http://{args.host}:{server.server_port}, set "
+          f"OFF_API_URL to it", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
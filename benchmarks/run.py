@@ -0,0 +1,406 @@
+"""Runs the benchmarks of the program on a synthetic catalog.
+
+Usage:
+    python3 -m benchmarks.run --scale 10k --output results.json
+    python3 -m benchmarks.run --scale 10k --compare results.json
+    python3 -m benchmarks.run --compare results.json --memory-tolerance 0.05
+
+Every benchmark runs against a MemoryDBSocket filled from a
+    SyntheticCatalog, so results only depend on the code, the scale and
+    the machine. Each one is set up again before each run and only the
+    run itself is timed. The memory a loaded catalog takes is measured
+    once, with a MemoryReport, and a run taking more than the baseline
+    beyond the tolerance fails with exit status 1.
+
+Results are written as JSON:
+    {"format": 1, "scale": "10k", "products": 10000, "seed": 0,
+     "python": "3.8.10", "machine": "...", "created": "...",
+     "benchmarks": {"ingest": {"items": 9975, "runs": [1.2, 1.1],
+                               "best": 1.1, "median": 1.15,
+                               "items_per_second": 9068.2}, ...},
+     "memory": {"bytes": 41943040, "objects": 512000,
+                "by_attribute": {"products": 30000000, ...},
+                "duplicates": {"strings": {"count": 0, "bytes": 0}}}}
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from unittest import mock
+from backend.api_socket import APISocket
+from backend.brain import Brain
+from backend.category import Category
+from backend.memory_report import MemoryReport
+from benchmarks.catalog_generator import SCALES, SyntheticCatalog
+from benchmarks.memory_db import MemoryDBSocket
+from config import api_downloads as api
+from config import misc
+
+FORMAT = 1
+SAMPLE_SIZE = 200
+MEMORY_TOLERANCE = 0.05
+
+
+class CatalogAPISocket(APISocket):
+    """An APISocket requesting its pages from a SyntheticCatalog.
+
+    Only the download is replaced, cleaning runs as usual.
+
+    Args:
+        catalog: The SyntheticCatalog to request pages from.
+    """
+
+    def __init__(self, catalog):
+        super().__init__()
+        self.catalog = catalog
+
+    def request_categories(self):
+        self.raw_categories = self.catalog.categories()
+        return self.raw_categories
+
+    def request_taxonomy(self):
+        return self.catalog.taxonomy()
+
+    def download_products(self, category_url):
+        slug = category_url[len(api.BASE_CAT_URL):]
+        return self.catalog.page(slug)['products'], 0.0, 0
+
+
+class Bench:
+    """Shares the catalog and the ingested db between benchmarks.
+
+    Args:
+        catalog: The SyntheticCatalog to benchmark on.
+        snapshot: str, The path of the snapshot file.
+
+    Attributes:
+        pages: list, The search page of every category.
+    """
+
+    def __init__(self, catalog, snapshot):
+        self.catalog = catalog
+        self.pages = [page for _, page in catalog.pages()]
+        self.snapshot = snapshot
+        self._db = None
+
+    def brain(self, dbs):
+        """Returns a Brain over a db, with its memory empty."""
+
+        return Brain(autoload=False, dbs=dbs,
+                     apis=CatalogAPISocket(self.catalog))
+
+    def empty_brain(self):
+        """Returns a Brain over an empty db, its categories inserted."""
+
+        brain = self.brain(MemoryDBSocket())
+        for slug in self.catalog.slugs:
+            category = Category({'id': len(brain.categories_list) + 1,
+                                 'name': slug.replace("-", " ").capitalize(),
+                                 'url': self.catalog.category_url(slug)})
+            brain.dbs.cat_insertion_v2(category)
+            brain.categories_list.append(category)
+        return brain
+
+    def db(self):
+        """Returns a db holding the whole catalog, ingested once."""
+
+        if self._db is None:
+            brain = self.empty_brain()
+            brain.fill_products_from_off_v3()
+            self._db = brain.dbs
+        return self._db
+
+    def loaded_brain(self):
+        """Returns a Brain with the whole catalog in memory."""
+
+        brain = self.brain(self.db())
+        brain.fill_from_db()
+        return brain
+
+    def sample(self, brain):
+        """Returns products of the catalog spread evenly over it."""
+
+        ids = sorted(brain.products)
+        step = max(len(ids) // SAMPLE_SIZE, 1)
+        return [brain.products[i] for i in ids[::step][:SAMPLE_SIZE]]
+
+    def remove_snapshot(self):
+        """Removes the snapshot file, for a start without one."""
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.snapshot)
+
+
+def clean(bench):
+    """Cleans every page as downloaded."""
+
+    apis = APISocket()
+
+    def run():
+        count = 0
+        for page in bench.pages:
+            apis.cleaned_products = []
+            apis.raw_products = page['products']
+            apis.cleaning()
+            count += len(page['products'])
+        return count
+    return run
+
+
+def ingest(bench):
+    """Downloads, cleans and saves every page in an empty db."""
+
+    brain = bench.empty_brain()
+
+    def run():
+        brain.fill_products_from_off_v3()
+        return len(brain.products)
+    return run
+
+
+def cold_start(bench):
+    """Loads the catalog from the db, then saves a snapshot."""
+
+    dbs = bench.db()
+    bench.remove_snapshot()
+    brain = bench.brain(dbs)
+
+    def run():
+        brain.fill_from_db()
+        return len(brain.products)
+    return run
+
+
+def warm_start(bench):
+    """Loads the catalog from an up to date snapshot."""
+
+    dbs = bench.db()
+    if not os.path.exists(bench.snapshot):
+        bench.brain(dbs).save_snapshot()
+    brain = bench.brain(dbs)
+
+    def run():
+        brain.fill_from_db()
+        return len(brain.products)
+    return run
+
+
+def substitutes(bench):
+    """Finds the substitutes to a sample of products."""
+
+    brain = bench.loaded_brain()
+    products = bench.sample(brain)
+
+    def run():
+        for product in products:
+            brain.get_substitutes_to_product(product)
+        return len(products)
+    return run
+
+
+def favorites(bench):
+    """Saves the best substitute to a sample of products, then deletes
+    them."""
+
+    brain = bench.loaded_brain()
+    pairs = []
+    for product in bench.sample(brain):
+        brain.get_substitutes_to_product(product)
+        if product.substitute_page_buffer or product.substitute_registry:
+            pages = product.substitute_registry + [
+                product.substitute_page_buffer]
+            pairs.append((next(subst for page in pages for subst in page),
+                          product))
+
+    def run():
+        for substitute, product in pairs:
+            brain.save_substitute_v2(substitute, product)
+        saved = list(brain.saved_sub_buf) + [
+            fav for page in brain.subst_reg for fav in page]
+        for fav in saved:
+            brain.del_all_in_fav(fav)
+        return len(pairs) + len(saved)
+    return run
+
+
+BENCHMARKS = {
+    'clean': clean,
+    'ingest': ingest,
+    'cold_start': cold_start,
+    'warm_start': warm_start,
+    'substitutes': substitutes,
+    'favorites': favorites,
+}
+
+
+def memory(bench):
+    """Measures the memory taken by the catalog loaded from the db, with
+    the substitutes to a sample of products.
+
+    Returns:
+        dict: The bytes and objects of the catalog, the bytes under each
+            attribute of Brain, and the duplicates found.
+    """
+
+    bench.remove_snapshot()
+    brain = bench.loaded_brain()
+    for product in bench.sample(brain):
+        brain.get_substitutes_to_product(product)
+    report = MemoryReport(brain).build()
+    return {'bytes': report['bytes'],
+            'objects': report['objects'],
+            'by_attribute': {attr: part['bytes'] for attr, part
+                             in report['by_attribute'].items()},
+            'duplicates': report['duplicates']}
+
+
+def measure(bench, setup, repeat):
+    """Runs a benchmark several times.
+
+    Args:
+        bench: The Bench to run on.
+        setup: callable, Prepares a run and returns it.
+        repeat: int, The number of runs.
+
+    Returns:
+        dict: The number of items and the timings of the runs.
+    """
+
+    runs = []
+    items = 0
+    for _ in range(repeat):
+        run = setup(bench)
+        start = time.perf_counter()
+        items = run()
+        runs.append(time.perf_counter() - start)
+    best = min(runs)
+    return {'items': items,
+            'runs': runs,
+            'best': best,
+            'median': statistics.median(runs),
+            'items_per_second': items / best if best else None}
+
+
+def compare(results, baseline, tolerance=MEMORY_TOLERANCE):
+    """Prints how much slower or faster each benchmark got, and how much
+    memory the catalog takes compared with the baseline.
+
+    Args:
+        results: dict, The results of this run.
+        baseline: dict, Results from a previous run, at the same scale.
+        tolerance: float, The share of memory the catalog may grow by.
+
+    Returns:
+        bool: True if the catalog takes more memory than allowed.
+    """
+
+    if baseline.get('scale') != results['scale']:
+        print(f"Warning: the baseline was run at scale "
+              f"{baseline.get('scale')}.", file=sys.stderr)
+    print(f"{'benchmark':<12} {'baseline':>10} {'now':>10} {'ratio':>7}",
+          file=sys.stderr)
+    for name, result in results['benchmarks'].items():
+        old = baseline.get('benchmarks', {}).get(name)
+        if old is None:
+            print(f"{name:<12} {'-':>10} {result['best']:>10.4f}",
+                  file=sys.stderr)
+            continue
+        print(f"{name:<12} {old['best']:>10.4f} {result['best']:>10.4f} "
+              f"{result['best'] / old['best']:>7.2f}", file=sys.stderr)
+    old = baseline.get('memory')
+    if old is None or 'memory' not in results:
+        return False
+    ratio = results['memory']['bytes'] / old['bytes']
+    print(f"{'memory MB':<12} {old['bytes'] / 1e6:>10.1f} "
+          f"{results['memory']['bytes'] / 1e6:>10.1f} {ratio:>7.2f}",
+          file=sys.stderr)
+    if ratio <= 1 + tolerance:
+        return False
+    for attr, size in results['memory']['by_attribute'].items():
+        before = old.get('by_attribute', {}).get(attr, 0)
+        if size > before:
+            print(f"  {attr}: +{(size - before) / 1e6:.1f} MB",
+                  file=sys.stderr)
+    print(f"Memory regression: the catalog takes {ratio - 1:.1%} more than "
+          f"the baseline, above the tolerance of {tolerance:.1%}.",
+          file=sys.stderr)
+    return True
+
+
+def build_parser():
+    """Returns the parser of the command line."""
+
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks.run",
+        description="Benchmarks the program on a synthetic catalog.")
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS,
+                        help="Benchmarks to run, all by default.")
+    parser.add_argument('--output', help="File to write results to.")
+    parser.add_argument('--compare', metavar="BASELINE",
+                        help="Results of a previous run to compare with.")
+    parser.add_argument('--memory-tolerance', type=float,
+                        default=MEMORY_TOLERANCE,
+                        help="Share of memory the catalog may grow by "
+                             "before failing, 0.05 by default.")
+    parser.add_argument('--skip-memory', action='store_true',
+                        help="Do not measure memory.")
+    return parser
+
+
+def main(argv=None):
+    """Runs the benchmarks and prints the results as JSON.
+
+    Returns:
+        int: The exit status.
+    """
+
+    args = build_parser().parse_args(argv)
+    catalog = SyntheticCatalog(SCALES[args.scale], args.seed)
+    results = {'format': FORMAT,
+               'scale': args.scale,
+               'products': catalog.size,
+               'seed': args.seed,
+               'python': platform.python_version(),
+               'machine': platform.platform(),
+               'created': datetime.datetime.now().isoformat(
+                   timespec='seconds'),
+               'benchmarks': {}}
+    with tempfile.TemporaryDirectory() as directory, \
+            mock.patch.object(misc, 'SNAPSHOT_FILE',
+                              os.path.join(directory, "catalog.snapshot")), \
+            contextlib.redirect_stdout(io.StringIO()):
+        bench = Bench(catalog, misc.SNAPSHOT_FILE)
+        for name in args.only or BENCHMARKS:
+            results['benchmarks'][name] = measure(bench, BENCHMARKS[name],
+                                                  args.repeat)
+            print(f"{name}: {results['benchmarks'][name]['best']:.4f}s",
+                  file=sys.stderr)
+        if not args.skip_memory:
+            results['memory'] = memory(bench)
+            print(f"memory: {results['memory']['bytes'] / 1e6:.1f} MB",
+                  file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    regressed = False
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressed = compare(results, json.load(file),
+                                args.memory_tolerance)
+    print(json.dumps(results, indent=2))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,8 @@
 This file contains variables for interacting with the OpenFoodFacts API.
 """
 
+import os
+
 off_categories = {}
 PAGE_SIZE = 500
 
@@ -15,10 +17,30 @@ off_urls = {
     '&fields=brands,nutrition_grades,product_name_fr,stores,url',
     'cat_aliment_boisson_vege':
     'https://fr.openfoodfacts.org/categorie/'
-    'aliments-et-boissons-a-base-de-vegetaux.json&page_size=5000'
+    'aliments-et-boissons-a-base-de-vegetaux.json&page_size=5000',
+    'taxonomy':
+    'https://fr.openfoodfacts.org/data/taxonomies/categories.json'
 }
 
 PROD_FIELDS = 'brands,nutrition_grades,product_name_fr,stores,url'
+
+OFF_URL = "https://fr.openfoodfacts.org"
+# Where requests to OFF_URL are sent instead, such as a local stand-in
+# server for load tests (see benchmarks/off_server.py).
+API_URL = os.environ.get("OFF_API_URL", OFF_URL)
+# Requests per second to OpenFoodFacts: the rate to start with, its
+# bounds, and how it grows after a success and shrinks when throttled.
+RATE_LIMIT = 1.0
+RATE_LIMIT_MIN = 0.1
+RATE_LIMIT_MAX = 10.0
+RATE_INCREASE = 0.1
+RATE_DECREASE = 0.5
+# Seconds to connect and to read, retries of a failed request and the
+# backoff between them, doubling up to a maximum.
+HTTP_TIMEOUT = 30.0
+HTTP_RETRIES = 5
+HTTP_BACKOFF = 1.0
+HTTP_BACKOFF_MAX = 60.0
 STORE_URL = "https://world.openfoodfacts.org/store/"
 BRAND_URL = "https://world.openfoodfacts.org/brand/"
 
@@ -29,3 +51,24 @@ CAT_ENDPOINT = [
     "barres-de-cereales", "boissons-energisantes",
     "sodas", "charcuteries", "cereales pour petit-dejeuner", "jus-de-fruits"
 ]
+
+# Categories to ingest, picked from the categories listing of
+# OpenFoodFacts when crawling, instead of CAT_ENDPOINT. See class
+# CategoryCrawl.
+CRAWL_CATEGORIES = False
+CRAWL = {
+    # Categories listing fewer products are left out.
+    'min_products': 1000,
+    # Deepest level of the category tree, 0 for the top categories,
+    # None for any. Reads the taxonomy of categories.
+    'max_depth': None,
+    # Regular expressions searched in the url slug of categories: a
+    # category must match one of include, if any, and none of exclude.
+    'include': [],
+    'exclude': [],
+    'max_categories': 100,
+    # Products downloaded in all, a category counting PAGE_SIZE at most.
+    'max_products': 50000,
+}
+# Categories downloaded at the same time, under the same rate limit.
+DOWNLOAD_WORKERS = 4
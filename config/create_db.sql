@@ -10,12 +10,15 @@ CREATE TABLE IF NOT EXISTS categories (
 );
 
 -- Table products : relevant data for products pulled from OFF
+-- nutrition_grades holds the grade ordinal, 0 for A up to 4 for E.
+-- Databases where it is a char(1) are migrated by DBSocket.migrate_grades().
 CREATE TABLE IF NOT EXISTS products (
     id int UNSIGNED NOT NULL AUTO_INCREMENT,
     french_name varchar(500) NULL,
     url varchar(500) NULL,
-    nutrition_grades char(1) NULL,
-    CONSTRAINT id PRIMARY KEY (id)
+    nutrition_grades tinyint UNSIGNED NULL,
+    CONSTRAINT id PRIMARY KEY (id),
+    INDEX idx_products_grades (nutrition_grades)
 );
 
 CREATE TABLE IF NOT EXISTS category_products (
@@ -31,13 +34,15 @@ CREATE TABLE IF NOT EXISTS favorites (
     original_id int UNSIGNED NOT NULL,
     french_name varchar(500) NULL,
     url varchar(500) NULL,
-    nutrition_grades char(1) NULL,
-    CONSTRAINT id PRIMARY KEY (id)
+    nutrition_grades tinyint UNSIGNED NULL,
+    CONSTRAINT id PRIMARY KEY (id),
+    CONSTRAINT uq_favorites_original_id UNIQUE (original_id)
 );
 
 CREATE TABLE IF NOT EXISTS product_favorites (
     product_id int UNSIGNED NOT NULL,
     favorite_id int UNSIGNED NOT NULL,
+    CONSTRAINT uq_pf_link UNIQUE (product_id, favorite_id),
     CONSTRAINT fk_pf_product_id FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
     CONSTRAINT fk_pf_favorite_id FOREIGN KEY (favorite_id) REFERENCES favorites(id) ON DELETE CASCADE
 );
@@ -69,3 +74,13 @@ CREATE TABLE IF NOT EXISTS product_brands (
     CONSTRAINT fk_pb_product_id FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE,
     CONSTRAINT fk_pb_brand_id FOREIGN KEY (brand_id) REFERENCES brands(id) ON DELETE CASCADE
 );
+
+-- Table refresh_checkpoints : steps of the refresh in progress, committed
+-- with their data so an interrupted refresh resumes after the last one.
+-- Added to older databases by DBSocket.migrate_checkpoints().
+CREATE TABLE IF NOT EXISTS refresh_checkpoints (
+    step varchar(100) NOT NULL,
+    products int UNSIGNED NOT NULL DEFAULT 0,
+    done_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT step PRIMARY KEY (step)
+);
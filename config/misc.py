@@ -2,3 +2,23 @@
 
 PAGE_SIZE = 25
 NAME_SIZE = 50
+BRANDS_SIZE = 30
+RENDER_CACHE_SIZE = 64
+SNAPSHOT_FILE = "catalog.snapshot"
+SUBST_TOP_K = 50
+SUBST_WEIGHTS = {
+    'grade': 1.0,
+    'categories': 0.5,
+    'brands': 0.3,
+    'stores': 0.3,
+}
+SUBST_SHORTLIST_FACTOR = 4
+SUBST_CACHE_SIZE = 100
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+DB_POOL_SIZE = 8
+# Seconds between checks of the server for a new catalog in the db.
+CATALOG_CHECK_SECONDS = 30
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG = "slow_queries.log"
+QUERY_STATS_FILE = None
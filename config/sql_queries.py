@@ -39,15 +39,6 @@ GET_SAVED = "SELECT * from favorites;"
 
 DEL_SAVED = " DELETE FROM favorites WHERE original_id = {};"
 
-FIND_SUBST = "SELECT * FROM products " \
-             "RIGHT JOIN category_products " \
-             "ON products.id = category_products.product_id " \
-             "LEFT JOIN categories " \
-             "ON category_products.category_id = categories.id " \
-             "WHERE categories.id = %s " \
-             "AND LOWER(nutrition_grades) <= %s" \
-             "AND NOT products.french_name = %s;"
-
 QUERY_PROD_FROM_CAT = "SELECT * FROM products " \
                       "RIGHT JOIN category_products " \
                       "ON products.id = category_products.product_id " \
@@ -85,3 +76,209 @@ QUERY_MAX = "SELECT MAX( id ) FROM favorites;"
 DEL_PROD_FAV = "DELETE FROM product_favorites " \
                "WHERE product_id = %s " \
                "AND favorite_id = %s;"
+
+QUERY_BRANDS_FROM_PRODS = "SELECT product_id, brand_id FROM product_brands " \
+                          "WHERE product_id IN ({});"
+
+QUERY_STORES_FROM_PRODS = "SELECT product_id, store_id FROM product_stores " \
+                          "WHERE product_id IN ({});"
+
+QUERY_PRODS_FROM_FAVS = "SELECT products.*, product_favorites.favorite_id " \
+                        "FROM products " \
+                        "INNER JOIN product_favorites " \
+                        "ON products.id = product_favorites.product_id " \
+                        "WHERE product_favorites.favorite_id IN ({});"
+
+QUERY_BRAND_LINKS = "SELECT product_id, brand_id FROM product_brands;"
+
+DUMP_TABLE = "SELECT * FROM {};"
+
+# Counts the rows of every table of the snapshot, and checks every column
+# it holds, so the snapshot is stale as soon as one changes.
+DB_STAMP = "SELECT " \
+           "(SELECT COUNT(*) FROM categories) AS categories, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', id, IFNULL(name, " \
+           "''), IFNULL(url, '')))), 0) FROM categories) AS " \
+           "categories_crc, " \
+           "(SELECT COUNT(*) FROM products) AS products, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', id, " \
+           "IFNULL(french_name, ''), IFNULL(url, ''), " \
+           "IFNULL(nutrition_grades, '')))), 0) FROM products) AS " \
+           "products_crc, " \
+           "(SELECT COUNT(*) FROM brands) AS brands, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', id, IFNULL(name, " \
+           "''), IFNULL(url, '')))), 0) FROM brands) AS brands_crc, " \
+           "(SELECT COUNT(*) FROM stores) AS stores, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', id, IFNULL(name, " \
+           "''), IFNULL(url, '')))), 0) FROM stores) AS stores_crc, " \
+           "(SELECT COUNT(*) FROM category_products) AS category_products, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', category_id, " \
+           "product_id))), 0) FROM category_products) AS " \
+           "category_products_crc, " \
+           "(SELECT COUNT(*) FROM product_brands) AS product_brands, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', product_id, " \
+           "brand_id))), 0) FROM product_brands) AS product_brands_crc, " \
+           "(SELECT COUNT(*) FROM product_stores) AS product_stores, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', product_id, " \
+           "store_id))), 0) FROM product_stores) AS product_stores_crc, " \
+           "(SELECT COUNT(*) FROM favorites) AS favorites, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', id, original_id, " \
+           "IFNULL(french_name, ''), IFNULL(url, ''), " \
+           "IFNULL(nutrition_grades, '')))), 0) FROM favorites) AS " \
+           "favorites_crc, " \
+           "(SELECT COUNT(*) FROM product_favorites) AS product_favorites, " \
+           "(SELECT IFNULL(BIT_XOR(CRC32(CONCAT_WS(':', product_id, " \
+           "favorite_id))), 0) FROM product_favorites) AS " \
+           "product_favorites_crc, " \
+           "(SELECT IFNULL(MAX(id), 0) FROM products) AS max_product;"
+
+QUERY_STORE_LINKS = "SELECT product_id, store_id FROM product_stores;"
+
+# Saving an already saved substitute returns the id of its favorite.
+INS_FAV = "INSERT INTO favorites (original_id, french_name, url, " \
+          "nutrition_grades) VALUES (%s, %s, %s, %s) " \
+          "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id);"
+
+INS_PROD_FAV_ONCE = "INSERT IGNORE INTO product_favorites(product_id, " \
+                    "favorite_id) VALUES (%s, %s);"
+
+DEL_FAV = "DELETE FROM favorites WHERE original_id = %s;"
+
+# Locks the products read until the end of the transaction, so a swap of
+# the catalog waits for it.
+QUERY_PRODUCT_URLS = "SELECT id, url FROM products WHERE id IN ({}) " \
+                     "LOCK IN SHARE MODE;"
+
+INS_CHECKPOINT = "INSERT INTO refresh_checkpoints (step, products) " \
+                 "VALUES (%s, %s) ON DUPLICATE KEY UPDATE " \
+                 "products = VALUES(products), done_at = CURRENT_TIMESTAMP;"
+
+# Same table as in the SQL script, for databases created before it.
+CREATE_CHECKPOINTS = "CREATE TABLE IF NOT EXISTS refresh_checkpoints (" \
+                     "step varchar(100) NOT NULL, " \
+                     "products int UNSIGNED NOT NULL DEFAULT 0, " \
+                     "done_at timestamp NOT NULL " \
+                     "DEFAULT CURRENT_TIMESTAMP, " \
+                     "CONSTRAINT step PRIMARY KEY (step));"
+
+GET_CHECKPOINTS = "SELECT * FROM refresh_checkpoints;"
+
+DEL_CHECKPOINTS = "DELETE FROM refresh_checkpoints;"
+
+DROP_DB = "DROP DATABASE IF EXISTS {};"
+
+CREATE_DB = "CREATE DATABASE {};"
+
+# Favorites are found again among the products of the shadow tables {0}
+# by url, as product ids change.
+KEEP_FAVORITES = "INSERT IGNORE INTO {0}.favorites (id, original_id, " \
+                 "french_name, url, nutrition_grades) " \
+                 "SELECT favorites.id, MIN(fresh.id), favorites.french_name, " \
+                 "favorites.url, favorites.nutrition_grades " \
+                 "FROM favorites " \
+                 "INNER JOIN {0}.products AS fresh " \
+                 "ON fresh.url = favorites.url " \
+                 "GROUP BY favorites.id;"
+
+KEEP_PROD_FAVS = "INSERT IGNORE INTO {0}.product_favorites (product_id, " \
+                 "favorite_id) " \
+                 "SELECT fresh.id, product_favorites.favorite_id " \
+                 "FROM product_favorites " \
+                 "INNER JOIN products " \
+                 "ON products.id = product_favorites.product_id " \
+                 "INNER JOIN {0}.products AS fresh " \
+                 "ON fresh.url = products.url " \
+                 "INNER JOIN {0}.favorites AS kept " \
+                 "ON kept.id = product_favorites.favorite_id;"
+
+RENAME_TABLES = "RENAME TABLE {};"
+
+# Foreign keys of the tables of a database referencing the tables of
+# another one.
+QUERY_STRAY_FKS = "SELECT usage_.TABLE_NAME AS table_name, " \
+                  "usage_.CONSTRAINT_NAME AS constraint_name, " \
+                  "usage_.COLUMN_NAME AS column_name, " \
+                  "usage_.REFERENCED_TABLE_NAME AS referenced_table, " \
+                  "usage_.REFERENCED_COLUMN_NAME AS referenced_column, " \
+                  "rules.DELETE_RULE AS delete_rule " \
+                  "FROM information_schema.KEY_COLUMN_USAGE AS usage_ " \
+                  "INNER JOIN information_schema.REFERENTIAL_CONSTRAINTS " \
+                  "AS rules " \
+                  "ON rules.CONSTRAINT_SCHEMA = usage_.CONSTRAINT_SCHEMA " \
+                  "AND rules.CONSTRAINT_NAME = usage_.CONSTRAINT_NAME " \
+                  "WHERE usage_.TABLE_SCHEMA = %s " \
+                  "AND usage_.REFERENCED_TABLE_SCHEMA <> %s;"
+
+DROP_FK = "ALTER TABLE {0}.{1} DROP FOREIGN KEY {2};"
+
+ADD_FK = "ALTER TABLE {0}.{1} ADD CONSTRAINT {2} FOREIGN KEY ({3}) " \
+         "REFERENCES {0}.{4}({5}) ON DELETE {6};"
+
+# Grades were stored as letters in a char(1) column before, and as
+# digits once ordinals were written to it.
+GRADES_TYPE = "SELECT DATA_TYPE FROM information_schema.COLUMNS " \
+              "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s " \
+              "AND COLUMN_NAME = 'nutrition_grades';"
+
+GRADES_TO_ORDINALS = "UPDATE {} SET nutrition_grades = CASE " \
+                     "WHEN LOWER(nutrition_grades) " \
+                     "IN ('a', 'b', 'c', 'd', 'e') " \
+                     "THEN FIELD(LOWER(nutrition_grades), " \
+                     "'a', 'b', 'c', 'd', 'e') - 1 " \
+                     "WHEN nutrition_grades IN ('0', '1', '2', '3', '4') " \
+                     "THEN nutrition_grades END;"
+
+GRADES_TO_TINYINT = "ALTER TABLE {} MODIFY nutrition_grades " \
+                    "tinyint UNSIGNED NULL;"
+
+GRADES_INDEX = "SELECT INDEX_NAME FROM information_schema.STATISTICS " \
+               "WHERE TABLE_SCHEMA = DATABASE() " \
+               "AND TABLE_NAME = 'products' " \
+               "AND INDEX_NAME = 'idx_products_grades';"
+
+ADD_GRADES_INDEX = "CREATE INDEX idx_products_grades " \
+                   "ON products (nutrition_grades);"
+
+HAS_CONSTRAINT = "SELECT CONSTRAINT_NAME " \
+                 "FROM information_schema.TABLE_CONSTRAINTS " \
+                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s " \
+                 "AND CONSTRAINT_NAME = %s;"
+
+# Favorites saved more than once keep their first row, which gets the
+# links of the others.
+KEEP_FIRST_FAVS = "CREATE TEMPORARY TABLE kept_favorites " \
+                  "SELECT original_id, MIN(id) AS id FROM favorites " \
+                  "GROUP BY original_id;"
+
+RELINK_FAV_DUPS = "UPDATE product_favorites " \
+                  "INNER JOIN favorites " \
+                  "ON favorites.id = product_favorites.favorite_id " \
+                  "INNER JOIN kept_favorites AS kept " \
+                  "ON kept.original_id = favorites.original_id " \
+                  "SET product_favorites.favorite_id = kept.id;"
+
+DEL_FAV_DUPS = "DELETE favorites FROM favorites " \
+               "INNER JOIN kept_favorites AS kept " \
+               "ON kept.original_id = favorites.original_id " \
+               "WHERE favorites.id <> kept.id;"
+
+DROP_KEPT_FAVS = "DROP TEMPORARY TABLE kept_favorites;"
+
+ADD_UQ_FAVS = "ALTER TABLE favorites ADD CONSTRAINT " \
+              "uq_favorites_original_id UNIQUE (original_id);"
+
+# Links saved more than once are kept once.
+KEEP_PROD_FAV_LINKS = "CREATE TEMPORARY TABLE kept_links " \
+                      "SELECT DISTINCT product_id, favorite_id " \
+                      "FROM product_favorites;"
+
+EMPTY_PROD_FAVS = "DELETE FROM product_favorites;"
+
+RESTORE_PROD_FAV_LINKS = "INSERT INTO product_favorites " \
+                         "(product_id, favorite_id) " \
+                         "SELECT product_id, favorite_id FROM kept_links;"
+
+DROP_KEPT_LINKS = "DROP TEMPORARY TABLE kept_links;"
+
+ADD_UQ_PROD_FAVS = "ALTER TABLE product_favorites ADD CONSTRAINT " \
+                   "uq_pf_link UNIQUE (product_id, favorite_id);"
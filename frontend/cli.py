@@ -0,0 +1,261 @@
+"""Contains the non-interactive command line of the program.
+
+Each command drives Brain directly, never reads stdin and prints a
+    single JSON document on stdout. Messages printed along the way are
+    sent to stderr. Only the data a command needs is loaded.
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+from pymysql.err import MySQLError
+from backend.brain import Brain
+from backend.nutrition_grade import to_letter
+from backend.profiler import ActionProfiler
+from backend.snapshot import CatalogSnapshot
+from config import api_downloads as api
+from config import misc
+
+
+def product_to_dict(product):
+    """Returns the attributes of a product to print as JSON."""
+
+    return {'id': product.id,
+            'french_name': product.french_name,
+            'url': product.url,
+            'nutrition_grades': to_letter(product.nutrition_grades)}
+
+
+def ingest(brain, args):
+    """Reloads the whole catalog from OpenFoodFacts.
+
+    An update left unfinished is resumed, unless asked to restart. In
+        shadow mode the db keeps serving the old catalog until the new
+        one replaces it.
+    """
+
+    brain.update_db(restart=args.restart, shadow=args.shadow)
+    return {'categories': len(brain.categories_list),
+            'products': len(brain.products),
+            'brands': len(brain.brands_list),
+            'stores': len(brain.stores_list),
+            'merges': brain.merge_report(),
+            'telemetry': brain.ingest_report}
+
+
+def substitutes(brain, args):
+    """Finds the best substitutes to a product.
+
+    The product is given by id, or by a text searched in product names
+        and brands, in which case the best match is used.
+    """
+
+    by_id = args.product.isdigit()
+    brain.fill_from_db(favorites=False, search=not by_id)
+    if by_id:
+        product = brain.products.get(int(args.product))
+    else:
+        found = brain.search_index.search(args.product, limit=1)
+        product = found[0] if found else None
+    if product is None:
+        raise LookupError(f"No product matches {args.product!r}.")
+    store_ids = set(args.store or ())
+    brain.get_substitutes_to_product(product, store_ids)
+    found = [subst for page in product.substitute_registry
+             for subst in page]
+    if not product.buffer_added:
+        found += product.substitute_page_buffer
+    result = product_to_dict(product)
+    result['substitutes'] = []
+    for subst in found[:args.limit]:
+        entry = product_to_dict(subst)
+        entry['brands'] = [brand.name for brand in subst.brands_list]
+        entry['stores'] = [store.name for store in subst.stores_list]
+        result['substitutes'].append(entry)
+    return result
+
+
+def export(brain, args):
+    """Writes the best substitutes of every product to a file."""
+
+    brain.fill_from_db(favorites=False, search=False)
+    count = brain.compute_all_substitutes(args.output, args.format,
+                                          args.processes)
+    return {'path': args.output, 'format': args.format, 'products': count}
+
+
+def stats(brain, args):
+    """Counts the rows of the db and tells if the snapshot is usable.
+
+    Nothing is loaded in memory, the counts come from the db stamp.
+    """
+
+    stamp = brain.dbs.get_stamp()
+    snapshot = CatalogSnapshot.load(misc.SNAPSHOT_FILE)
+    if snapshot is None:
+        state = "missing"
+    elif snapshot.stamp['catalog'] != stamp['catalog']:
+        state = "stale"
+    else:
+        state = "fresh"
+    catalog = stamp['catalog']
+    return {'categories': catalog['categories'],
+            'products': catalog['products'],
+            'brands': catalog['brands'],
+            'stores': catalog['stores'],
+            'favorites': stamp['favorites']['favorites'],
+            'snapshot': state}
+
+
+def memory(brain, args):
+    """Loads the whole catalog and reports the memory it takes.
+
+    See class MemoryReport.
+    """
+
+    from backend.memory_report import MemoryReport
+
+    brain.fill_from_db()
+    report = MemoryReport(brain).build()
+    if args.top:
+        report['by_type'] = dict(list(report['by_type'].items())[:args.top])
+    return report
+
+
+def serve(brain, args):
+    """Serves the HTTP JSON API until interrupted.
+
+    See frontend.server for the routes. A catalog swapped in by a refresh
+        is loaded by a Brain of its own, on its own connection.
+    """
+
+    from backend.db_socket import DBSocket
+    from frontend.server import ApiServer, CatalogService
+
+    def load(pool):
+        fresh = Brain(interactive=False, autoload=False,
+                      dbs=DBSocket.reader(), apis=brain.apis)
+        fresh.fill_from_db(favorites=False)
+        return CatalogService(fresh, pool)
+
+    brain.fill_from_db(favorites=False)
+    service = CatalogService(brain)
+    server = ApiServer((args.host, args.port), service, args.verbose, load)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+    return {'host': args.host, 'port': server.server_port}
+
+
+def build_parser():
+    """Returns the parser of the command line."""
+
+    parser = argparse.ArgumentParser(
+        prog="app.py",
+        description="Finds healthier substitutes to food. Runs the "
+                    "interactive menu when no command is given.")
+    parser.add_argument("--query-stats", metavar="FILE",
+                        help="write the count and duration of every db "
+                             "query to FILE on exit")
+    parser.add_argument("--api-url", metavar="URL",
+                        help="send OpenFoodFacts requests to URL, such as "
+                             "a local stand-in server")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="write a cProfile file per Brain operation "
+                             "to DIR, like setting OFF_PROFILE")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, trace memory allocations "
+                             "as well")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser(
+        "ingest", help="reload the catalog from OpenFoodFacts")
+    command.add_argument("--restart", action="store_true",
+                         help="start over instead of resuming an "
+                              "unfinished update")
+    command.add_argument("--shadow", action="store_true",
+                         help="load into shadow tables swapped in once "
+                              "complete")
+    command.set_defaults(run=ingest)
+
+    command = commands.add_parser(
+        "substitutes", help="find the substitutes to a product")
+    command.add_argument("--product", required=True,
+                         help="id of the product, or text to search for")
+    command.add_argument("--store", type=int, action="append",
+                         help="id of a store substitutes must be found "
+                              "in, may be repeated")
+    command.add_argument("--limit", type=int, default=misc.PAGE_SIZE,
+                         help="maximum number of substitutes")
+    command.set_defaults(run=substitutes)
+
+    command = commands.add_parser(
+        "export", help="write the substitutes of every product to a file")
+    command.add_argument("--output", required=True, help="file to write")
+    command.add_argument("--format", choices=("jsonl", "csv"),
+                         default="jsonl")
+    command.add_argument("--processes", type=int,
+                         help="number of worker processes")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser(
+        "stats", help="count what the db holds")
+    command.set_defaults(run=stats)
+
+    command = commands.add_parser(
+        "memory", help="report the memory the catalog takes")
+    command.add_argument("--top", type=int, default=20,
+                         help="number of types to list, 0 for all")
+    command.set_defaults(run=memory)
+
+    command = commands.add_parser(
+        "serve", help="serve the catalog as an HTTP JSON API")
+    command.add_argument("--host", default=misc.SERVER_HOST)
+    command.add_argument("--port", type=int, default=misc.SERVER_PORT)
+    command.add_argument("--verbose", action="store_true",
+                         help="log every request")
+    command.set_defaults(run=serve)
+    return parser
+
+
+def main(argv):
+    """Runs a command and prints its result as JSON.
+
+    Args:
+        argv: list, The arguments of the command line.
+
+    Returns:
+        int: The exit status, 1 if the command failed.
+    """
+
+    args = build_parser().parse_args(argv)
+    if args.query_stats:
+        misc.QUERY_STATS_FILE = args.query_stats
+    if args.api_url:
+        api.API_URL = args.api_url
+    if args.profile:
+        profiler = ActionProfiler(args.profile, args.profile_memory)
+    else:
+        profiler = ActionProfiler.from_env()
+    if profiler is not None:
+        profiler.instrument(Brain)
+    start = time.perf_counter()
+    status = 0
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            brain = Brain(interactive=False, autoload=False)
+            result = args.run(brain, args)
+        except (LookupError, OSError, MySQLError) as error:
+            result = {'error': str(error)}
+            status = 1
+    result = {'command': args.command, **result,
+              'seconds': round(time.perf_counter() - start, 3)}
+    print(json.dumps(result, ensure_ascii=False))
+    return status
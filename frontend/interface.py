@@ -1,10 +1,37 @@
 """Contains class UserInterface."""
 import sys
-import os
 import colorama
 from colorama import Fore, Style
 from backend.brain import Brain
+from backend.warmup import CatalogWarmUp, PARTS
 from config import colorama_cfg as color
+from config import misc
+
+# Erases the screen and moves the cursor home, which is much faster than
+# spawning a shell to run cls or clear.
+CLEAR_SCREEN = "\033[2J\033[H"
+
+# The methods run by the choices of the main menu, profiled as actions.
+MENU_ACTIONS = ('browse_categories_v2', 'browse_saved_products_v2',
+                'update_db', 'delete_saved_substitutes', 'search_products',
+                'choose_my_stores')
+
+# The parts of the catalog each choice of the main menu needs loaded.
+NEEDED_PARTS = {
+    '0': ('catalog', 'index'),
+    '1': ('favorites',),
+    # The database is cleared then refilled, so loading must be over.
+    '2': PARTS,
+    '3': ('favorites',),
+    '4': ('search',),
+    '5': ('catalog',),
+}
+
+
+def clear_screen():
+    """Clears the terminal."""
+
+    print(CLEAR_SCREEN, end="", flush=True)
 
 
 class UserInterface:
@@ -25,37 +52,48 @@ class UserInterface:
             for additional information.
         Initializes colorama to handle colors inside the terminal.
 
+        The catalog is loaded in background so the menu shows at once.
+
         Attributes:
             brain: An instance of class brain.
+            warm_up: The CatalogWarmUp filling brain.
 
         """
-        os.system('cls||clear')
-        self.brain = Brain()
-        self.ask_user_input()
+        # Colorama translates escapes, clearing included, on Windows.
         colorama.init(autoreset=True)
+        clear_screen()
+        # The db status is printed without waiting for the user, so the
+        # menu shows and the catalog starts loading at once.
+        self.brain = Brain(interactive=False, autoload=False)
+        self.warm_up = CatalogWarmUp(self.brain)
+        self.warm_up.start()
+        self.ask_user_input()
 
     def ask_user_input(self):
         """Prints the main menu to the user and then asks them what they
         wish to do."""
 
         user_choice = 'N'
-        while user_choice != '4':
+        while user_choice != '6':
             self.print_main_menu()
             user_choice = input("What do you want to do? ")
             user_choice = user_choice.strip()
             self.process_main_menu(user_choice)
 
-    @staticmethod
-    def print_main_menu():
+    def print_main_menu(self):
         """Prints main menu detailing which action the user can do."""
 
-        os.system('cls||clear')
+        clear_screen()
         print(color.header_red.format("Main Menu"))
+        if not self.warm_up.is_ready() or self.warm_up.error is not None:
+            print(f"{Style.DIM}{self.warm_up.status()}{Style.RESET_ALL}")
         print("0: Find Substitutes")
         print("1: Browse saved substitutes ")
         print("2: Update the database")
         print("3: Delete all saved substitutes")
-        print("4: Exit program")
+        print("4: Search a product")
+        print("5: Choose my stores")
+        print("6: Exit program")
 
     def process_main_menu(self, user_choice):
         """Triggers the specific action the user chose to do.
@@ -65,9 +103,11 @@ class UserInterface:
                 wish to do.
         """
 
-        if user_choice not in ['0', '1', '2', '3', '4']:
+        if user_choice not in ['0', '1', '2', '3', '4', '5', '6']:
             print(f"{Fore.RED}{Style.BRIGHT}Invalid choice.\n"
                   f"Please, try again.{Style.RESET_ALL}")
+        if user_choice in NEEDED_PARTS:
+            self.wait_for(*NEEDED_PARTS[user_choice])
         if user_choice == '0':
             self.browse_categories_v2()
         if user_choice == '1':
@@ -77,8 +117,24 @@ class UserInterface:
         if user_choice == '3':
             self.delete_saved_substitutes()
         if user_choice == '4':
+            self.search_products()
+        if user_choice == '5':
+            self.choose_my_stores()
+        if user_choice == '6':
+            self.brain.prefetcher.close()
             sys.exit(0)
 
+    def wait_for(self, *parts):
+        """Waits for parts of the catalog, showing the progress.
+
+        Args:
+            *parts: str, The names of the parts, all of them if none.
+        """
+
+        while not self.warm_up.wait(*parts, timeout=0.2):
+            print(f"\r{Style.DIM}{self.warm_up.status()}{Style.RESET_ALL}",
+                  end="", flush=True)
+
     def update_db(self):
         """Interacts with the user regarding updating the database.
 
@@ -95,7 +151,7 @@ class UserInterface:
                             f"{Style.RESET_ALL} y/[n] ")
         user_choice = user_choice.strip().lower()
         if user_choice == "y":
-            os.system('cls||clear')
+            clear_screen()
             print(f"{color.plus_prfx}Updating database...")
             self.brain.update_db()
             input(f"{Style.DIM}Database updated."
@@ -140,7 +196,7 @@ class UserInterface:
 
         keep_running = True
         while keep_running:
-            os.system('cls||clear')
+            clear_screen()
             print(color.header_yellow.format("Find substitutes"))
             print("0 Go back")
             self.print_categories()
@@ -168,7 +224,7 @@ class UserInterface:
         page = 0
         keep_running = True
         while keep_running:
-            os.system('cls||clear')
+            clear_screen()
             if not category:
                 input("Nothing to display yet, press enter key...")
                 keep_running = False
@@ -184,6 +240,87 @@ class UserInterface:
             user_choice = user_choice.strip().lower()
             keep_running, page = self.process_input_navigation(
                 user_choice, category, page, keep_running)
+        # Pages around the last one shown are not needed anymore.
+        self.brain.prefetcher.cancel()
+
+    def search_products(self):
+        """Finds products by name or brand then browses substitutes.
+
+        Makes use of method search_products() from class Brain. Refer to
+            class SearchIndex for additional information on ranking.
+        """
+
+        keep_running = True
+        while keep_running:
+            clear_screen()
+            print(color.header_blue.format("Search a product"))
+            query = input("Type a product or brand name or [b]ack: ").strip()
+            if query.lower() in ['', 'b']:
+                keep_running = False
+                continue
+            results = self.brain.search_products(query)
+            if not results:
+                input(f"{Fore.RED}No product found.{Style.RESET_ALL}"
+                      f" Press enter key...")
+                continue
+            self.brain.print_products(results)
+            user_choice = input("Type product number or press enter to "
+                                "search again: ").strip()
+            if user_choice.isdecimal() \
+                    and len(results) >= int(user_choice) > 0:
+                product = results[int(user_choice) - 1]
+                clear_screen()
+                print("Chosen product:")
+                product.print_product()
+                input("Press enter to continue.")
+                self.print_substitutes(product)
+
+    def choose_my_stores(self):
+        """Lets the user choose the stores substitutes must be found in.
+
+        Substitutes are only looked for in these stores. No store
+            chosen means every store.
+        """
+
+        keep_running = True
+        while keep_running:
+            clear_screen()
+            print(color.header_magenta.format("My stores"))
+            for store in self.brain.stores_list:
+                if store.id in self.brain.my_stores:
+                    print(f"{color.plus_prfx}{store.name}")
+            if not self.brain.my_stores:
+                print(f"{Style.DIM}No store chosen, substitutes are looked "
+                      f"for in every store.{Style.RESET_ALL}")
+            text = input("Type part of a store name, [c]lear or [b]ack: ")
+            text = text.strip()
+            if text.lower() in ['', 'b']:
+                keep_running = False
+            elif text.lower() == 'c':
+                self.brain.my_stores.clear()
+            else:
+                self.toggle_stores(self.brain.find_stores(text))
+
+    def toggle_stores(self, stores):
+        """Adds or removes one of the listed stores from my stores.
+
+        Args:
+            stores: list, The stores matching the user search.
+        """
+
+        if not stores:
+            input(f"{Fore.RED}No store found.{Style.RESET_ALL}"
+                  f" Press enter key...")
+            return
+        stores = stores[:misc.PAGE_SIZE]
+        i = 1
+        for store in stores:
+            print(f"{i}: {store.name}")
+            i += 1
+        user_choice = input("Type store number to add or remove it: ")
+        user_choice = user_choice.strip()
+        if user_choice.isdecimal() and len(stores) >= int(user_choice) > 0:
+            self.brain.toggle_my_store(stores[int(user_choice) - 1])
 
     def process_input_navigation(
             self, user_choice, cat, page, keep_running):
@@ -205,7 +342,7 @@ class UserInterface:
             user_choice = int(user_choice)
             if len(cat.product_registry[page]) >= user_choice > 0:
                 keep_running = True
-                os.system('cls||clear')
+                clear_screen()
                 print("Chosen product:")
                 cat.product_registry[page][user_choice - 1].print_product()
                 input("Press enter to continue.")
@@ -260,13 +397,17 @@ class UserInterface:
         page = 0
         keep_running = True
         while keep_running:
-            os.system('cls||clear')
+            clear_screen()
             if not product:
                 input("Nothing to display yet, press enter key...")
                 keep_running = False
             else:
                 print(color.header_yellow.format(f"Substitutes to "
                                                  f"{product.french_name}"))
+                if self.brain.my_stores:
+                    print(f"{Style.DIM}Found in "
+                          f"{len(self.brain.my_stores)} of my stores"
+                          f"{Style.RESET_ALL}")
                 print(f"Page: {page}")
                 self.brain.fetch_brands_from_subst_page(page, product)
                 product.print_substitute_registry_page(page)
@@ -278,6 +419,7 @@ class UserInterface:
                                                             product,
                                                             page,
                                                             keep_running)
+        self.brain.prefetcher.cancel()
 
     def process_input_nav_sub(self, user_choice, product, page, keep_running):
         """Processes the user input regarding navigation in substitutes.
@@ -299,8 +441,7 @@ class UserInterface:
             if len(product.substitute_registry[page]) >= user_choice > 0:
                 keep_running = True
                 chosen = product.substitute_registry[page][user_choice - 1]
-                self.brain.fetch_stores_from_subst(chosen)
-                os.system('cls||clear')
+                clear_screen()
                 chosen.print_product()
                 self.save_product_v2(chosen, product)
             else:
@@ -342,7 +483,7 @@ class UserInterface:
         page = 0
         keep_running = True
         while keep_running:
-            os.system('cls||clear')
+            clear_screen()
             # check if there are saved products
             if not self.brain.subst_reg \
                     and not self.brain.saved_sub_buf:
@@ -407,7 +548,7 @@ class UserInterface:
             fav: The fovorite to process.
         """
 
-        os.system('cls||clear')
+        clear_screen()
         fav.print_product()
         if len(fav.substitute_to) > 1:
             self.del_mul_frm_fav(fav)
@@ -427,6 +568,7 @@ class UserInterface:
         user_choice = user_choice.strip().lower()
         if user_choice == "y":
             self.brain.del_all_in_fav(fav)
+            self.confirm_removed(fav)
         elif user_choice == "n":
             pass
         else:
@@ -449,13 +591,33 @@ class UserInterface:
             if user_choice < 0 or user_choice > len(fav.substitute_to):
                 input(f"{Fore.RED}Invalid, try again...{Style.RESET_ALL}")
             else:
-                self.brain.del_one_in_fav(fav, user_choice)
+                deld = self.brain.del_one_in_fav(fav, user_choice)
+                self.confirm_removed(fav, deld)
             self.delet_fav_v2(fav)
         if user_choice == 'a':
             self.brain.del_all_in_fav(fav)
+            self.confirm_removed(fav)
         if user_choice == 'b':
             pass
 
+    @staticmethod
+    def confirm_removed(fav, deld=None):
+        """Tells the user a favorite was removed and waits.
+
+        Args:
+            fav: The favorite removed.
+            deld: The product it no longer replaces, None if it was
+                removed from favorites altogether.
+        """
+
+        if deld is None:
+            input(f"{Fore.MAGENTA}Removed {fav.french_name} from favorites."
+                  f" {Style.RESET_ALL}Press enter to continue.")
+        else:
+            input(f"{Fore.MAGENTA}Removed {fav.french_name} as a substitute"
+                  f" to {deld.french_name}."
+                  f" {Style.RESET_ALL}Press enter to continue.")
+
     @staticmethod
     def get_input_as_int(message):
         """Converts user input into an integer for easier processing.
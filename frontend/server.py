@@ -0,0 +1,431 @@
+"""Contains the HTTP JSON API of the program.
+
+Routes:
+    GET /categories
+    GET /categories/<id>/products?page=<n>
+    GET /products/<id>
+    GET /products/<id>/substitutes?store=<id>&limit=<n>
+    GET /search?q=<text>&limit=<n>
+    GET /favorites
+    POST /favorites with {"substitute_id": <id>, "product_id": <id>}
+    DELETE /favorites/<substitute id>
+    GET /queries
+
+Every request thread reads the same catalog in memory, which is never
+    changed by requests. Favorites are read and written in the db
+    through a pool of connections.
+When a refresh swaps a new catalog in the db, see Brain.update_db(),
+    the server loads it in the background and replaces its catalog at
+    once. Until then favorites are not saved, since the ids of products
+    in memory name other products in the db.
+"""
+
+import functools
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from backend.db_pool import ConnectionPool
+from backend.db_socket import DBSocket
+from backend.nutrition_grade import to_letter, to_ordinal
+from frontend.cli import product_to_dict
+from config import misc
+
+
+class ApiError(Exception):
+    """An error sent back to the client.
+
+    Args:
+        status: int, The HTTP status of the response.
+        message: str, What went wrong.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def int_param(query, name, default, minimum=0):
+    """Reads an int from the query string.
+
+    Args:
+        query: dict, The parsed query string.
+        name: str, The name of the parameter.
+        default: int, The value if the parameter is missing.
+        minimum: int, The lowest value allowed.
+
+    Raises:
+        ApiError: The parameter is not an int, or is below the minimum.
+    """
+
+    try:
+        value = int(query[name][0]) if name in query else default
+    except ValueError as error:
+        raise ApiError(400, f"{name} must be an integer.") from error
+    if value < minimum:
+        raise ApiError(400, f"{name} must be at least {minimum}.")
+    return value
+
+
+class CatalogService:
+    """Answers the requests of the API.
+
+    The links of every product are grouped in memory once, so requests
+        never load relations or query the db for the catalog. Ranked
+        substitutes are kept for the most requested products.
+
+    Args:
+        brain: A Brain with the catalog loaded, favorites excepted.
+        pool: The ConnectionPool used for favorites.
+
+    Attributes:
+        links: dict, For brands and stores, the linked ids by product.
+        category_products: dict, The products of each category by id.
+        substitutes: callable, substitutes_body() behind an LRU cache.
+        stamp: dict, The catalog stamp of the db when loaded.
+        stale: bool, True once the db holds another catalog.
+    """
+
+    def __init__(self, brain, pool=None):
+        self.brain = brain
+        self.pool = pool or ConnectionPool()
+        self.stamp = self.catalog_stamp()
+        self.stale = False
+        self.links = {
+            'brands': brain.group_links(brain.source.get_brand_links(),
+                                        'brand_id'),
+            'stores': brain.group_links(brain.source.get_store_links(),
+                                        'store_id')}
+        self.category_products = {}
+        for category in brain.categories_list:
+            products = [product for page in category.product_registry
+                        for product in page]
+            if not category.buffer_added:
+                products += category.product_page_buffer
+            self.category_products[category.id] = products
+        # Searching must not sort the vocabulary from several threads.
+        brain.search_index.sort_vocabulary()
+        self.substitutes = functools.lru_cache(
+            maxsize=misc.SUBST_CACHE_SIZE)(self.substitutes_body)
+
+    def close(self):
+        """Closes the connections of the pool."""
+
+        self.pool.close()
+
+    def catalog_stamp(self):
+        """Returns the catalog part of the stamp of the db."""
+
+        with self.pool.connection() as socket:
+            return socket.get_stamp()['catalog']
+
+    def check_catalog(self):
+        """Tells whether the db holds another catalog than memory.
+
+        Returns:
+            bool: True if the service is stale.
+        """
+
+        if not self.stale and self.catalog_stamp() != self.stamp:
+            self.stale = True
+        return self.stale
+
+    def product(self, product_id):
+        """Returns a product of the catalog.
+
+        Raises:
+            ApiError: There is no such product.
+        """
+
+        product = self.brain.products.get(int(product_id))
+        if product is None:
+            raise ApiError(404, f"No product {product_id}.")
+        return product
+
+    def describe(self, product):
+        """Returns a product with its brands and stores as a dict."""
+
+        result = product_to_dict(product)
+        result['brands'] = [self.brain.brands_list[brand_id - 1].name
+                            for brand_id
+                            in self.links['brands'].get(product.id, [])]
+        result['stores'] = [self.brain.stores_list[store_id - 1].name
+                            for store_id
+                            in self.links['stores'].get(product.id, [])]
+        return result
+
+    def get_categories(self, query, data):
+        """Lists the categories and their number of products."""
+
+        return [{'id': category.id,
+                 'name': category.french_name,
+                 'url': category.url,
+                 'products': len(self.category_products[category.id])}
+                for category in self.brain.categories_list]
+
+    def get_category_products(self, category_id, query, data):
+        """Returns a page of the products of a category."""
+
+        products = self.category_products.get(int(category_id))
+        if products is None:
+            raise ApiError(404, f"No category {category_id}.")
+        page = int_param(query, 'page', 0)
+        start = page * misc.PAGE_SIZE
+        return {'category': int(category_id),
+                'page': page,
+                'pages': -(-len(products) // misc.PAGE_SIZE),
+                'products': [self.describe(product) for product
+                             in products[start:start + misc.PAGE_SIZE]]}
+
+    def get_product(self, product_id, query, data):
+        """Returns a product with its categories."""
+
+        product = self.product(product_id)
+        result = self.describe(product)
+        result['categories'] = [category.french_name
+                                for category in product.categories_list]
+        return result
+
+    def get_substitutes(self, product_id, query, data):
+        """Returns the best substitutes to a product.
+
+        Returns:
+            bytes: The encoded response, shared between requests.
+        """
+
+        product = self.product(product_id)
+        try:
+            store_ids = frozenset(int(store_id)
+                                  for store_id in query.get('store', []))
+        except ValueError as error:
+            raise ApiError(400, "store must be an integer.") from error
+        limit = int_param(query, 'limit', self.brain.ranker.top_k, 1)
+        return self.substitutes(product.id, store_ids, limit)
+
+    def substitutes_body(self, product_id, store_ids, limit):
+        """Ranks and encodes the substitutes to a product."""
+
+        product = self.brain.products[product_id]
+        ranked, _ = self.brain.rank_substitutes(product, store_ids,
+                                                self.links)
+        return json.dumps({
+            'product': self.describe(product),
+            'substitutes': [self.describe(subst)
+                            for subst in ranked[:limit]]},
+            ensure_ascii=False).encode("utf-8")
+
+    def get_search(self, query, data):
+        """Searches products by name or brand."""
+
+        text = query.get('q', [""])[0]
+        limit = int_param(query, 'limit', misc.PAGE_SIZE, 1)
+        return [self.describe(product)
+                for product in self.brain.search_index.search(text, limit)]
+
+    def get_favorites(self, query, data):
+        """Lists the favorites and the products they replace."""
+
+        with self.pool.connection() as socket:
+            rows = socket.get_saved_products()
+            replaced = {}
+            if rows:
+                for row in socket.get_prods_from_favs(
+                        [row['id'] for row in rows]):
+                    replaced.setdefault(row['favorite_id'], []).append(
+                        {'id': row['id'], 'french_name': row['french_name']})
+        return [{'id': row['original_id'],
+                 'french_name': row['french_name'],
+                 'url': row['url'],
+                 'nutrition_grades': to_letter(
+                     to_ordinal(row['nutrition_grades'])),
+                 'substitute_to': replaced.get(row['id'], [])}
+                for row in rows]
+
+    def post_favorites(self, query, data):
+        """Saves a substitute as replacing a product.
+
+        Raises:
+            ApiError: The catalog of the db changed and is being
+                reloaded.
+        """
+
+        if not isinstance(data, dict):
+            raise ApiError(400, "Expected a JSON object.")
+        try:
+            substitute = self.product(data['substitute_id'])
+            product = self.product(data['product_id'])
+        except (KeyError, TypeError, ValueError) as error:
+            raise ApiError(400, "substitute_id and product_id must be "
+                                "integers.") from error
+        saved = None
+        if not self.stale:
+            with self.pool.connection() as socket:
+                saved = socket.save_favorite(substitute, product)
+        if saved is None:
+            self.stale = True
+            raise ApiError(503, "The catalog is being reloaded, retry "
+                                "later.")
+        favorite_id, linked = saved
+        return {'favorite_id': favorite_id,
+                'substitute_id': substitute.id,
+                'product_id': product.id,
+                'created': linked}
+
+    def delete_favorites(self, original_id, query, data):
+        """Deletes a favorite."""
+
+        with self.pool.connection() as socket:
+            if not socket.delete_favorite(int(original_id)):
+                raise ApiError(404, f"No favorite {original_id}.")
+        return {'deleted': int(original_id)}
+
+    def get_queries(self, query, data):
+        """Returns the stats of the db queries run so far."""
+
+        return DBSocket.stats.report()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Routes a request to the CatalogService of the server."""
+
+    protocol_version = "HTTP/1.1"
+    routes = (
+        ('GET', re.compile(r"/categories"), 'get_categories'),
+        ('GET', re.compile(r"/categories/(\d+)/products"),
+         'get_category_products'),
+        ('GET', re.compile(r"/products/(\d+)"), 'get_product'),
+        ('GET', re.compile(r"/products/(\d+)/substitutes"),
+         'get_substitutes'),
+        ('GET', re.compile(r"/search"), 'get_search'),
+        ('GET', re.compile(r"/favorites"), 'get_favorites'),
+        ('POST', re.compile(r"/favorites"), 'post_favorites'),
+        ('DELETE', re.compile(r"/favorites/(\d+)"), 'delete_favorites'),
+        ('GET', re.compile(r"/queries"), 'get_queries'),
+    )
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        """Calls the service method matching the request.
+
+        Args:
+            method: str, The HTTP method of the request.
+        """
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        status = 200
+        self.server.check_catalog()
+        service = self.server.service
+        try:
+            data = self.read_body()
+            for verb, pattern, name in self.routes:
+                match = pattern.fullmatch(url.path.rstrip("/"))
+                if verb == method and match:
+                    result = getattr(service, name)(
+                        *match.groups(), query=query, data=data)
+                    break
+            else:
+                raise ApiError(404, f"No route {method} {url.path}.")
+        except ApiError as error:
+            status = error.status
+            result = {'error': str(error)}
+        except Exception as error:
+            self.log_error("%s %s failed: %r", method, self.path, error)
+            status = 500
+            result = {'error': "Internal error."}
+        if not isinstance(result, bytes):
+            result = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(result)))
+        self.end_headers()
+        self.wfile.write(result)
+
+    def read_body(self):
+        """Returns the JSON body of the request, None if it has none.
+
+        Raises:
+            ApiError: The body is not valid JSON.
+        """
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError as error:
+            raise ApiError(400, "Invalid JSON body.") from error
+
+    def log_request(self, code='-', size='-'):
+        # Logging every request to stderr costs more than serving it.
+        if self.server.verbose:
+            super().log_request(code, size)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Serves the API, one thread per connection.
+
+    The db is checked for a new catalog every CATALOG_CHECK_SECONDS, or
+        as soon as the service found it stale, in a thread of its own
+        so requests are not held. The service is then replaced by one
+        over the new catalog, which requests in progress do not see.
+
+    Args:
+        address: tuple, The host and port to listen on.
+        service: The CatalogService answering requests.
+        verbose: bool, True to log every request.
+        loader: callable, Returns a CatalogService over the catalog of
+            the db, given the pool to use. None to never reload.
+
+    Attributes:
+        checked: float, The monotonic time of the last check.
+        reloading: Lock, Held while the catalog is checked or reloaded.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, service, verbose=False, loader=None):
+        super().__init__(address, ApiHandler)
+        self.service = service
+        self.verbose = verbose
+        self.loader = loader
+        self.checked = time.monotonic()
+        self.reloading = threading.Lock()
+
+    def check_catalog(self):
+        """Starts a check for a new catalog if one is due."""
+
+        if self.loader is None:
+            return
+        due = time.monotonic() - self.checked >= misc.CATALOG_CHECK_SECONDS
+        if (due or self.service.stale) \
+                and self.reloading.acquire(blocking=False):
+            self.checked = time.monotonic()
+            threading.Thread(target=self.reload_catalog, name="catalog",
+                             daemon=True).start()
+
+    def reload_catalog(self):
+        """Replaces the service if the db holds another catalog."""
+
+        try:
+            service = self.service
+            if service.check_catalog():
+                self.service = self.loader(service.pool)
+                print("Reloaded the catalog.", file=sys.stderr)
+        except Exception as error:
+            print(f"Reloading the catalog failed: {error!r}",
+                  file=sys.stderr)
+        finally:
+            self.reloading.release()
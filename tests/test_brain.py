@@ -0,0 +1,123 @@
+"""Tests the refresh of the catalog by the class Brain."""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from backend.api_socket import APISocket
+from backend.brain import Brain
+from benchmarks.catalog_generator import SyntheticCatalog
+from benchmarks.memory_db import MemoryDBSocket
+from benchmarks.run import CatalogAPISocket
+from config import api_downloads as api
+from config import misc
+
+
+class BrainTestCase(unittest.TestCase):
+    """Runs Brains over a MemoryDBSocket, with snapshots in a temporary
+    directory and their output silenced."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch.object(misc, 'SNAPSHOT_FILE',
+                                  os.path.join(directory.name, "snapshot"))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.db = MemoryDBSocket()
+
+    @staticmethod
+    def apis(seed=0):
+        """Returns an APISocket serving a small catalog, with a page for
+        each category of CAT_ENDPOINT."""
+
+        return CatalogAPISocket(SyntheticCatalog(
+            len(api.CAT_ENDPOINT) * 50, seed=seed, page_size=50))
+
+    def update(self, apis, **kwargs):
+        """Refreshes the db with a new Brain, as the ingest command does.
+
+        Returns:
+            The Brain.
+        """
+
+        brain = Brain(interactive=False, autoload=False, dbs=self.db,
+                      apis=apis)
+        with contextlib.redirect_stdout(io.StringIO()):
+            brain.update_db(**kwargs)
+        return brain
+
+    def brand_names(self):
+        """Returns the names of the brands of each product in the db."""
+
+        names = {row['id']: row['name'] for row in self.db.tables['brands']}
+        linked = {}
+        for row in self.db.tables['product_brands']:
+            linked.setdefault(row['product_id'], set()).add(
+                names[row['brand_id']])
+        return linked
+
+
+class TestUpdateDb(BrainTestCase):
+
+    def test_second_refresh_links_its_own_brands_and_stores(self):
+        self.update(self.apis())
+        brain = self.update(self.apis(seed=1), restart=True)
+        expected = {product.id: {brand.name for brand in product.brands_list}
+                    for product in brain.products.values()}
+        self.assertEqual(self.brand_names(), expected)
+        stores = {row['id']: row['name'] for row in self.db.tables['stores']}
+        for store in brain.stores_list:
+            self.assertEqual(stores[store.id], store.name)
+        self.assertEqual(len(stores), len(brain.stores_list))
+
+
+class PageAPISocket(APISocket):
+    """An APISocket serving the same page of products for every category.
+
+    Args:
+        products: list, The products of the page.
+    """
+
+    def __init__(self, products):
+        super().__init__()
+        self.products = products
+
+    def download_products(self, category_url):
+        return [dict(product) for product in self.products], 0.0, 0
+
+
+class TestFillProducts(BrainTestCase):
+
+    @staticmethod
+    def product(code, brands):
+        return {'code': code, 'product_name_fr': "Nutella",
+                'brands': brands, 'stores': "Carrefour",
+                'nutrition_grades': "e",
+                'url': f"https://fr.openfoodfacts.org/produit/{code}"}
+
+    def test_brand_spellings_link_a_product_to_its_category_once(self):
+        brain = self.update(PageAPISocket([
+            self.product("1", "Ferrero"), self.product("2", "FERRERO")]))
+        self.assertEqual(len(brain.products), 1)
+        product = next(iter(brain.products.values()))
+        self.assertEqual(len(product.categories_list),
+                         len(brain.categories_list))
+        self.assertEqual(len(set(product.categories_list)),
+                         len(product.categories_list))
+        links = [(row['category_id'], row['product_id'])
+                 for row in self.db.tables['category_products']]
+        self.assertEqual(len(links), len(set(links)))
+        self.assertEqual(len(links), len(brain.categories_list))
+
+    def test_brand_variants_of_linked_products_are_not_merges(self):
+        brain = self.update(PageAPISocket([
+            self.product("1", "Ferrero"), self.product("2", "Ferrerro")]))
+        self.assertEqual(len(brain.products), 1)
+        self.assertEqual(brain.merge_report()['brands'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
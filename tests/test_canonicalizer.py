@@ -0,0 +1,32 @@
+"""Tests the merge of near-duplicate names by the class Canonicalizer."""
+
+import unittest
+from backend.brand import Brand
+from backend.canonicalizer import Canonicalizer
+
+
+class TestCanonicalizer(unittest.TestCase):
+
+    def setUp(self):
+        self.names = Canonicalizer()
+        self.ferrero = Brand({'id': 1, 'name': "ferrero", 'url': ""})
+        self.names.add(self.ferrero)
+
+    def test_lookup_records_nothing(self):
+        self.assertIs(self.names.lookup("Ferrerro"), self.ferrero)
+        self.assertIsNone(self.names.lookup("Lindt"))
+        self.assertEqual(self.names.report(), {})
+        self.assertNotIn("ferrerro", self.names.entities)
+
+    def test_find_records_the_merge(self):
+        self.assertIs(self.names.find("Ferrerro"), self.ferrero)
+        self.assertEqual(self.names.report(), {'ferrero': ["Ferrerro"]})
+        self.assertIs(self.names.entities["ferrerro"], self.ferrero)
+
+    def test_same_key_is_found_without_fuzzy_match(self):
+        self.assertIs(self.names.find("FERRERO"), self.ferrero)
+        self.assertIsNone(self.names.find("fer"))
+
+
+if __name__ == '__main__':
+    unittest.main()
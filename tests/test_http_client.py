@@ -0,0 +1,181 @@
+"""Tests the rate limiter and the retries of requests to OpenFoodFacts,
+on a fake clock."""
+
+import unittest
+from unittest import mock
+import requests
+from backend.http_client import HttpClient
+from backend.rate_limiter import AdaptiveRateLimiter
+
+
+class FakeClock:
+    """Stands in for the time module, sleeping by moving its time on."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def response(status, headers=None):
+    """Returns a requests Response with a status and headers."""
+
+    result = requests.Response()
+    result.status_code = status
+    result.headers.update(headers or {})
+    result.url = "http://off/test"
+    return result
+
+
+class FakeSession:
+    """Answers requests with the given outcomes, in order.
+
+    Args:
+        outcomes: list, Responses to return or exceptions to raise.
+    """
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    def get(self, url, timeout):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class ClockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for module in ('backend.rate_limiter.time',
+                       'backend.http_client.time'):
+            patch = mock.patch(module, self.clock)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class TestAdaptiveRateLimiter(ClockTestCase):
+
+    def limiter(self, **kwargs):
+        settings = dict(rate=2.0, min_rate=0.5, max_rate=4.0, increase=1.0,
+                        decrease=0.5)
+        settings.update(kwargs)
+        return AdaptiveRateLimiter(**settings)
+
+    def test_requests_are_spaced_at_the_rate(self):
+        limiter = self.limiter()
+        waits = [limiter.acquire() for _ in range(4)]
+        self.assertEqual(waits[0], 0)
+        for wait in waits[1:]:
+            self.assertAlmostEqual(wait, 0.5)
+
+    def test_bursts_up_to_one_second_of_requests(self):
+        limiter = self.limiter()
+        limiter.acquire()
+        self.clock.now += 10
+        self.assertEqual([limiter.acquire() for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(limiter.acquire(), 0.5)
+
+    def test_rate_grows_and_shrinks_within_bounds(self):
+        limiter = self.limiter()
+        for _ in range(5):
+            limiter.succeed()
+        self.assertEqual(limiter.rate, 4.0)
+        limiter.throttle()
+        self.assertEqual(limiter.rate, 2.0)
+        for _ in range(5):
+            limiter.throttle()
+        self.assertEqual(limiter.rate, 0.5)
+
+    def test_retry_after_holds_every_request(self):
+        limiter = self.limiter()
+        limiter.throttle(retry_after=30)
+        self.assertGreaterEqual(limiter.acquire(), 30)
+
+
+class TestHttpClient(ClockTestCase):
+
+    def client(self, outcomes, retries=3):
+        reasons = []
+        limiter = AdaptiveRateLimiter(rate=1000.0, max_rate=1000.0)
+        client = HttpClient(limiter, timeout=1.0, retries=retries,
+                            backoff=1.0, backoff_max=8.0,
+                            on_retry=reasons.append)
+        # A connection error drops the session, the fake one is kept.
+        session = FakeSession(outcomes)
+        client.session = lambda: session
+        return client, reasons
+
+    def test_success_is_not_retried(self):
+        client, reasons = self.client([response(200)])
+        self.assertEqual(client.get("http://off").status_code, 200)
+        self.assertEqual(reasons, [])
+
+    def test_retries_timeouts_errors_and_overload(self):
+        client, reasons = self.client([requests.Timeout(),
+                                       requests.ConnectionError(),
+                                       response(503), response(200)])
+        with mock.patch('backend.http_client.random.uniform',
+                        lambda low, high: high):
+            self.assertEqual(client.get("http://off").status_code, 200)
+        self.assertEqual(reasons, ['timeout', 'connection', '503'])
+        backoffs = [seconds for seconds in self.clock.slept
+                    if seconds in (1.0, 2.0, 4.0)]
+        self.assertEqual(backoffs, [1.0, 2.0, 4.0])
+
+    def test_backoff_is_jittered_and_capped(self):
+        client, _ = self.client([])
+        with mock.patch('backend.http_client.random.uniform',
+                        lambda low, high: (low, high)):
+            self.assertEqual(client.delay(1), (0, 1.0))
+            self.assertEqual(client.delay(3), (0, 4.0))
+            self.assertEqual(client.delay(10), (0, 8.0))
+
+    def test_gives_up_after_the_retries(self):
+        client, reasons = self.client([requests.Timeout()] * 3, retries=2)
+        with self.assertRaises(requests.Timeout):
+            client.get("http://off")
+        self.assertEqual(reasons, ['timeout', 'timeout'])
+
+    def test_last_error_status_is_raised(self):
+        client, _ = self.client([response(429), response(429)], retries=1)
+        with self.assertRaises(requests.HTTPError):
+            client.get("http://off")
+
+    def test_client_errors_are_not_retried(self):
+        client, reasons = self.client([response(404)])
+        with self.assertRaises(requests.HTTPError):
+            client.get("http://off")
+        self.assertEqual(reasons, [])
+
+    def test_retry_after_is_read_in_seconds_or_as_a_date(self):
+        self.assertEqual(HttpClient.retry_after(
+            response(503, {"Retry-After": "7"})), 7.0)
+        self.assertIsNone(HttpClient.retry_after(response(503)))
+        self.clock.now = 0.0
+        self.assertEqual(HttpClient.retry_after(response(
+            503, {"Retry-After": "Thu, 01 Jan 1970 00:01:00 GMT"})), 60.0)
+
+    def test_overload_slows_the_limiter_down(self):
+        client, _ = self.client([response(503, {"Retry-After": "5"}),
+                                 response(200)])
+        rate = client.limiter.rate
+        with mock.patch('backend.http_client.random.uniform',
+                        lambda low, high: low):
+            client.get("http://off")
+        self.assertLess(client.limiter.rate, rate)
+        self.assertAlmostEqual(sum(self.clock.slept), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
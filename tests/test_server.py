@@ -0,0 +1,80 @@
+"""Tests the reload of the catalog by the HTTP JSON API."""
+
+from backend.brain import Brain
+from backend.db_pool import ConnectionPool
+from frontend.server import ApiError, ApiServer, CatalogService, int_param
+from tests.test_brain import BrainTestCase
+
+
+class ServiceTestCase(BrainTestCase):
+    """Serves a small catalog from a MemoryDBSocket."""
+
+    def setUp(self):
+        super().setUp()
+        self.update(self.apis())
+        self.pool = ConnectionPool(factory=lambda: self.db)
+        self.service = self.load(self.pool)
+
+    def load(self, pool):
+        brain = Brain(interactive=False, autoload=False, dbs=self.db,
+                      apis=self.apis())
+        brain.reload_catalog()
+        return CatalogService(brain, pool)
+
+    def favorite(self, service):
+        substitute, product = list(service.brain.products)[:2]
+        return {'substitute_id': substitute, 'product_id': product}
+
+
+class TestCatalogReload(ServiceTestCase):
+
+    def test_service_is_stale_once_a_new_catalog_is_swapped_in(self):
+        self.assertFalse(self.service.check_catalog())
+        self.update(self.apis(seed=1), shadow=True)
+        self.assertTrue(self.service.check_catalog())
+        with self.assertRaises(ApiError) as raised:
+            self.service.post_favorites({}, self.favorite(self.service))
+        self.assertEqual(raised.exception.status, 503)
+
+    def test_server_replaces_a_stale_service(self):
+        server = ApiServer(("127.0.0.1", 0), self.service, loader=self.load)
+        self.addCleanup(server.server_close)
+        server.reloading.acquire()
+        server.reload_catalog()
+        self.assertIs(server.service, self.service)
+        self.update(self.apis(seed=1), shadow=True)
+        server.reloading.acquire()
+        server.reload_catalog()
+        self.assertIsNot(server.service, self.service)
+        self.assertFalse(server.service.check_catalog())
+        self.assertIs(server.service.pool, self.pool)
+        self.assertFalse(server.reloading.locked())
+
+
+class TestQueryParameters(ServiceTestCase):
+
+    def assertRejected(self, method, *args, query):
+        with self.assertRaises(ApiError) as raised:
+            method(*args, query=query, data=None)
+        self.assertEqual(raised.exception.status, 400)
+
+    def test_int_param(self):
+        self.assertEqual(int_param({}, 'page', 0), 0)
+        self.assertEqual(int_param({'page': ["3"]}, 'page', 0), 3)
+        for value in ("-1", "x"):
+            with self.assertRaises(ApiError):
+                int_param({'page': [value]}, 'page', 0)
+
+    def test_negative_page_and_limits_are_rejected(self):
+        service = self.service
+        category_id = service.brain.categories_list[0].id
+        product_id = next(iter(service.brain.products))
+        self.assertRejected(service.get_category_products, category_id,
+                            query={'page': ["-1"]})
+        for limit in ("-2", "0"):
+            self.assertRejected(service.get_substitutes, product_id,
+                                query={'limit': [limit]})
+            self.assertRejected(service.get_search,
+                                query={'q': ["a"], 'limit': [limit]})
+        self.assertEqual(service.get_category_products(
+            category_id, query={'page': ["0"]}, data=None)['page'], 0)
@@ -0,0 +1,36 @@
+"""Tests the binary snapshot of the catalog and its stamp."""
+
+from backend.brain import Brain
+from backend.snapshot import CatalogSnapshot, LAYOUT
+from config import misc
+from tests.test_brain import BrainTestCase
+
+
+class TestCatalogSnapshot(BrainTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.brain = self.update(self.apis())
+
+    def test_snapshot_reads_back_the_rows_of_the_db(self):
+        snapshot = CatalogSnapshot.load(misc.SNAPSHOT_FILE)
+        self.assertEqual(snapshot.stamp, self.db.get_stamp())
+        for table in LAYOUT:
+            self.assertEqual(snapshot.rows(table),
+                             self.db.dump_tables(table)[table])
+
+    def test_stamp_changes_when_a_grade_is_edited(self):
+        self.assertIsNotNone(self.brain.open_snapshot())
+        stamp = self.db.get_stamp()
+        product = self.db.tables['products'][0]
+        grade = product['nutrition_grades'] or 0
+        product['nutrition_grades'] = (grade + 1) % 5
+        self.assertNotEqual(self.db.get_stamp()['catalog'], stamp['catalog'])
+        self.assertIsNone(self.brain.open_snapshot())
+
+    def test_stamp_changes_when_a_url_is_edited(self):
+        stamp = self.db.get_stamp()
+        self.db.tables['products'][0]['url'] += "?edited"
+        self.assertNotEqual(self.db.get_stamp()['catalog'], stamp['catalog'])
+        brain = Brain(interactive=False, autoload=False, dbs=self.db)
+        self.assertIsNone(brain.open_snapshot())
@@ -0,0 +1,154 @@
+"""Tests the shortlist of the category index and the ranker against a
+plain scan of the catalog."""
+
+import random
+import unittest
+from backend.category_index import CategoryIndex
+from backend.product import Product
+from backend.ranking import SubstituteRanker
+
+
+def catalog(size=300, categories=6, stores=4, seed=0):
+    """Returns random products with their category and store ids.
+
+    Some products share their name, and a few have no grade.
+    """
+
+    pick = random.Random(seed)
+    products = []
+    for product_id in range(1, size + 1):
+        grade = pick.choice("abcde") if pick.random() > 0.05 else None
+        product = Product({'id': product_id,
+                           'french_name': f"product {pick.randrange(size)}",
+                           'url': f"url {product_id}",
+                           'nutrition_grades': grade})
+        product.category_ids = set(pick.sample(range(1, categories + 1),
+                                               pick.randint(1, 3)))
+        product.store_ids = set(pick.sample(range(1, stores + 1),
+                                            pick.randint(0, 2)))
+        products.append(product)
+    return products
+
+
+def index_of(products):
+    index = CategoryIndex()
+    for product in products:
+        index.add(product, product.category_ids)
+        for store_id in product.store_ids:
+            index.add_store(product.id, store_id)
+    return index
+
+
+def scan(product, products, store_ids=()):
+    """Returns the candidates to replace a product, as the db query did:
+    products of its categories, with a grade at least as good, another
+    name and, if stores are given, found in one of them."""
+
+    return [candidate for candidate in products
+            if candidate.category_ids & product.category_ids
+            and candidate.nutrition_grades is not None
+            and candidate.nutrition_grades <= product.nutrition_grades
+            and candidate.french_name != product.french_name
+            and (not store_ids or candidate.store_ids & set(store_ids))]
+
+
+class TestCategoryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.products = catalog()
+        self.index = index_of(self.products)
+        self.graded = [product for product in self.products
+                       if product.nutrition_grades is not None]
+
+    def test_candidates_are_the_ones_of_a_scan(self):
+        for product in self.graded:
+            found = self.index.candidates(product, len(self.products))
+            self.assertCountEqual(found, scan(product, self.products))
+
+    def test_candidates_share_most_categories_then_have_best_grades(self):
+        for product in self.graded:
+            found = self.index.candidates(product, len(self.products))
+            keys = [(-len(candidate.category_ids & product.category_ids),
+                     candidate.nutrition_grades) for candidate in found]
+            self.assertEqual(keys, sorted(keys))
+
+    def test_limit_keeps_the_best_candidates(self):
+        for product in self.graded:
+            found = self.index.candidates(product, len(self.products))
+            self.assertEqual(self.index.candidates(product, 5), found[:5])
+
+    def test_candidates_are_found_in_the_stores(self):
+        for store_ids in ({1}, {2, 4}):
+            for product in self.graded:
+                found = self.index.candidates(product, len(self.products),
+                                              store_ids)
+                self.assertCountEqual(
+                    found, scan(product, self.products, store_ids))
+
+    def test_product_without_grade_has_no_candidates(self):
+        for product in self.products:
+            if product.nutrition_grades is None:
+                self.assertEqual(self.index.candidates(product, 10), [])
+
+
+class TestSubstituteRanker(unittest.TestCase):
+
+    def setUp(self):
+        self.products = catalog()
+        self.links = {
+            'categories': {product.id: sorted(product.category_ids)
+                           for product in self.products},
+            'stores': {product.id: sorted(product.store_ids)
+                       for product in self.products}}
+
+    @staticmethod
+    def score(ranker, product, candidate):
+        """Scores a candidate the long way, criterion by criterion."""
+
+        total = ranker.weights['grade'] * ranker.grade_gain(
+            product.nutrition_grades, candidate.nutrition_grades)
+        for criterion, ids, candidate_ids in (
+                ('categories', product.category_ids,
+                 candidate.category_ids),
+                ('stores', product.store_ids, candidate.store_ids)):
+            if ids:
+                total += (ranker.weights[criterion]
+                          * len(ids & candidate_ids) / len(ids))
+        return total
+
+    def test_rank_keeps_the_top_k_best_scores(self):
+        ranker = SubstituteRanker(top_k=5)
+        for product in self.products[:50]:
+            if product.nutrition_grades is None:
+                continue
+            candidates = scan(product, self.products)
+            ranked = ranker.rank(product, candidates, self.links)
+            scores = [self.score(ranker, product, candidate)
+                      for candidate in ranked]
+            self.assertEqual(len(ranked), min(5, len(candidates)))
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            best = sorted((self.score(ranker, product, candidate)
+                           for candidate in candidates), reverse=True)
+            self.assertEqual(scores, best[:5])
+
+    def test_better_grade_ranks_first_all_else_equal(self):
+        ranker = SubstituteRanker(top_k=5)
+        product = Product({'id': 1, 'french_name': "a", 'url': "",
+                           'nutrition_grades': "e"})
+        candidates = [Product({'id': i, 'french_name': f"c{i}", 'url': "",
+                               'nutrition_grades': grade})
+                      for i, grade in enumerate("dbeca", start=2)]
+        links = {'categories': {candidate.id: [1] for candidate
+                                in [product] + candidates}}
+        ranked = ranker.rank(product, candidates, links)
+        self.assertEqual([candidate.nutriscore for candidate in ranked],
+                         list("abcde"))
+
+    def test_grade_gain(self):
+        self.assertEqual(SubstituteRanker.grade_gain(4, 0), 1)
+        self.assertEqual(SubstituteRanker.grade_gain(2, 3), 0)
+        self.assertEqual(SubstituteRanker.grade_gain(None, 0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()